@@ -0,0 +1,98 @@
+import datetime
+
+# --- Alertas de existencia baja ---
+# Un producto está bajo su punto de reorden si cantidad < punto_reorden; el
+# punto es el propio del producto o, si no tiene (NULL), el de su departamento
+# en umbrales_departamento. Un punto propio de 0 apaga la alerta del producto.
+#
+# Cada mitad de SQL_BAJO_REORDEN se resuelve con un índice parcial (migración
+# 12) que solo tiene filas candidatas: contar cuesta según cuántos productos
+# están bajos, no según el tamaño del catálogo. RevisorExistencias además se
+# salta el recuento si nada cambió desde la revisión anterior.
+
+INTERVALO_MS = 5000
+LIMITE_LISTA = 1000
+
+SQL_BAJO_REORDEN = """
+    SELECT p.id, p.nombre, p.departamento, p.almacen, p.cantidad, p.punto_reorden AS punto
+    FROM productos p
+    WHERE p.cantidad < p.punto_reorden
+    UNION ALL
+    SELECT p.id, p.nombre, p.departamento, p.almacen, p.cantidad, u.punto_reorden AS punto
+    FROM umbrales_departamento u CROSS JOIN productos p
+    WHERE p.departamento = u.departamento AND p.punto_reorden IS NULL AND p.cantidad < u.punto_reorden
+"""
+SQL_CONTAR_BAJO_REORDEN = f"SELECT COUNT(*) FROM ({SQL_BAJO_REORDEN})"
+SQL_LISTA_BAJO_REORDEN = f"""
+    SELECT b.id, b.nombre, b.departamento, IFNULL(a.nombre, ''), b.cantidad, b.punto
+    FROM ({SQL_BAJO_REORDEN}) b
+    LEFT JOIN almacenes a ON a.id = b.almacen
+    ORDER BY b.punto - b.cantidad DESC, b.id
+    LIMIT ?
+"""
+# Toda escritura en productos deja una fila en historial_cambios (triggers);
+# los umbrales de departamento son pocos y se leen completos.
+SQL_FIRMA_EXISTENCIAS = """
+    SELECT (SELECT IFNULL(MAX(id), 0) FROM historial_cambios),
+           (SELECT group_concat(departamento || '=' || punto_reorden, ';') FROM umbrales_departamento)
+"""
+
+
+def contar_bajo_reorden(conn):
+    return conn.execute(SQL_CONTAR_BAJO_REORDEN).fetchone()[0]
+
+
+def productos_bajo_reorden(conn, limite=LIMITE_LISTA):
+    """[(id, nombre, departamento, almacén, cantidad, punto de reorden)], los más faltantes primero."""
+    return conn.execute(SQL_LISTA_BAJO_REORDEN, (limite,)).fetchall()
+
+
+def umbrales_departamento(conn):
+    return conn.execute("SELECT departamento, punto_reorden FROM umbrales_departamento ORDER BY departamento").fetchall()
+
+
+def fijar_umbral_departamento(conn, departamento, punto, usuario):
+    """Punto de reorden de un departamento; punto None lo quita. Lanza ValueError. Hace commit."""
+    departamento = str(departamento or "").strip()
+    if not departamento:
+        raise ValueError("Falta el departamento")
+    if punto is None:
+        conn.execute("DELETE FROM umbrales_departamento WHERE departamento = ?", (departamento,))
+    else:
+        try:
+            punto = int(punto)
+        except (TypeError, ValueError):
+            raise ValueError("El punto de reorden debe ser un número entero")
+        if punto < 0:
+            raise ValueError("El punto de reorden no puede ser negativo")
+        conn.execute("""
+            INSERT INTO umbrales_departamento (departamento, punto_reorden, usuario, fecha) VALUES (?, ?, ?, ?)
+            ON CONFLICT (departamento) DO UPDATE SET
+                punto_reorden = excluded.punto_reorden, usuario = excluded.usuario, fecha = excluded.fecha
+        """, (departamento, punto, usuario, datetime.datetime.now().isoformat()))
+    conn.commit()
+
+
+class RevisorExistencias:
+    """
+    Cuenta los productos bajo su punto de reorden solo cuando cambió algo
+    (la firma: último id del historial y los umbrales de departamento).
+    Se usa desde un solo hilo a la vez, igual que DetectorCambios.
+    """
+
+    def __init__(self):
+        self.firma = None
+        self.total = None
+        self.revisiones = 0
+        self.recuentos = 0
+
+    def revisar(self, conn):
+        """Devuelve el total si se volvió a contar, o None si nada cambió."""
+        self.revisiones += 1
+        firma = conn.execute(SQL_FIRMA_EXISTENCIAS).fetchone()
+        if firma == self.firma:
+            return None
+        self.total = contar_bajo_reorden(conn)
+        self.firma = firma
+        self.recuentos += 1
+        return self.total
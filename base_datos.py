@@ -0,0 +1,229 @@
+import sqlite3
+import threading
+import queue
+import time
+import random
+from contextlib import contextmanager
+
+from trazas import ConexionInstrumentada
+
+# --- PRAGMAs que se aplican UNA sola vez al abrir cada conexión ---
+# WAL: los lectores no bloquean al escritor ni al revés, y cada commit es una
+# escritura secuencial al final del -wal. OJO: WAL usa memoria compartida, así
+# que todos los procesos deben estar en la misma máquina que el archivo; para
+# abrir la base desde una carpeta de red cambiar MODO_DIARIO a "DELETE".
+MODO_DIARIO = "WAL"
+
+PRAGMAS_CONEXION = (
+    f"PRAGMA journal_mode = {MODO_DIARIO}",
+    "PRAGMA synchronous = NORMAL",  # En WAL solo se pierde durabilidad ante un corte de luz, nunca integridad
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",   # Esperar (ms) en lugar de fallar si otro proceso tiene el candado
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",    # ~8 MB de caché de páginas por conexión
+)
+
+# --- Reintentos cuando la base está ocupada ---
+# busy_timeout cubre casi todo, pero SQLite devuelve SQLITE_BUSY sin esperar
+# cuando una transacción que empezó leyendo intenta escribir y otro proceso ya
+# hizo commit (en WAL), o cuando el tiempo de espera se agota. En esos casos
+# solo queda revertir y repetir la transacción completa.
+REINTENTOS_OCUPADA = 3
+
+
+def es_bd_ocupada(error):
+    """True si el error es SQLITE_BUSY / SQLITE_LOCKED ("database is locked")."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    codigo = getattr(error, "sqlite_errorcode", None)   # Python 3.11+
+    if codigo is not None:
+        return codigo & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def reintentar_si_ocupada(conn, funcion, intentos=REINTENTOS_OCUPADA, espera_inicial=0.05, espera_maxima=2.0):
+    """
+    Llama funcion() y, si falla porque la base está ocupada, revierte la
+    transacción y vuelve a intentar con espera exponencial. La espera lleva
+    algo de azar para que varios procesos no reintenten al mismo tiempo.
+    'funcion' debe hacer su propio commit (se repite completa).
+    """
+    for intento in range(intentos + 1):
+        try:
+            return funcion()
+        except sqlite3.OperationalError as e:
+            if not es_bd_ocupada(e) or intento == intentos:
+                raise
+            if conn.in_transaction:
+                conn.rollback()
+            espera = min(espera_maxima, espera_inicial * 2 ** intento)
+            time.sleep(espera * random.uniform(0.5, 1.0))
+
+
+class PoolConexiones:
+    """
+    Mantiene un grupo pequeño de conexiones SQLite de larga duración.
+    Las páginas piden prestada una conexión con 'conexion()' y la devuelven
+    al terminar, en lugar de abrir y cerrar el archivo en cada operación.
+    """
+
+    def __init__(self, db_name, max_conexiones=4, timeout_espera=10, registro=None):
+        self.db_name = db_name
+        self.max_conexiones = max_conexiones
+        self.timeout_espera = timeout_espera
+        self.registro = registro   # RegistroConsultas: si se da, cada sentencia se mide
+
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._todas = []
+        self._cerrado = False
+
+        # Contadores para confirmar que la reutilización está ocurriendo
+        self.abiertas = 0
+        self.reutilizadas = 0
+
+    def _abrir(self):
+        """Abre una conexión nueva y le aplica los PRAGMAs."""
+        # check_same_thread=False: el pool garantiza que solo un hilo la usa a la vez
+        if self.registro is not None:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, factory=ConexionInstrumentada)
+            conn.registro = self.registro
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        for pragma in PRAGMAS_CONEXION:
+            conn.execute(pragma)
+        return conn
+
+    def obtener(self):
+        """Presta una conexión: reutiliza una libre o abre una nueva si hay cupo."""
+        if self._cerrado:
+            raise sqlite3.ProgrammingError("El pool de conexiones está cerrado")
+
+        try:
+            conn = self._libres.get_nowait()
+            with self._lock:
+                self.reutilizadas += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            hay_cupo = len(self._todas) < self.max_conexiones
+            if hay_cupo:
+                # Reservamos el lugar antes de abrir para no pasarnos del máximo
+                self._todas.append(None)
+
+        if hay_cupo:
+            try:
+                conn = self._abrir()
+            except sqlite3.Error:
+                with self._lock:
+                    self._todas.remove(None)
+                raise
+            with self._lock:
+                self._todas[self._todas.index(None)] = conn
+                self.abiertas += 1
+            return conn
+
+        # Todas las conexiones están prestadas: esperamos a que se libere una
+        try:
+            conn = self._libres.get(timeout=self.timeout_espera)
+        except queue.Empty:
+            raise sqlite3.OperationalError("No hay conexiones disponibles en el pool")
+        with self._lock:
+            self.reutilizadas += 1
+        return conn
+
+    def devolver(self, conn):
+        """Regresa una conexión al pool, descartando cualquier transacción sin confirmar."""
+        if conn.in_transaction:
+            # Mismo efecto que tenía conn.close() sin commit
+            conn.rollback()
+        if self._cerrado:
+            conn.close()
+            return
+        self._libres.put(conn)
+
+    @contextmanager
+    def conexion(self):
+        """
+        Uso:
+            with pool.conexion() as conn:
+                cursor = conn.cursor()
+                ...
+        """
+        conn = self.obtener()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def estadisticas(self):
+        """Devuelve cuántas conexiones se abrieron, reutilizaron y están en uso."""
+        with self._lock:
+            total = len(self._todas)
+            return {
+                "abiertas": self.abiertas,
+                "reutilizadas": self.reutilizadas,
+                "libres": self._libres.qsize(),
+                "en_uso": total - self._libres.qsize(),
+            }
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres; las prestadas se cierran al devolverse."""
+        self._cerrado = True
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+class CacheAlmacenes:
+    """
+    Mapas nombre -> id e id -> nombre de los almacenes, compartidos por todas
+    las páginas. Se cargan una sola vez y se invalidan solo cuando
+    FormularioEdicionAlmacen guarda, actualiza o elimina un almacén.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._por_nombre = None
+        self._por_id = None
+        self._nombres = None
+        self.cargas = 0   # Cuántas veces se consultó la tabla (para confirmar que sí se cachea)
+
+    def _asegurar_cargado(self, conn=None):
+        with self._lock:
+            if self._por_id is not None:
+                return
+            if conn is None:
+                with self.pool.conexion() as propia:
+                    filas = propia.execute("SELECT id, nombre FROM almacenes ORDER BY nombre").fetchall()
+            else:
+                filas = conn.execute("SELECT id, nombre FROM almacenes ORDER BY nombre").fetchall()
+            self._nombres = [nombre for _, nombre in filas]
+            self._por_nombre = {nombre: id_ for id_, nombre in filas}
+            self._por_id = {id_: nombre for id_, nombre in filas}
+            self.cargas += 1
+
+    def nombres(self, conn=None):
+        """Nombres ordenados alfabéticamente (para el Combobox)."""
+        self._asegurar_cargado(conn)
+        return list(self._nombres)
+
+    def id_de(self, nombre, conn=None):
+        self._asegurar_cargado(conn)
+        return self._por_nombre.get(nombre)
+
+    def nombre_de(self, almacen_id, conn=None):
+        self._asegurar_cargado(conn)
+        return self._por_id.get(almacen_id)
+
+    def invalidar(self):
+        with self._lock:
+            self._por_nombre = None
+            self._por_id = None
+            self._nombres = None
@@ -0,0 +1,3 @@
+from benchmarks.ejecutar import main
+
+main()
@@ -0,0 +1,188 @@
+import sqlite3
+import os
+import sys
+import json
+import time
+import random
+import platform
+import datetime
+import tempfile
+import argparse
+import contextlib
+
+from consultas import indice_fts_disponible
+from base_datos import PRAGMAS_CONEXION
+from benchmarks.generador import generar_bd
+from benchmarks.escenarios import ESCENARIOS
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, min(len(valores_ordenados) - 1, round(p / 100 * len(valores_ordenados) + 0.5) - 1))
+    return valores_ordenados[indice]
+
+
+def _contexto(conn):
+    """Datos de la base que los escenarios necesitan para elegir ids y nombres reales."""
+    id_min, id_max = conn.execute("SELECT MIN(id), MAX(id) FROM productos").fetchone()
+    almacenes = conn.execute("SELECT id, nombre FROM almacenes").fetchall()
+    return {
+        "id_min": id_min or 0,
+        "id_max": id_max or 0,
+        "almacen_ids": [a[0] for a in almacenes],
+        "almacenes": [a[1] for a in almacenes],
+        "fts": indice_fts_disponible(conn),
+    }
+
+
+def medir_escenario(conn, funcion, ctx, iteraciones, calentamiento, semilla):
+    rng = random.Random(semilla)
+    for _ in range(calentamiento):
+        funcion(conn, rng, ctx)
+
+    tiempos = []
+    filas = 0
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        filas += funcion(conn, rng, ctx)
+        tiempos.append(time.perf_counter() - inicio)
+
+    tiempos.sort()
+    total = sum(tiempos)
+    return {
+        "iteraciones": iteraciones,
+        "p50_ms": percentil(tiempos, 50) * 1000,
+        "p95_ms": percentil(tiempos, 95) * 1000,
+        "p99_ms": percentil(tiempos, 99) * 1000,
+        "max_ms": tiempos[-1] * 1000,
+        "filas": filas,
+        "filas_por_segundo": filas / total if total else 0.0,
+    }
+
+
+def correr(ruta_db, escenarios, iteraciones, calentamiento, semilla):
+    conn = sqlite3.connect(ruta_db)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    ctx = _contexto(conn)
+
+    resultados = {}
+    for nombre in escenarios:
+        print(f"  {nombre}...", end=" ", flush=True, file=sys.stderr)
+        resultados[nombre] = medir_escenario(conn, ESCENARIOS[nombre], ctx, iteraciones, calentamiento, semilla)
+        print(f"p50 {resultados[nombre]['p50_ms']:.3f} ms, p99 {resultados[nombre]['p99_ms']:.3f} ms", file=sys.stderr)
+
+    metadatos = {
+        "fecha": datetime.datetime.now().isoformat(),
+        "sqlite": sqlite3.sqlite_version,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "productos": conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0],
+        "almacenes": len(ctx["almacen_ids"]),
+        "fts": ctx["fts"],
+        "iteraciones": iteraciones,
+        "calentamiento": calentamiento,
+        "semilla": semilla,
+    }
+    conn.close()
+    return {"metadatos": metadatos, "resultados": resultados}
+
+
+COLUMNAS_COMPARACION = (("p50_ms", "p50", ".3f"), ("p95_ms", "p95", ".3f"), ("p99_ms", "p99", ".3f"),
+                        ("filas_por_segundo", "filas/s", ".0f"))
+
+
+def comparar(base, nuevo):
+    """
+    Imprime base, nuevo y la razón nuevo/base por escenario y columna.
+    En los percentiles < 1.00 es más rápido; en filas/s, > 1.00.
+    """
+    encabezado = f"{'escenario':32}"
+    for _, titulo, _ in COLUMNAS_COMPARACION:
+        encabezado += f" {titulo + ' base':>14} {titulo + ' nuevo':>14} {'razón':>7}"
+    print(encabezado)
+    for nombre, r_nuevo in nuevo["resultados"].items():
+        r_base = base["resultados"].get(nombre)
+        if r_base is None:
+            print(f"{nombre:32} (sin dato en la base)")
+            continue
+        linea = f"{nombre:32}"
+        for clave, _, formato in COLUMNAS_COMPARACION:
+            valor_base, valor_nuevo = r_base.get(clave, 0.0), r_nuevo.get(clave, 0.0)
+            razon = valor_nuevo / valor_base if valor_base else 0.0
+            linea += f" {valor_base:14{formato}} {valor_nuevo:14{formato}} {razon:7.2f}"
+        print(linea)
+
+
+# --- Línea de comandos ---
+
+def _agregar_tamanos(parser):
+    parser.add_argument("--productos", type=int, default=10_000, help="De 1,000 a 5,000,000")
+    parser.add_argument("--almacenes", type=int, default=10, help="De 10 a 10,000")
+    parser.add_argument("--sesgo", type=float, default=1.0, help="Exponente Zipf del reparto (0 = uniforme)")
+    parser.add_argument("--semilla", type=int, default=42)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Mide sin Tk las consultas que hace main.py.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_generar = sub.add_parser("generar", help="Crea una base sintética")
+    p_generar.add_argument("salida")
+    _agregar_tamanos(p_generar)
+
+    p_correr = sub.add_parser("correr", help="Ejecuta los escenarios y guarda un JSON")
+    p_correr.add_argument("--db", help="Base a medir (se modifica); si falta se genera una temporal")
+    _agregar_tamanos(p_correr)
+    p_correr.add_argument("--iteraciones", type=int, default=200)
+    p_correr.add_argument("--calentamiento", type=int, default=20)
+    p_correr.add_argument("--escenarios", help="Lista separada por comas (por defecto, todos)")
+    p_correr.add_argument("--salida", help="Archivo JSON de resultados (por defecto, la salida estándar)")
+
+    p_comparar = sub.add_parser("comparar", help="Compara dos resultados JSON")
+    p_comparar.add_argument("base")
+    p_comparar.add_argument("nuevo")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == "generar":
+        inicio = time.perf_counter()
+        generar_bd(args.salida, args.productos, args.almacenes, args.sesgo, args.semilla)
+        print(f"Base generada en {args.salida} ({time.perf_counter() - inicio:.1f} s)")
+
+    elif args.comando == "correr":
+        escenarios = args.escenarios.split(",") if args.escenarios else list(ESCENARIOS)
+        desconocidos = [e for e in escenarios if e not in ESCENARIOS]
+        if desconocidos:
+            parser.error(f"escenarios desconocidos: {', '.join(desconocidos)}")
+
+        # La salida estándar queda solo para el JSON (se puede redirigir a un
+        # archivo y pasarlo a 'comparar'); el avance y los mensajes de las
+        # migraciones van a stderr
+        with tempfile.TemporaryDirectory() as carpeta, contextlib.redirect_stdout(sys.stderr):
+            ruta = args.db
+            if ruta is None:
+                ruta = os.path.join(carpeta, "bench.db")
+                print(f"Generando {args.productos} productos en {args.almacenes} almacenes...")
+                generar_bd(ruta, args.productos, args.almacenes, args.sesgo, args.semilla)
+            reporte = correr(ruta, escenarios, args.iteraciones, args.calentamiento, args.semilla)
+            reporte["metadatos"]["sesgo"] = None if args.db else args.sesgo
+
+        texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if args.salida:
+            with open(args.salida, "w", encoding="utf-8") as archivo:
+                archivo.write(texto)
+            print(f"Resultados guardados en {args.salida}", file=sys.stderr)
+        else:
+            print(texto)
+
+    else:
+        with open(args.base, encoding="utf-8") as a, open(args.nuevo, encoding="utf-8") as b:
+            comparar(json.load(a), json.load(b))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import uuid
+import datetime
+
+from setup_database import hash_password
+from consultas import (filtros_productos, pagina_productos, resumen_productos,
+                       filtros_almacenes, SELECT_ALMACENES, ORDEN_PRODUCTOS,
+                       SQL_LOGIN, SQL_REGISTRAR_INICIO_SESION, SQL_PRODUCTO_POR_ID, SQL_INSERTAR_PRODUCTO,
+                       SQL_ACTUALIZAR_PRODUCTO, SQL_ALMACEN_POR_ID, SQL_INSERTAR_ALMACEN, SQL_ACTUALIZAR_ALMACEN)
+from operaciones_masivas import aplicar_operacion_masiva
+from escritura_diferida import aplicar_lote
+from traspasos import traspasar
+from alertas_existencia import contar_bajo_reorden
+from busqueda_incremental import CacheBusquedas, clave_busqueda, consultar_busqueda
+from base_datos import CacheAlmacenes
+from benchmarks.generador import SUSTANTIVOS, ADJETIVOS, DEPARTAMENTOS
+
+# Cada escenario es una función (conn, rng, ctx) que ejecuta UNA operación tal
+# como la hace main.py y devuelve cuántas filas leyó o escribió.
+# 'ctx' trae datos de la base ya medidos: id_min, id_max, almacenes, etc.
+
+TAM_PAGINA = 100
+
+
+def _cargar_inicio(conn, where, params, orden=None, descendente=False):
+    """Lo mismo que FormularioProductos._fuente_productos en modo "inicio" (página y resumen)."""
+    filas = pagina_productos(conn, where, params, "inicio", None, TAM_PAGINA, orden, descendente)
+    resumen_productos(conn, where, params, filas, TAM_PAGINA, orden, descendente)
+    return filas
+
+
+def _primera_pagina(conn, where, params):
+    return len(_cargar_inicio(conn, where, params))
+
+
+def _termino(rng):
+    # Prefijos de 3-5 letras, como los escribe un usuario
+    palabra = rng.choice(SUSTANTIVOS + ADJETIVOS)
+    return palabra[:rng.randint(3, 5)]
+
+
+# --- Listas ---
+
+def cargar_productos(conn, rng, ctx):
+    return _primera_pagina(conn, *filtros_productos())
+
+
+def desplazar_productos(conn, rng, ctx):
+    where, params = filtros_productos()
+    clave = rng.randint(ctx["id_min"], ctx["id_max"])
+    return len(pagina_productos(conn, where, params, "despues", clave, TAM_PAGINA))
+
+
+def saltar_productos(conn, rng, ctx):
+    where, params = filtros_productos()
+    clave = rng.randint(ctx["id_min"], ctx["id_max"])
+    return len(pagina_productos(conn, where, params, "desde", clave, TAM_PAGINA))
+
+
+def ordenar_productos(conn, rng, ctx):
+    # Clic en un encabezado y desplazarse una página en ese orden
+    where, params = filtros_productos()
+    orden, descendente = rng.choice(list(ORDEN_PRODUCTOS)), rng.random() < 0.5
+    filas = _cargar_inicio(conn, where, params, orden, descendente)
+    filas += pagina_productos(conn, where, params, "despues", filas[-1][0], TAM_PAGINA, orden, descendente)
+    return len(filas)
+
+
+def cargar_almacenes(conn, rng, ctx):
+    return len(conn.execute(SELECT_ALMACENES).fetchall())
+
+
+# --- Búsquedas avanzadas ---
+
+def busqueda_productos_like(conn, rng, ctx):
+    return _primera_pagina(conn, *filtros_productos(nombre=_termino(rng), usar_fts=False))
+
+
+def busqueda_productos_fts(conn, rng, ctx):
+    return _primera_pagina(conn, *filtros_productos(nombre=_termino(rng), usar_fts=True))
+
+
+def busqueda_departamento_almacen(conn, rng, ctx):
+    return _primera_pagina(conn, *filtros_productos(depto=rng.choice(DEPARTAMENTOS)[:4],
+                                                    almacen=rng.choice(ctx["almacenes"])[:4],
+                                                    usar_fts=ctx["fts"]))
+
+
+def busqueda_rango_precio(conn, rng, ctx):
+    minimo = rng.uniform(0, 500)
+    return _primera_pagina(conn, *filtros_productos(p_min=str(minimo), p_max=str(minimo + 20)))
+
+
+def busqueda_usuario_fecha(conn, rng, ctx):
+    # "Todo lo que cambió Admin en una semana": recorrido de rango sobre el historial
+    desde = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randint(0, 300))
+    return _primera_pagina(conn, *filtros_productos(usuario_mod="Admin", fecha_desde=desde.isoformat(),
+                                                    fecha_hasta=(desde + datetime.timedelta(days=6)).isoformat()))
+
+
+def busqueda_al_escribir(conn, rng, ctx):
+    # La barra de búsqueda: un nombre tecleado letra por letra (cada letra ya
+    # pasó el retardo), con el caché LRU reutilizando el resultado anterior
+    cache, almacenes = CacheBusquedas(), CacheAlmacenes(None)
+    palabra = f"{rng.choice(SUSTANTIVOS)} {rng.choice(ADJETIVOS)}"
+    filas = []
+    for i in range(3, len(palabra) + 1):
+        clave = clave_busqueda(palabra[:i], usar_fts=ctx["fts"])
+        filas = cache.buscar(clave)
+        if filas is None:
+            filas, completo = consultar_busqueda(conn, palabra[:i], "", "", ctx["fts"], almacenes)
+            if not completo:
+                filas = pagina_productos(conn, *filtros_productos(palabra[:i], usar_fts=ctx["fts"]),
+                                         "inicio", None, TAM_PAGINA)
+            else:
+                cache.guardar(clave, filas, cache.generacion)
+    return len(filas)
+
+
+def busqueda_almacenes(conn, rng, ctx):
+    where, params = filtros_almacenes(nombre=rng.choice(ctx["almacenes"])[:3], usar_fts=ctx["fts"])
+    return len(conn.execute(f"{SELECT_ALMACENES} {where}", params).fetchall())
+
+
+# --- Formularios de edición ---
+
+def cargar_datos_producto(conn, rng, ctx):
+    fila = conn.execute(SQL_PRODUCTO_POR_ID, (rng.randint(ctx["id_min"], ctx["id_max"]),)).fetchone()
+    return 1 if fila else 0
+
+
+def cargar_datos_almacen(conn, rng, ctx):
+    fila = conn.execute(SQL_ALMACEN_POR_ID, (rng.choice(ctx["almacen_ids"]),)).fetchone()
+    return 1 if fila else 0
+
+
+def insertar_producto(conn, rng, ctx):
+    fecha = datetime.datetime.now().isoformat()
+    conn.execute(SQL_INSERTAR_PRODUCTO, (f"{rng.choice(SUSTANTIVOS)} bench", 1000, 5, rng.choice(DEPARTAMENTOS),
+                                         rng.choice(ctx["almacen_ids"]), fecha, "Admin"))
+    conn.commit()
+    return 1
+
+
+def actualizar_producto(conn, rng, ctx):
+    # Como el formulario: leer la fila (y su versión) y guardar con esa versión
+    fecha = datetime.datetime.now().isoformat()
+    item_id = rng.randint(ctx["id_min"], ctx["id_max"])
+    fila = conn.execute(SQL_PRODUCTO_POR_ID, (item_id,)).fetchone()
+    if fila is None:
+        return 0
+    conn.execute(SQL_ACTUALIZAR_PRODUCTO, (f"{rng.choice(SUSTANTIVOS)} editado", 1250, 7, rng.choice(DEPARTAMENTOS),
+                                           rng.choice(ctx["almacen_ids"]), fecha, "Admin", item_id, fila[5]))
+    conn.commit()
+    return 1
+
+
+def insertar_almacen(conn, rng, ctx):
+    fecha = datetime.datetime.now().isoformat()
+    conn.execute(SQL_INSERTAR_ALMACEN, (f"bench {rng.random()}", fecha, "almacen"))
+    conn.commit()
+    return 1
+
+
+def actualizar_almacen(conn, rng, ctx):
+    fecha = datetime.datetime.now().isoformat()
+    item_id = rng.choice(ctx["almacen_ids"])
+    nombre, version = conn.execute(SQL_ALMACEN_POR_ID, (item_id,)).fetchone()
+    conn.execute(SQL_ACTUALIZAR_ALMACEN, (nombre, fecha, "almacen", item_id, version))
+    conn.commit()
+    return 1
+
+
+def mover_500_productos(conn, rng, ctx):
+    # Acción masiva sobre una selección: un solo UPDATE en una transacción
+    inicio = rng.randint(ctx["id_min"], max(ctx["id_min"], ctx["id_max"] - 500))
+    resultado = aplicar_operacion_masiva(conn, "almacen", rng.choice(ctx["almacen_ids"]), "Admin",
+                                         ids=range(inicio, inicio + 500))
+    return resultado["afectados"]
+
+
+def insertar_50_en_lote(conn, rng, ctx):
+    # Captura rápida: un vaciado de la cola de escritura diferida (un commit para 50 altas)
+    fecha = datetime.datetime.now().isoformat()
+    lote = [{"clave": uuid.uuid4().hex, "tipo": "producto",
+             "valores": [f"{rng.choice(SUSTANTIVOS)} lote", 1000, 5, rng.choice(DEPARTAMENTOS),
+                         rng.choice(ctx["almacen_ids"]), fecha, "Admin"]}
+            for _ in range(50)]
+    aplicadas, _ = aplicar_lote(conn, lote)
+    return len(aplicadas)
+
+
+def traspasar_1000_productos(conn, rng, ctx):
+    # Traspaso de una unidad de hasta 1000 productos de un almacén a otro (una transacción)
+    origen, destino = rng.sample(ctx["almacen_ids"], 2)
+    ids = [fila[0] for fila in conn.execute(
+        "SELECT id FROM productos WHERE almacen = ? AND cantidad > 0 LIMIT 1000", (origen,))]
+    if not ids:
+        return 0
+    return traspasar(conn, [(i, 1) for i in ids], destino, "Admin")["productos"]
+
+
+def contar_existencia_baja(conn, rng, ctx):
+    # Recuento de la insignia de HomePage cuando hubo cambios (índices parciales)
+    return contar_bajo_reorden(conn)
+
+
+# --- Inicio de sesión ---
+
+def intentar_login(conn, rng, ctx):
+    fila = conn.execute(SQL_LOGIN, ("Admin",)).fetchone()
+    if fila and fila[0] == hash_password("admin123"):
+        conn.execute(SQL_REGISTRAR_INICIO_SESION, (datetime.datetime.now().isoformat(), "Admin"))
+        conn.commit()
+    return 1
+
+
+ESCENARIOS = {
+    "cargar_productos": cargar_productos,
+    "desplazar_productos": desplazar_productos,
+    "saltar_productos": saltar_productos,
+    "ordenar_productos": ordenar_productos,
+    "cargar_almacenes": cargar_almacenes,
+    "busqueda_productos_like": busqueda_productos_like,
+    "busqueda_productos_fts": busqueda_productos_fts,
+    "busqueda_departamento_almacen": busqueda_departamento_almacen,
+    "busqueda_rango_precio": busqueda_rango_precio,
+    "busqueda_usuario_fecha": busqueda_usuario_fecha,
+    "busqueda_al_escribir": busqueda_al_escribir,
+    "busqueda_almacenes": busqueda_almacenes,
+    "cargar_datos_producto": cargar_datos_producto,
+    "cargar_datos_almacen": cargar_datos_almacen,
+    "insertar_producto": insertar_producto,
+    "actualizar_producto": actualizar_producto,
+    "insertar_almacen": insertar_almacen,
+    "actualizar_almacen": actualizar_almacen,
+    "mover_500_productos": mover_500_productos,
+    "insertar_50_en_lote": insertar_50_en_lote,
+    "traspasar_1000_productos": traspasar_1000_productos,
+    "contar_existencia_baja": contar_existencia_baja,
+    "intentar_login": intentar_login,
+}
@@ -0,0 +1,128 @@
+import sqlite3
+import os
+import sys
+import time
+import random
+import datetime
+import tempfile
+import argparse
+import multiprocessing
+
+from base_datos import PRAGMAS_CONEXION, reintentar_si_ocupada, es_bd_ocupada
+from consultas import SQL_PRODUCTO_POR_ID, SQL_ACTUALIZAR_PRODUCTO, actualizar_con_version, ConflictoDeVersion
+from benchmarks.generador import generar_bd
+from benchmarks.ejecutar import percentil
+
+# Prueba de estrés con varios procesos escribiendo a la vez, como varios
+# empleados guardando desde sus equipos. Cada escritor repite lo que hace
+# FormularioEdicionProducto: lee la fila (con su versión) y la guarda con
+# cantidad + 1. Al final se comprueba que no se perdió ninguna actualización:
+# lo que subió la suma de cantidades debe ser igual a los guardados exitosos.
+
+
+def _escritor(ruta_db, ids, segundos, semilla):
+    """Corre en un proceso aparte. Devuelve sus contadores y latencias."""
+    rng = random.Random(semilla)
+    conn = sqlite3.connect(ruta_db)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    usuario = f"estres-{os.getpid()}"
+
+    exitosas, conflictos, ocupada = 0, 0, 0
+    latencias = []
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        item_id = rng.choice(ids)
+
+        def guardar():
+            nombre, precio, cantidad, departamento, almacen, version = \
+                conn.execute(SQL_PRODUCTO_POR_ID, (item_id,)).fetchone()
+            actualizar_con_version(conn, SQL_ACTUALIZAR_PRODUCTO, (
+                nombre, precio, cantidad + 1, departamento, almacen,
+                datetime.datetime.now().isoformat(), usuario, item_id, version))
+            conn.commit()
+
+        inicio = time.perf_counter()
+        try:
+            reintentar_si_ocupada(conn, guardar)
+            exitosas += 1
+            latencias.append(time.perf_counter() - inicio)
+        except ConflictoDeVersion:
+            conn.rollback()
+            conflictos += 1
+        except sqlite3.OperationalError as e:
+            if not es_bd_ocupada(e):
+                raise
+            conn.rollback()
+            ocupada += 1
+
+    conn.close()
+    return {"exitosas": exitosas, "conflictos": conflictos, "ocupada": ocupada, "latencias": latencias}
+
+
+def estres(ruta_db, procesos, segundos, filas, semilla):
+    """Lanza 'procesos' escritores sobre las primeras 'filas' filas (pocas = más choques)."""
+    conn = sqlite3.connect(ruta_db)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    ids = [fila[0] for fila in conn.execute("SELECT id FROM productos ORDER BY id LIMIT ?", (filas,))]
+    marcadores = ",".join("?" * len(ids))
+    sql_sumas = f"SELECT SUM(cantidad), SUM(version) FROM productos WHERE id IN ({marcadores})"
+    cantidad_antes, version_antes = conn.execute(sql_sumas, ids).fetchone()
+
+    # "spawn" igual que en Windows: cada escritor abre su propia conexión desde cero
+    contexto = multiprocessing.get_context("spawn")
+    with contexto.Pool(procesos) as pool:
+        resultados = pool.starmap(_escritor, [(ruta_db, ids, segundos, semilla + i) for i in range(procesos)])
+
+    cantidad_despues, version_despues = conn.execute(sql_sumas, ids).fetchone()
+    conn.close()
+
+    exitosas = sum(r["exitosas"] for r in resultados)
+    latencias = sorted(t for r in resultados for t in r["latencias"])
+    return {
+        "procesos": procesos,
+        "segundos": segundos,
+        "filas": len(ids),
+        "exitosas": exitosas,
+        "conflictos": sum(r["conflictos"] for r in resultados),
+        "ocupada": sum(r["ocupada"] for r in resultados),
+        "escrituras_por_segundo": exitosas / segundos if segundos else 0.0,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "perdidas": exitosas - (cantidad_despues - cantidad_antes),
+        "versiones_ok": version_despues - version_antes == exitosas,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.estres",
+                                     description="Varios procesos editando los mismos productos a la vez.")
+    parser.add_argument("--db", help="Base a usar (se modifica); si falta se genera una temporal")
+    parser.add_argument("--procesos", type=int, default=8)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--filas", type=int, default=20, help="Productos que se disputan los escritores")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = args.db
+        if ruta is None:
+            ruta = os.path.join(carpeta, "estres.db")
+            generar_bd(ruta, 10_000, 10, 1.0, args.semilla)
+        r = estres(ruta, args.procesos, args.segundos, args.filas, args.semilla)
+
+    print(f"{r['procesos']} procesos, {r['segundos']:.0f} s, {r['filas']} filas en disputa")
+    print(f"  Guardados: {r['exitosas']} ({r['escrituras_por_segundo']:.0f}/s), "
+          f"p50 {r['p50_ms']:.1f} ms, p99 {r['p99_ms']:.1f} ms")
+    print(f"  Conflictos de versión detectados: {r['conflictos']}")
+    print(f"  Sin poder escribir (base ocupada tras reintentos): {r['ocupada']}")
+    print(f"  Actualizaciones perdidas: {r['perdidas']}")
+    if r["perdidas"] or not r["versiones_ok"]:
+        print("ERROR: las sumas no cuadran con los guardados exitosos")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import sqlite3
+import os
+import random
+import datetime
+import bisect
+import itertools
+
+from setup_database import aplicar_migraciones, hash_password
+
+# --- Vocabulario para nombres sintéticos ---
+SUSTANTIVOS = ("Silla", "Mesa", "Impresora", "Filamento", "Cable", "Monitor", "Teclado", "Lámpara",
+               "Tornillo", "Pegamento", "Base", "Estante", "Cuaderno", "Pintura", "Brocha", "Sensor")
+ADJETIVOS = ("naranja", "azul", "metálica", "3D", "grande", "chica", "industrial", "reciclada",
+             "premium", "básica", "roja", "de madera", "inalámbrica", "eléctrica", "térmica", "ligera")
+DEPARTAMENTOS = ("mobiliario", "materiales", "impresion3D", "electronica", "papeleria", "limpieza",
+                 "herramientas", "iluminacion", "computo", "pintura", "ferreteria", "oficina")
+CIUDADES = ("hermosillo", "guaymas", "nogales", "caborca", "navojoa", "obregon", "agua prieta",
+            "san luis", "empalme", "huatabampo", "magdalena", "cananea")
+USUARIOS = ("Admin", "almacen", "productos")
+
+TAM_LOTE = 20000
+
+
+def _pesos_zipf(n, sesgo):
+    """Pesos acumulados de una distribución tipo Zipf (sesgo=0 es uniforme)."""
+    acumulado = list(itertools.accumulate(1.0 / (i + 1) ** sesgo for i in range(n)))
+    return acumulado
+
+
+def _elegir(rng, acumulado):
+    return bisect.bisect_left(acumulado, rng.random() * acumulado[-1])
+
+
+def generar_bd(ruta, num_productos=10_000, num_almacenes=10, sesgo=1.0, semilla=42):
+    """
+    Crea en 'ruta' una base con el esquema de setup_database y datos sintéticos.
+
+    - Los productos se reparten entre almacenes y departamentos con una
+      distribución Zipf ('sesgo'), así unos pocos almacenes concentran la mayoría.
+    - Los datos se cargan con solo las tablas base; los índices y el FTS se
+      crean después (una construcción en bloque es mucho más rápida).
+    """
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    rng = random.Random(semilla)
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    aplicar_migraciones(conn, hasta=1)
+
+    # --- Usuarios (mismas credenciales que setup_database) ---
+    for nombre, password, rol in (("Admin", "admin123", "ADMIN"), ("almacen", "almacen11", "ALMACENES"),
+                                  ("productos", "producto19", "PRODUCTOS")):
+        conn.execute("INSERT INTO usuarios (NOMBRE, CONTRASEÑA, rol) VALUES (?, ?, ?)",
+                     (nombre, hash_password(password), rol))
+
+    # --- Almacenes ---
+    inicio = datetime.datetime(2024, 1, 1)
+    almacenes = []
+    for i in range(1, num_almacenes + 1):
+        ciudad = CIUDADES[(i - 1) % len(CIUDADES)]
+        nombre = ciudad if i <= len(CIUDADES) else f"{ciudad} {i}"
+        almacenes.append((i, nombre, (inicio + datetime.timedelta(days=rng.randint(0, 600))).isoformat(),
+                          rng.choice(USUARIOS)))
+    conn.executemany("INSERT INTO almacenes (id, nombre, fecha_ultima_modificacion, ultimo_usuario_en_modificar) "
+                     "VALUES (?, ?, ?, ?)", almacenes)
+
+    # --- Productos ---
+    pesos_almacen = _pesos_zipf(num_almacenes, sesgo)
+    pesos_depto = _pesos_zipf(len(DEPARTAMENTOS), sesgo)
+
+    def filas():
+        for i in range(1, num_productos + 1):
+            nombre = f"{rng.choice(SUSTANTIVOS)} {rng.choice(ADJETIVOS)} {i}"
+            precio = round(rng.lognormvariate(5, 1.2), 2)
+            cantidad = int(rng.expovariate(1 / 40))
+            departamento = DEPARTAMENTOS[_elegir(rng, pesos_depto)]
+            almacen = _elegir(rng, pesos_almacen) + 1
+            if rng.random() < 0.7:
+                fecha = (inicio + datetime.timedelta(minutes=rng.randint(0, 900 * 24 * 60))).isoformat()
+                usuario = rng.choice(USUARIOS)
+            else:
+                fecha = usuario = None  # Productos nunca editados desde la app
+            yield i, nombre, precio, cantidad, departamento, almacen, fecha, usuario
+
+    generador = filas()
+    while True:
+        lote = list(itertools.islice(generador, TAM_LOTE))
+        if not lote:
+            break
+        conn.executemany("""
+            INSERT INTO productos (id, nombre, precio, cantidad, departamento, almacen,
+                                   fecha_ultima_modificacion, ultimo_usuario_en_modificar)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, lote)
+    conn.commit()
+
+    # Índices, FTS y ANALYZE
+    aplicar_migraciones(conn)
+    conn.close()
+    return ruta
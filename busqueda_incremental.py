@@ -0,0 +1,203 @@
+import re
+import time
+import bisect
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from consultas import filtros_productos, nombres_de_almacen, SELECT_PRODUCTOS_LISTA
+
+# --- Búsqueda mientras se escribe ---
+# La barra de búsqueda de FormularioProductos consulta con cada pausa al
+# escribir. Los resultados pequeños (hasta MAX_FILAS_EN_MEMORIA) se guardan
+# completos en un caché LRU; si el usuario sigue escribiendo y la búsqueda
+# nueva solo puede devolver un subconjunto de una ya guardada ("lap" -> "lapt"),
+# se filtra en memoria sin volver a SQLite.
+#
+# El filtrado en memoria reproduce lo que hace filtros_productos:
+#   - FTS: cada token buscado es prefijo de algún token del campo
+#     (sin mayúsculas ni acentos, como el tokenizador unicode61).
+#   - LIKE: el texto está contenido en el campo (mayúsculas solo ASCII).
+
+MAX_FILAS_EN_MEMORIA = 5000
+CAPACIDAD_CACHE = 32
+VIGENCIA_SEGUNDOS = 30     # Tope para no mostrar lo que otro proceso ya cambió
+
+_MINUSCULAS_ASCII = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+# Columnas de las filas de la lista (SELECT_PRODUCTOS_LISTA con nombres de almacén)
+_COLUMNAS_TEXTO = (1, 4, 5)    # nombre, departamento, almacén
+_COLUMNA_ORDEN = {"id": 0, "nombre": 1, "precio": 2, "cantidad": 3, "departamento": 4,
+                  "fecha_mod": 6, "usuario_mod": 7}
+_CON_IFNULL = ("fecha_mod", "usuario_mod")
+
+
+def _sin_acentos(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c)).casefold()
+
+
+def _criterio(texto, usar_fts):
+    """Forma normalizada de un campo: None, ("fts", tokens) o ("like", texto)."""
+    if not texto:
+        return None
+    tokens = re.findall(r"\w+", texto) if usar_fts else []
+    if tokens:
+        return ("fts", tuple(_sin_acentos(t) for t in tokens))
+    return ("like", texto.translate(_MINUSCULAS_ASCII))   # filtros_productos usa LIKE si no hay tokens
+
+
+def clave_busqueda(nombre="", depto="", almacen="", usar_fts=False):
+    """Llave del caché: dos textos que dan el mismo SQL dan la misma llave."""
+    return tuple(_criterio(texto, usar_fts) for texto in (nombre, depto, almacen))
+
+
+def _cumple(valor, criterio):
+    if criterio is None:
+        return True
+    if valor is None:
+        return False
+    tipo, buscado = criterio
+    if tipo == "like":
+        return buscado in str(valor).translate(_MINUSCULAS_ASCII)
+    tokens = [_sin_acentos(t) for t in re.findall(r"\w+", str(valor))]
+    return all(any(t.startswith(b) for t in tokens) for b in buscado)
+
+
+def cumple_busqueda(fila, clave):
+    return all(_cumple(fila[col], criterio) for col, criterio in zip(_COLUMNAS_TEXTO, clave))
+
+
+def _refina(nuevo, anterior):
+    """True si todo lo que cumple 'nuevo' también cumple 'anterior'."""
+    if anterior is None:
+        return True
+    if nuevo is None or nuevo[0] != anterior[0]:
+        return False
+    if nuevo[0] == "like":
+        # Con comodines (%, _) la contención de textos ya no implica la de resultados
+        return not re.search(r"[%_]", nuevo[1] + anterior[1]) and anterior[1] in nuevo[1]
+    return all(any(n.startswith(a) for n in nuevo[1]) for a in anterior[1])
+
+
+def refina_busqueda(nueva, anterior):
+    return all(_refina(n, a) for n, a in zip(nueva, anterior))
+
+
+class CacheBusquedas:
+    """
+    LRU de resultados completos por llave de búsqueda.
+
+    'generacion' sube con cada escritura (App.publicar_cambio, acciones
+    masivas, importación) y vacía el caché; un resultado que se consultó
+    antes de la última escritura ya no se guarda.
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_CACHE, vigencia=VIGENCIA_SEGUNDOS):
+        self.capacidad = capacidad
+        self.vigencia = vigencia
+        self.generacion = 0
+        self._entradas = OrderedDict()   # llave -> (instante, filas)
+        self._lock = threading.Lock()
+        # Contadores para comprobar que el caché sí se usa
+        self.aciertos = 0
+        self.refinadas = 0
+        self.fallos = 0
+
+    def invalidar(self):
+        with self._lock:
+            self.generacion += 1
+            self._entradas.clear()
+
+    def _vigente(self, instante):
+        return time.monotonic() - instante < self.vigencia
+
+    def buscar(self, clave):
+        """Filas de 'clave' sin tocar SQLite (exacta o filtrando un superconjunto), o None."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and self._vigente(entrada[0]):
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+
+            for otra, (instante, filas) in reversed(self._entradas.items()):
+                if self._vigente(instante) and refina_busqueda(clave, otra):
+                    filas = [f for f in filas if cumple_busqueda(f, clave)]
+                    self._guardar(clave, filas, instante)
+                    self.refinadas += 1
+                    return filas
+
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, filas, generacion):
+        with self._lock:
+            if generacion == self.generacion:
+                self._guardar(clave, filas, time.monotonic())
+
+    def _guardar(self, clave, filas, instante):
+        self._entradas[clave] = (instante, filas)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+
+
+def consultar_busqueda(conn, nombre, depto, almacen, usar_fts, almacenes, max_filas=MAX_FILAS_EN_MEMORIA):
+    """
+    Ejecuta la búsqueda en SQLite. Devuelve (filas, completo): si hay más de
+    'max_filas' coincidencias no se traen todas (completo=False) y la lista
+    debe paginarse con SQL como siempre.
+    """
+    where, params = filtros_productos(nombre, depto, almacen, usar_fts=usar_fts)
+    filas = conn.execute(f"{SELECT_PRODUCTOS_LISTA} {where} ORDER BY p.id LIMIT ?",
+                         list(params) + [max_filas + 1]).fetchall()
+    if len(filas) > max_filas:
+        return None, False
+    return nombres_de_almacen(filas, almacenes, conn), True
+
+
+# --- Paginación en memoria (mismos modos que pagina_productos) ---
+
+def ordenar_filas(filas, orden="id", descendente=False):
+    """Mismo orden que orden_productos(): NULL primero, números antes que texto, id para desempatar."""
+    columna = _COLUMNA_ORDEN[orden or "id"]
+    con_ifnull = orden in _CON_IFNULL
+
+    def llave(fila):
+        valor = fila[columna]
+        if valor is None:
+            return (2, "", fila[0]) if con_ifnull else (0, 0, fila[0])
+        return (1 if isinstance(valor, (int, float)) else 2, valor, fila[0])
+
+    return sorted(filas, key=llave, reverse=descendente)
+
+
+def pagina_en_memoria(filas, modo, clave, limite, por_id=True):
+    """
+    Una página de 'filas' (ya ordenadas). 'por_id' indica que el orden es por
+    id ascendente: ahí "desde" recibe ids interpolados que pueden no existir.
+    """
+    if modo == "inicio":
+        return filas[:limite]
+    if modo == "posicion":
+        return filas[clave:clave + limite]
+
+    if por_id:
+        ids = [f[0] for f in filas]
+        if modo == "desde":
+            i = bisect.bisect_left(ids, clave)
+            return filas[i:i + limite]
+        i = bisect.bisect_left(ids, clave)
+        encontrada = i < len(ids) and ids[i] == clave
+    else:
+        i = next((n for n, f in enumerate(filas) if f[0] == clave), None)
+        encontrada = i is not None
+        if not encontrada:
+            return filas[:limite] if modo == "desde" else []
+
+    if modo == "desde":
+        return filas[i:i + limite]
+    if modo == "despues":
+        inicio = i + 1 if encontrada else i
+        return filas[inicio:inicio + limite]
+    return filas[max(0, i - limite):i]   # "antes"
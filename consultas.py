@@ -0,0 +1,464 @@
+import sqlite3
+import re
+import datetime
+from decimal import Decimal, InvalidOperation, ROUND_CEILING, ROUND_FLOOR
+
+# --- Sentencias de los formularios (login y edición) ---
+# Viven aquí para que los benchmarks y otros clientes usen exactamente el mismo SQL.
+
+SQL_LOGIN = "SELECT CONTRASEÑA, rol, NOMBRE FROM usuarios WHERE NOMBRE = ?"
+SQL_REGISTRAR_INICIO_SESION = 'UPDATE usuarios SET "ULTIMO INICIO DE SESION" = ? WHERE NOMBRE = ?'
+
+# El precio se guarda en centavos (ver "Precio y cantidad" más abajo)
+SQL_PRODUCTO_POR_ID = "SELECT nombre, precio_centavos, cantidad, departamento, almacen, version FROM productos WHERE id = ?"
+SQL_INSERTAR_PRODUCTO = """
+    INSERT INTO productos (nombre, precio_centavos, cantidad, departamento, almacen, fecha_ultima_modificacion, ultimo_usuario_en_modificar)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_ACTUALIZAR_PRODUCTO = """
+    UPDATE productos SET
+        nombre = ?, precio_centavos = ?, cantidad = ?, departamento = ?, almacen = ?,
+        fecha_ultima_modificacion = ?, ultimo_usuario_en_modificar = ?, version = version + 1
+    WHERE id = ? AND version = ?
+"""
+SQL_ELIMINAR_PRODUCTO = "DELETE FROM productos WHERE id = ?"
+
+SQL_ALMACEN_POR_ID = "SELECT nombre, version FROM almacenes WHERE id = ?"
+SQL_INSERTAR_ALMACEN = """
+    INSERT INTO almacenes (nombre, fecha_ultima_modificacion, ultimo_usuario_en_modificar)
+    VALUES (?, ?, ?)
+"""
+SQL_ACTUALIZAR_ALMACEN = """
+    UPDATE almacenes SET
+        nombre = ?, fecha_ultima_modificacion = ?, ultimo_usuario_en_modificar = ?, version = version + 1
+    WHERE id = ? AND version = ?
+"""
+SQL_ELIMINAR_ALMACEN = "DELETE FROM almacenes WHERE id = ?"
+
+# Los triggers de historial toman de aquí quién borró y cuándo (un DELETE no trae
+# columnas de auditoría). Se marca y se limpia dentro de la misma transacción.
+SQL_MARCAR_AUTOR = "INSERT OR REPLACE INTO autor_eliminacion (id, usuario, fecha) VALUES (1, ?, ?)"
+SQL_LIMPIAR_AUTOR = "DELETE FROM autor_eliminacion"
+
+
+class ConflictoDeVersion(Exception):
+    """Otro usuario modificó o eliminó la fila desde que se leyó."""
+
+
+def actualizar_con_version(conn, sql, parametros):
+    """
+    Ejecuta un UPDATE ... WHERE id = ? AND version = ?. Si no tocó ninguna
+    fila, alguien más ganó la carrera: lanza ConflictoDeVersion en lugar de
+    sobrescribir sus cambios. No hace commit.
+    """
+    if conn.execute(sql, parametros).rowcount == 0:
+        raise ConflictoDeVersion("Otro usuario modificó o eliminó este registro mientras lo editaba")
+
+
+def eliminar_con_autor(conn, sql, parametros, usuario, fecha):
+    """Ejecuta un DELETE dejando usuario y fecha para el historial. No hace commit; devuelve las filas borradas."""
+    conn.execute(SQL_MARCAR_AUTOR, (usuario, fecha))
+    borradas = conn.execute(sql, parametros).rowcount
+    conn.execute(SQL_LIMPIAR_AUTOR)
+    return borradas
+
+
+# --- Precio y cantidad ---
+# Desde la migración 8, productos guarda precio_centavos y cantidad como
+# INTEGER (tabla STRICT con CHECK >= 0). Todo lo que escribe pasa antes por
+# estas funciones; las consultas de las listas devuelven el precio con
+# decimales (precio_centavos / 100.0).
+
+def a_centavos(texto, redondeo=None):
+    """
+    '12.5', '12,50' o '$ 1299' -> centavos (int). Lanza ValueError si no es un
+    precio válido. Sin 'redondeo' (modo de decimal) se rechazan más de 2
+    decimales; los filtros de rango sí redondean hacia dentro del rango.
+    """
+    limpio = str(texto if texto is not None else "").strip().lstrip("$").strip()
+    if "," in limpio:
+        # '1,299.50' (separador de miles) o '12,50' (coma decimal)
+        limpio = limpio.replace(",", "") if "." in limpio else limpio.replace(",", ".")
+    try:
+        valor = Decimal(limpio)
+    except InvalidOperation:
+        raise ValueError("El precio debe ser numérico")
+    if not valor.is_finite():
+        raise ValueError("El precio debe ser numérico")
+    if valor < 0:
+        raise ValueError("El precio no puede ser negativo")
+    centavos = valor * 100
+    if redondeo is not None:
+        return int(centavos.to_integral_value(rounding=redondeo))
+    if centavos != centavos.to_integral_value():
+        raise ValueError("El precio admite como máximo 2 decimales")
+    return int(centavos)
+
+
+def a_cantidad(texto):
+    """Texto capturado -> cantidad (int >= 0). Lanza ValueError si no es válida."""
+    try:
+        cantidad = int(str(texto if texto is not None else "").strip())
+    except ValueError:
+        raise ValueError("La cantidad debe ser un número entero")
+    if cantidad < 0:
+        raise ValueError("La cantidad no puede ser negativa")
+    return cantidad
+
+
+def texto_precio(centavos):
+    """Centavos -> '1299.50', para mostrar en los formularios."""
+    return f"{centavos // 100}.{centavos % 100:02d}"
+
+
+# --- Permisos ---
+# Roles que pueden crear, editar y eliminar en cada tabla; los demás solo
+# consultan. Los usan aplicar_permisos de las listas y servidor_api.py.
+
+ROLES_EDICION = {
+    "productos": ("ADMIN", "PRODUCTOS"),
+    "almacenes": ("ADMIN", "ALMACENES"),
+}
+
+
+def puede_editar(rol, tabla):
+    return rol in ROLES_EDICION[tabla]
+
+
+# --- Consultas de la lista de productos ---
+# Centralizadas aquí para que la interfaz pagine siempre con el mismo SQL.
+
+SELECT_PRODUCTOS = """
+    SELECT
+        p.id, p.nombre, p.precio_centavos / 100.0 AS precio, p.cantidad, p.departamento,
+        a.nombre as nombre_almacen,
+        p.fecha_ultima_modificacion, p.ultimo_usuario_en_modificar
+    FROM productos p
+    LEFT JOIN almacenes a ON p.almacen = a.id
+"""
+
+# La lista paginada no hace JOIN: trae el id del almacén y el nombre se
+# resuelve con CacheAlmacenes (ver nombres_de_almacen).
+SELECT_PRODUCTOS_LISTA = """
+    SELECT
+        p.id, p.nombre, p.precio_centavos / 100.0 AS precio, p.cantidad, p.departamento,
+        p.almacen,
+        p.fecha_ultima_modificacion, p.ultimo_usuario_en_modificar
+    FROM productos p
+"""
+
+
+# Las cifras de existencias vienen de resumen_almacenes (una fila por almacén,
+# mantenida por triggers), no de un GROUP BY sobre productos.
+SELECT_ALMACENES = """
+    SELECT id, nombre, fecha_ultima_modificacion, ultimo_usuario_en_modificar,
+           IFNULL(r.num_productos, 0), IFNULL(r.total_unidades, 0), IFNULL(r.valor_centavos, 0) / 100.0
+    FROM almacenes
+    LEFT JOIN resumen_almacenes r ON r.almacen = almacenes.id
+"""
+
+SQL_RESUMEN_ALMACENES = """
+    SELECT almacen, num_productos, total_unidades, valor_centavos / 100.0
+    FROM resumen_almacenes
+"""
+
+
+# --- Búsqueda de texto completo (FTS5) ---
+
+def indice_fts_disponible(conn):
+    """True si setup_database pudo crear las tablas FTS5 (SQLite compilado con FTS5)."""
+    fila = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('productos_fts', 'almacenes_fts')"
+    ).fetchone()
+    return fila[0] == 2
+
+
+def expresion_fts(columna, texto):
+    """
+    Convierte el texto del usuario en una expresión MATCH por prefijo de tokens:
+    'silla nar' -> nombre : ("silla"* AND "nar"*). Devuelve None si no hay tokens.
+    """
+    tokens = re.findall(r"\w+", texto)
+    if not tokens:
+        return None
+    terminos = " AND ".join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+    return f"{columna} : ({terminos})"
+
+
+def filtro_historial(tabla, columna_id, usuario="", fecha_desde="", fecha_hasta=""):
+    """
+    Condición "columna_id IN (...)" sobre historial_cambios para un rango de
+    fechas 'AAAA-MM-DD' (ambos extremos incluidos), opcionalmente acotado a
+    los usuarios cuyo nombre contiene 'usuario'. Se resuelve con un recorrido
+    de rango sobre idx_historial_fecha o idx_historial_usuario.
+    Devuelve (sql, params), o (None, []) si no hay fechas.
+    Lanza ValueError si alguna fecha no es válida.
+    """
+    if not fecha_desde and not fecha_hasta:
+        return None, []
+
+    sql = f"{columna_id} IN (SELECT registro_id FROM historial_cambios WHERE tabla = ?"
+    params = [tabla]
+    if usuario:
+        sql += " AND usuario IN (SELECT NOMBRE FROM usuarios WHERE NOMBRE LIKE ?)"
+        params.append(f"%{usuario}%")
+    try:
+        if fecha_desde:
+            sql += " AND fecha >= ?"
+            params.append(datetime.date.fromisoformat(fecha_desde).isoformat())
+        if fecha_hasta:
+            # Las fechas guardadas llevan hora: "hasta" se compara con el día siguiente
+            sql += " AND fecha < ?"
+            params.append((datetime.date.fromisoformat(fecha_hasta) + datetime.timedelta(days=1)).isoformat())
+    except ValueError:
+        raise ValueError("Las fechas deben tener el formato AAAA-MM-DD")
+    return sql + ")", params
+
+
+def filtros_productos(nombre="", depto="", almacen="", p_min="", p_max="", usuario_mod="", fecha_desde="",
+                      fecha_hasta="", usar_fts=False):
+    """
+    Convierte los campos de los Filtros Avanzados en una cláusula WHERE.
+    Devuelve (where, params). Lanza ValueError si el precio o las fechas no son válidos.
+
+    Con un rango de fechas se buscan los productos que tengan algún cambio en
+    el historial dentro del rango (hecho por 'usuario_mod', si se da); sin
+    fechas, 'usuario_mod' se compara con el último usuario que modificó.
+
+    Con usar_fts=True los filtros de texto (nombre, departamento y almacén)
+    se resuelven con una sola consulta MATCH sobre productos_fts en vez de LIKE.
+    """
+    where = "WHERE 1=1"
+    params = []
+
+    expresiones = []
+    for columna, texto, sql_like in (("nombre", nombre, "p.nombre LIKE ?"),
+                                     ("departamento", depto, "p.departamento LIKE ?"),
+                                     ("almacen", almacen,
+                                      "p.almacen IN (SELECT id FROM almacenes WHERE nombre LIKE ?)")):
+        if not texto:
+            continue
+        expresion = expresion_fts(columna, texto) if usar_fts else None
+        if expresion:
+            expresiones.append(expresion)
+        else:
+            where += f" AND {sql_like}"
+            params.append(f"%{texto}%")
+
+    if expresiones:
+        where += " AND p.id IN (SELECT rowid FROM productos_fts WHERE productos_fts MATCH ?)"
+        params.append(" AND ".join(expresiones))
+
+    # Comparación de enteros sobre idx_productos_precio
+    if p_min:
+        where += " AND p.precio_centavos >= ?"
+        params.append(a_centavos(p_min, ROUND_CEILING))
+
+    if p_max:
+        where += " AND p.precio_centavos <= ?"
+        params.append(a_centavos(p_max, ROUND_FLOOR))
+
+    historial, params_historial = filtro_historial("productos", "p.id", usuario_mod, fecha_desde, fecha_hasta)
+    if historial:
+        where += f" AND {historial}"
+        params += params_historial
+    elif usuario_mod:
+        where += " AND p.ultimo_usuario_en_modificar LIKE ?"
+        params.append(f"%{usuario_mod}%")
+
+    return where, params
+
+
+# --- Orden de las listas ---
+# Columna del Treeview -> expresión SQL por la que se ordena. Las columnas que
+# admiten NULL se ordenan por IFNULL(...) para que la llave nunca sea NULL;
+# migracion_indices_orden crea un índice sobre cada una de estas expresiones.
+
+ORDEN_PRODUCTOS = {
+    "id": "p.id",
+    "nombre": "p.nombre",
+    "precio": "p.precio_centavos",
+    "cantidad": "p.cantidad",
+    "departamento": "p.departamento",
+    "fecha_mod": "IFNULL(p.fecha_ultima_modificacion, '')",
+    "usuario_mod": "IFNULL(p.ultimo_usuario_en_modificar, '')",
+}
+
+ORDEN_ALMACENES = {
+    "id": "id",
+    "nombre": "nombre",
+    "fecha_mod": "IFNULL(fecha_ultima_modificacion, '')",
+    "usuario_mod": "IFNULL(ultimo_usuario_en_modificar, '')",
+    # Cifras del resumen: se ordenan las filas de almacenes, sin tocar productos
+    "productos": "IFNULL(r.num_productos, 0)",
+    "unidades": "IFNULL(r.total_unidades, 0)",
+    "valor": "IFNULL(r.valor_centavos, 0)",
+}
+
+
+def orden_productos(orden=None, descendente=False):
+    """Cláusula ORDER BY de la lista de productos (el id desempata)."""
+    sentido = "DESC" if descendente else "ASC"
+    return f"ORDER BY {ORDEN_PRODUCTOS[orden or 'id']} {sentido}, p.id {sentido}"
+
+
+def orden_almacenes(orden=None, descendente=False):
+    sentido = "DESC" if descendente else "ASC"
+    return f"ORDER BY {ORDEN_ALMACENES[orden or 'id']} {sentido}, almacenes.id {sentido}"
+
+
+def _tramo_productos(conn, where, params, condicion, valores, orden_sql, limite):
+    sql = f"{SELECT_PRODUCTOS_LISTA} {where} AND {condicion} {orden_sql} LIMIT ?"
+    return conn.execute(sql, list(params) + list(valores) + [limite]).fetchall()
+
+
+def pagina_productos(conn, where, params, modo="inicio", clave=None, limite=100, orden=None, descendente=False):
+    """
+    Trae una página de productos usando paginación por llave (keyset).
+
+    La llave de cada fila es (valor de la columna 'orden', p.id); 'clave' es
+    siempre el id de la fila de referencia y su valor se lee de la tabla.
+
+    modo:
+        "inicio"   -> primeras 'limite' filas
+        "despues"  -> filas que van después de 'clave'
+        "antes"    -> filas que van antes de 'clave' (se devuelven en el orden de la lista)
+        "desde"    -> 'clave' y las que siguen (para saltos de la barra de desplazamiento)
+        "posicion" -> las filas a partir de la posición 'clave' (saltos con orden por columna)
+
+    Con orden por columna, "despues" se parte en dos búsquedas por índice:
+    primero los empates (columna = valor AND id > clave) y luego columna > valor.
+    Una sola comparación de tuplas (columna, id) > (?, ?) haría que SQLite
+    recorriera todos los empates de la columna.
+
+    La columna de almacén trae el id; usar nombres_de_almacen() antes de mostrarla.
+    """
+    expresion = ORDEN_PRODUCTOS[orden or "id"]
+
+    if modo == "posicion":
+        fila = conn.execute(f"SELECT p.id FROM productos p {where} {orden_productos(orden, descendente)} "
+                            f"LIMIT 1 OFFSET ?", list(params) + [clave]).fetchone()
+        if fila is None:
+            return []
+        modo, clave = "desde", fila[0]
+
+    # Se recorre el índice hacia adelante o hacia atrás según el modo y el sentido de la lista
+    adelante = modo != "antes"
+    ascendente = adelante != descendente
+    sentido = "ASC" if ascendente else "DESC"
+    mayor = ">" if ascendente else "<"
+    orden_sql = f"ORDER BY {expresion} {sentido}, p.id {sentido}"
+    comparacion = mayor + ("=" if modo == "desde" else "")
+
+    if modo == "inicio":
+        filas = _tramo_productos(conn, where, params, "1=1", [], orden_sql, limite)
+    elif expresion == "p.id":
+        filas = _tramo_productos(conn, where, params, f"p.id {comparacion} ?", [clave], orden_sql, limite)
+    else:
+        fila = conn.execute(f"SELECT {expresion} FROM productos p WHERE p.id = ?", (clave,)).fetchone()
+        if fila is None:
+            return []   # La fila de referencia se borró mientras tanto
+        valor = fila[0]
+        filas = _tramo_productos(conn, where, params, f"{expresion} = ? AND p.id {comparacion} ?",
+                                 [valor, clave], f"ORDER BY p.id {sentido}", limite)
+        if len(filas) < limite:
+            filas += _tramo_productos(conn, where, params, f"{expresion} {mayor} ?", [valor],
+                                      orden_sql, limite - len(filas))
+
+    if not adelante:
+        filas.reverse()
+    return filas
+
+
+def fila_producto(conn, where, params, item_id):
+    """Lee un solo producto por id, solo si sigue cumpliendo el filtro actual."""
+    sql = f"{SELECT_PRODUCTOS_LISTA} {where} AND p.id = ?"
+    return conn.execute(sql, list(params) + [item_id]).fetchall()
+
+
+def nombres_de_almacen(filas, cache, conn=None):
+    """Reemplaza el id de almacén (columna 5) por su nombre usando el caché."""
+    return [fila[:5] + (cache.nombre_de(fila[5], conn),) + fila[6:] for fila in filas]
+
+
+def rango_ids_productos(conn, where, params):
+    """
+    Devuelve (id_minimo, id_maximo) de los productos que cumplen el filtro.
+    Con ORDER BY ... LIMIT 1 SQLite se detiene en la primera coincidencia.
+    """
+    base = f"SELECT p.id FROM productos p {where}"
+    fila_min = conn.execute(f"{base} ORDER BY p.id ASC LIMIT 1", params).fetchone()
+    fila_max = conn.execute(f"{base} ORDER BY p.id DESC LIMIT 1", params).fetchone()
+    if not fila_min:
+        return None, None
+    return fila_min[0], fila_max[0]
+
+
+def estimar_total_productos(conn, where, params, primera_pagina, limite, id_min, id_max):
+    """
+    Estima cuántas filas devuelve la consulta sin recorrerla completa.
+
+    - Si la primera página no se llenó, el total es exacto.
+    - Sin filtros se usa sqlite_stat1 (si ya se corrió ANALYZE) o COUNT(*).
+      El primer número de 'stat' es el total de filas del índice: el de la
+      tabla en un índice completo, menos en uno parcial (migración 12), por
+      eso se toma el mayor.
+    - Con filtros se extrapola la densidad de la primera página sobre el rango de ids.
+    """
+    if len(primera_pagina) < limite:
+        return len(primera_pagina)
+
+    if where.strip() == "WHERE 1=1":
+        try:
+            fila = conn.execute(
+                "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = 'productos'"
+            ).fetchone()
+            if fila[0] is not None:
+                return fila[0]
+        except sqlite3.Error:
+            pass  # La tabla sqlite_stat1 no existe hasta correr ANALYZE
+        return conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+
+    ultimo_id = primera_pagina[-1][0]
+    tramo_visto = ultimo_id - id_min + 1
+    tramo_total = id_max - id_min + 1
+    return max(len(primera_pagina), round(len(primera_pagina) * tramo_total / tramo_visto))
+
+
+def resumen_productos(conn, where, params, primera_pagina, limite, orden=None, descendente=False):
+    """
+    Rango de ids y total estimado que la lista pide junto con su primera página
+    ('primera_pagina' es la que trajo pagina_productos con ese orden).
+    """
+    id_min, id_max = rango_ids_productos(conn, where, params)
+    # La estimación extrapola sobre ids: necesita la primera página en orden de id
+    muestra = primera_pagina if (orden or "id", descendente) == ("id", False) else \
+        pagina_productos(conn, where, params, "inicio", None, limite)
+    total = estimar_total_productos(conn, where, params, muestra, limite, id_min, id_max)
+    return {"id_min": id_min, "id_max": id_max, "total": total}
+
+
+# --- Consultas de la lista de almacenes ---
+
+def filtros_almacenes(nombre="", usuario_mod="", fecha_desde="", fecha_hasta="", usar_fts=False):
+    """Igual que filtros_productos, para la ventana de filtros de almacenes."""
+    where = "WHERE 1=1"
+    params = []
+
+    expresion = expresion_fts("nombre", nombre) if (nombre and usar_fts) else None
+    if expresion:
+        where += " AND id IN (SELECT rowid FROM almacenes_fts WHERE almacenes_fts MATCH ?)"
+        params.append(expresion)
+    elif nombre:
+        where += " AND nombre LIKE ?"
+        params.append(f"%{nombre}%")
+
+    historial, params_historial = filtro_historial("almacenes", "id", usuario_mod, fecha_desde, fecha_hasta)
+    if historial:
+        where += f" AND {historial}"
+        params += params_historial
+    elif usuario_mod:
+        where += " AND ultimo_usuario_en_modificar LIKE ?"
+        params.append(f"%{usuario_mod}%")
+
+    return where, params
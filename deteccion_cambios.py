@@ -0,0 +1,94 @@
+import sqlite3
+import json
+
+from base_datos import PRAGMAS_CONEXION
+
+# --- Cambios hechos desde otros equipos ---
+# Las listas se actualizan solas con lo que edita este programa (App.publicar_cambio),
+# pero no se enteran de lo que guardan otros. DetectorCambios lo revisa cada
+# INTERVALO_MS con una conexión propia:
+#   - PRAGMA data_version cambia solo cuando OTRA conexión hizo commit; si no
+#     cambió, la revisión cuesta esa sola consulta, sin leer ninguna tabla.
+#   - Si cambió, se leen las filas de historial_cambios posteriores a la última
+#     vista. El id del historial sirve de marca: siempre crece, incluye los
+#     borrados y no depende del reloj de cada equipo (fecha_ultima_modificacion
+#     sí: dos equipos con la hora distinta se saltarían cambios).
+# Las escrituras de este mismo programa se reconocen por su (usuario, fecha):
+# App reparte la fecha antes de mandarlas (App.fecha_escritura_propia) y todas
+# las filas de una escritura masiva llevan la misma. No basta con el id del
+# registro: otro equipo pudo editar el mismo producto entre dos revisiones.
+
+INTERVALO_MS = 2000
+MAX_CAMBIOS = 1000   # Más filas que esto desde la última revisión: se recarga la lista completa
+
+SQL_ULTIMO_CAMBIO = "SELECT IFNULL(MAX(id), 0) FROM historial_cambios"
+SQL_CAMBIOS_DESDE = """
+    SELECT id, tabla, registro_id, operacion
+    FROM historial_cambios
+    WHERE id > ? AND id <= ?
+      AND (IFNULL(usuario, ''), fecha) NOT IN (SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]')
+                                               FROM json_each(?))
+    ORDER BY id
+    LIMIT ?
+"""
+
+
+def _combinar(anterior, operacion):
+    """Operación neta de una fila con varios cambios: insertada y luego editada sigue siendo nueva."""
+    if operacion == "migrado":
+        operacion = "actualizado"
+    if anterior == "insertado" and operacion == "actualizado":
+        return "insertado"
+    return operacion
+
+
+class DetectorCambios:
+    """
+    Conexión dedicada que sondea PRAGMA data_version. Se usa desde un solo
+    hilo a la vez (App manda cada revisión al ejecutor y espera a que termine
+    antes de mandar la siguiente).
+    """
+
+    def __init__(self, ruta_db):
+        self.conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        for pragma in PRAGMAS_CONEXION:
+            self.conn.execute(pragma)
+        self.version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self.marca = self.conn.execute(SQL_ULTIMO_CAMBIO).fetchone()[0]
+        self.revisiones = 0
+        self.con_cambios = 0
+
+    def revisar(self, propias=()):
+        """
+        Devuelve None si nadie más escribió, o {tabla: {registro_id: operacion}}.
+        Una tabla con valor None tuvo demasiados cambios para aplicarlos uno por uno.
+        'propias': pares (usuario, fecha) de escrituras masivas propias, que se saltan.
+        """
+        self.revisiones += 1
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.version:
+            return None
+        self.version = version
+
+        # Hasta 'ultimo' se revisa todo: lo que no sale en 'filas' era propio
+        ultimo = self.conn.execute(SQL_ULTIMO_CAMBIO).fetchone()[0]
+        filas = self.conn.execute(SQL_CAMBIOS_DESDE, (self.marca, ultimo, json.dumps(list(propias)),
+                                                      MAX_CAMBIOS + 1)).fetchall()
+        if not filas:
+            self.marca = ultimo
+            return None   # Commits propios o que no tocan productos ni almacenes (inicio de sesión, etc.)
+        self.con_cambios += 1
+
+        if len(filas) > MAX_CAMBIOS:
+            self.marca = ultimo
+            return {"productos": None, "almacenes": None}
+
+        cambios = {}
+        for id_, tabla, registro_id, operacion in filas:
+            por_tabla = cambios.setdefault(tabla, {})
+            por_tabla[registro_id] = _combinar(por_tabla.get(registro_id), operacion)
+        self.marca = ultimo
+        return cambios
+
+    def cerrar(self):
+        self.conn.close()
@@ -0,0 +1,193 @@
+import sqlite3
+import sys
+import threading
+import queue
+import time
+
+from base_datos import reintentar_si_ocupada
+
+
+class ConsultaCancelada(Exception):
+    """Se lanza dentro de un hilo de trabajo cuando la tarea fue cancelada."""
+
+
+class Tarea:
+    """Una unidad de trabajo enviada al ejecutor."""
+
+    def __init__(self, funcion, al_terminar=None, al_error=None, al_progreso=None, grupo=None, origen=None,
+                 reintentos=0):
+        self.funcion = funcion
+        self.al_terminar = al_terminar
+        self.al_error = al_error
+        self.al_progreso = al_progreso
+        self.grupo = grupo
+        self.origen = origen   # Página que envió la tarea (para las trazas de SQL)
+        self.reintentos = reintentos   # Veces que se repite si la base está ocupada
+
+        self.cancelada = False
+        self.inicio = None
+        self.pasos = 0   # Pasos de la VM de SQLite ejecutados (aprox. el avance)
+
+    def cancelar(self):
+        self.cancelada = True
+
+    def transcurrido(self):
+        if self.inicio is None:
+            return 0.0
+        return time.perf_counter() - self.inicio
+
+    def revisar_cancelacion(self):
+        """Para funciones largas en Python: cortar el trabajo si ya no se necesita."""
+        if self.cancelada:
+            raise ConsultaCancelada()
+
+
+class EjecutorConsultas:
+    """
+    Ejecuta el SQL en hilos de trabajo para no bloquear el mainloop de Tk.
+
+    - 'enviar()' encola una tarea en una cola acotada.
+    - La función recibe (conn, tarea) y corre en un hilo con una conexión del pool.
+    - Los resultados vuelven al hilo de Tk sondeando con 'after()'.
+    - Una tarea nueva de un mismo 'grupo' cancela la anterior (por ejemplo,
+      una búsqueda nueva cancela la que sigue en curso).
+    - Con 'reintentos' la función se repite completa si falla porque otro
+      proceso tiene la base ocupada (solo para funciones que hacen un único
+      commit al final, como las escrituras de los formularios).
+    """
+
+    def __init__(self, pool, widget, num_hilos=2, max_pendientes=32, intervalo_ms=50, origen=None):
+        self.pool = pool
+        self.widget = widget
+        self.intervalo_ms = intervalo_ms
+        self.origen = origen   # Función que dice qué página está activa al enviar
+
+        self._pendientes = queue.Queue(maxsize=max_pendientes)
+        self._resultados = queue.Queue()
+        self._grupos = {}
+        self._en_curso = set()
+        self._lock = threading.Lock()
+        self._activo = True
+
+        self._hilos = []
+        for i in range(num_hilos):
+            hilo = threading.Thread(target=self._trabajar, name=f"ejecutor-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+        self.widget.after(self.intervalo_ms, self._revisar_resultados)
+
+    def enviar(self, funcion, al_terminar=None, al_error=None, al_progreso=None, grupo=None, reintentos=0):
+        """Encola 'funcion(conn, tarea)'. Los callbacks se ejecutan en el hilo de Tk."""
+        tarea = Tarea(funcion, al_terminar, al_error, al_progreso, grupo,
+                      origen=self.origen() if self.origen else None, reintentos=reintentos)
+
+        if grupo is not None:
+            anterior = self._grupos.get(grupo)
+            if anterior is not None:
+                anterior.cancelar()
+            self._grupos[grupo] = tarea
+
+        try:
+            self._pendientes.put_nowait(tarea)
+        except queue.Full:
+            raise sqlite3.OperationalError("Hay demasiadas consultas en espera, intente de nuevo")
+        return tarea
+
+    # --- Hilos de trabajo ---
+
+    def _trabajar(self):
+        while True:
+            tarea = self._pendientes.get()
+            if tarea is None:
+                break
+            if tarea.cancelada:
+                continue
+
+            tarea.inicio = time.perf_counter()
+            with self._lock:
+                self._en_curso.add(tarea)
+            try:
+                with self.pool.conexion() as conn:
+                    conn.set_progress_handler(lambda: self._progreso(tarea), 1000)
+                    instrumentada = hasattr(conn, "pagina")
+                    if instrumentada:
+                        conn.pagina = tarea.origen
+                    try:
+                        if tarea.reintentos:
+                            resultado = reintentar_si_ocupada(conn, lambda: tarea.funcion(conn, tarea),
+                                                              tarea.reintentos)
+                        else:
+                            resultado = tarea.funcion(conn, tarea)
+                    finally:
+                        conn.set_progress_handler(None, 0)
+                        if instrumentada:
+                            conn.pagina = None
+                self._resultados.put((tarea, True, resultado))
+            except Exception as e:
+                self._resultados.put((tarea, False, e))
+            finally:
+                with self._lock:
+                    self._en_curso.discard(tarea)
+
+    @staticmethod
+    def _progreso(tarea):
+        # Devolver un valor distinto de cero interrumpe la consulta en SQLite
+        tarea.pasos += 1
+        return 1 if tarea.cancelada else 0
+
+    # --- Hilo de Tk ---
+
+    def _llamar(self, funcion, valor):
+        # Un error en una función de la página (p. ej. una etiqueta de una
+        # ventana ya cerrada) se informa como cualquier error de Tk y no
+        # detiene la entrega de los demás resultados
+        try:
+            funcion(valor)
+        except Exception:
+            self.widget.report_callback_exception(*sys.exc_info())
+
+    def _revisar_resultados(self):
+        if not self._activo:
+            return
+        # Se programa primero: pase lo que pase abajo, la revisión sigue
+        self.widget.after(self.intervalo_ms, self._revisar_resultados)
+
+        while True:
+            try:
+                tarea, ok, valor = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            if tarea.grupo is not None and self._grupos.get(tarea.grupo) is tarea:
+                del self._grupos[tarea.grupo]
+            if tarea.cancelada:
+                continue  # Ya nadie espera este resultado
+            if ok:
+                if tarea.al_terminar:
+                    self._llamar(tarea.al_terminar, valor)
+            elif tarea.al_error:
+                self._llamar(tarea.al_error, valor)
+            else:
+                print(f"Error en tarea de fondo: {valor}")
+
+        with self._lock:
+            en_curso = list(self._en_curso)
+        for tarea in en_curso:
+            if tarea.al_progreso and not tarea.cancelada:
+                self._llamar(tarea.al_progreso, tarea.transcurrido())
+
+    def cancelar_grupo(self, grupo):
+        tarea = self._grupos.pop(grupo, None)
+        if tarea is not None:
+            tarea.cancelar()
+
+    def cerrar(self):
+        """Cancela lo pendiente y detiene los hilos."""
+        self._activo = False
+        for tarea in list(self._grupos.values()):
+            tarea.cancelar()
+        for _ in self._hilos:
+            try:
+                self._pendientes.put_nowait(None)
+            except queue.Full:
+                pass
@@ -0,0 +1,182 @@
+import sqlite3
+import os
+import json
+import uuid
+import hashlib
+import datetime
+
+from consultas import SQL_INSERTAR_PRODUCTO
+
+# --- Escritura diferida (captura rápida de productos) ---
+# En modo normal cada alta de FormularioEdicionProducto es su propia
+# transacción: un commit (fsync) por producto, que sobre una carpeta de red
+# se nota entre captura y captura. En modo diferido el alta:
+#   1. se escribe en un diario local (JSON Lines, con fsync en el disco de
+#      este equipo, no en el de la base),
+#   2. queda en memoria como pendiente,
+#   3. y un vaciado la aplica junto con las demás en UNA transacción, cada
+#      INTERVALO_MS o en cuanto se juntan MAX_LOTE.
+# Cada entrada lleva una clave única que se inserta en escrituras_diferidas
+# dentro de la misma transacción: si el programa se cae después del commit
+# pero antes de limpiar el diario, al volver a abrir la entrada se reconoce
+# como ya aplicada y no se duplica el producto.
+
+INTERVALO_MS = 500
+MAX_LOTE = 200
+DIAS_CLAVES = 30     # Las claves aplicadas más viejas que esto se borran al abrir
+
+SQL_MARCAR_APLICADA = "INSERT OR IGNORE INTO escrituras_diferidas (clave, fecha) VALUES (?, ?)"
+
+
+def ruta_diario_local(ruta_db):
+    """
+    Diario en la carpeta local del usuario (LOCALAPPDATA en Windows), uno por
+    base: el nombre lleva un hash de la ruta completa de la base.
+    """
+    carpeta = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    ruta_db = os.path.abspath(ruta_db)
+    huella = hashlib.sha256(ruta_db.encode()).hexdigest()[:8]
+    nombre = os.path.splitext(os.path.basename(ruta_db))[0]
+    return os.path.join(carpeta, f"{nombre}.{huella}.pendientes.jsonl")
+
+
+class DiarioEscrituras:
+    """Archivo local con las altas que todavía no se confirman en la base."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def agregar(self, entrada):
+        """Agrega una entrada y espera a que llegue al disco (fsync)."""
+        with open(self.ruta, "a", encoding="utf-8") as archivo:
+            archivo.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+    def leer(self):
+        """Entradas guardadas. Una última línea incompleta (caída a media escritura) se ignora."""
+        if not os.path.exists(self.ruta):
+            return []
+        entradas = []
+        with open(self.ruta, encoding="utf-8") as archivo:
+            for numero, linea in enumerate(archivo, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    entradas.append(json.loads(linea))
+                except json.JSONDecodeError:
+                    print(f"Diario de escrituras: línea {numero} incompleta, se ignora")
+        return entradas
+
+    def reescribir(self, entradas):
+        """Reemplaza el diario por 'entradas' de forma atómica (archivo temporal + os.replace)."""
+        if not entradas:
+            if os.path.exists(self.ruta):
+                os.remove(self.ruta)
+            return
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            for entrada in entradas:
+                archivo.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(temporal, self.ruta)
+
+
+def aplicar_lote(conn, lote):
+    """
+    Aplica las entradas de 'lote' en una sola transacción IMMEDIATE. Cada una
+    va en su propio SAVEPOINT: si una viola una restricción se descarta sola
+    y las demás siguen. Corre en un hilo de trabajo (función del ejecutor).
+
+    Devuelve (aplicadas, rechazadas): aplicadas es una lista de
+    (clave, nuevo_id), con nuevo_id None si la clave ya se había aplicado
+    antes; rechazadas es una lista de (entrada, mensaje).
+    """
+    ahora = datetime.datetime.now().isoformat()
+    aplicadas, rechazadas = [], []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for entrada in lote:
+            conn.execute("SAVEPOINT entrada")
+            try:
+                if conn.execute(SQL_MARCAR_APLICADA, (entrada["clave"], ahora)).rowcount == 0:
+                    aplicadas.append((entrada["clave"], None))
+                else:
+                    cursor = conn.execute(SQL_INSERTAR_PRODUCTO, entrada["valores"])
+                    aplicadas.append((entrada["clave"], cursor.lastrowid))
+            except sqlite3.IntegrityError as e:
+                conn.execute("ROLLBACK TO entrada")
+                rechazadas.append((entrada, str(e)))
+            conn.execute("RELEASE entrada")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return aplicadas, rechazadas
+
+
+class ColaEscrituras:
+    """
+    Altas pendientes del modo diferido. Todos los métodos se llaman desde el
+    hilo de Tk; solo aplicar_lote() corre en el ejecutor.
+
+    - encolar_producto() escribe en el diario antes de devolver.
+    - tomar_lote() pasa hasta MAX_LOTE pendientes a "en vuelo".
+    - confirmar() / devolver() cierran el vaciado según cómo terminó.
+    """
+
+    def __init__(self, ruta_diario, max_lote=MAX_LOTE):
+        self.diario = DiarioEscrituras(ruta_diario)
+        self.max_lote = max_lote
+        self._pendientes = self.diario.leer()   # Lo que quedó de una sesión anterior
+        self._en_vuelo = []
+        self.recuperadas = len(self._pendientes)
+        self.aplicadas = 0
+        self.rechazadas = 0
+
+    def encolar_producto(self, valores):
+        """'valores': los parámetros de SQL_INSERTAR_PRODUCTO. Devuelve la clave de la entrada."""
+        entrada = {"clave": uuid.uuid4().hex, "tipo": "producto", "valores": list(valores)}
+        self.diario.agregar(entrada)
+        self._pendientes.append(entrada)
+        return entrada["clave"]
+
+    def pendientes(self):
+        return len(self._pendientes) + len(self._en_vuelo)
+
+    def vaciando(self):
+        return bool(self._en_vuelo)
+
+    def lote_lleno(self):
+        return len(self._pendientes) >= self.max_lote
+
+    def tomar_lote(self, todo=False):
+        """Lote a aplicar. Con todo=True incluye también lo que está en vuelo (al cerrar)."""
+        if todo:
+            self._en_vuelo = self._en_vuelo + self._pendientes
+            self._pendientes = []
+            return list(self._en_vuelo)
+        self._en_vuelo = self._pendientes[:self.max_lote]
+        self._pendientes = self._pendientes[self.max_lote:]
+        return list(self._en_vuelo)
+
+    def confirmar(self, aplicadas, rechazadas):
+        """El lote en vuelo ya está en la base: se quita del diario."""
+        self.aplicadas += sum(1 for _, nuevo_id in aplicadas if nuevo_id is not None)
+        self.rechazadas += len(rechazadas)
+        for entrada, mensaje in rechazadas:
+            print(f"Escritura diferida rechazada ({entrada['valores'][0]}): {mensaje}")
+        self._en_vuelo = []
+        self.diario.reescribir(self._pendientes)
+
+    def devolver(self):
+        """El vaciado falló (base ocupada, red caída): el lote vuelve al frente de la cola."""
+        self._pendientes = self._en_vuelo + self._pendientes
+        self._en_vuelo = []
+
+
+def limpiar_claves_viejas(conn, dias=DIAS_CLAVES):
+    """Borra las claves aplicadas hace más de 'dias' (ningún diario local es tan viejo). No hace commit."""
+    limite = (datetime.datetime.now() - datetime.timedelta(days=dias)).isoformat()
+    return conn.execute("DELETE FROM escrituras_diferidas WHERE fecha < ?", (limite,)).rowcount
@@ -0,0 +1,127 @@
+import csv
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+TAM_BLOQUE = 2000
+
+# --- XLSX mínimo (sin dependencias): un libro con una hoja, escrito en streaming ---
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Datos" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+# Caracteres de control que XML no permite
+_CARACTERES_INVALIDOS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _celda_xlsx(valor):
+    if valor is None:
+        return "<c/>"
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f"<c><v>{valor}</v></c>"
+    texto = escape(_CARACTERES_INVALIDOS.sub("", str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xlsx(valores):
+    return "<row>" + "".join(_celda_xlsx(v) for v in valores) + "</row>"
+
+
+class _EscritorXlsx:
+    def __init__(self, ruta):
+        self.zip = zipfile.ZipFile(ruta, "w", compression=zipfile.ZIP_DEFLATED)
+        self.zip.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        self.zip.writestr("_rels/.rels", _RELS)
+        self.zip.writestr("xl/workbook.xml", _WORKBOOK)
+        self.zip.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        # La hoja se escribe directamente al zip, fila por fila
+        self.hoja = self.zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._escribir('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                       '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                       '<sheetData>')
+
+    def _escribir(self, texto):
+        self.hoja.write(texto.encode("utf-8"))
+
+    def escribir_filas(self, filas):
+        self._escribir("".join(_fila_xlsx(f) for f in filas))
+
+    def cerrar(self):
+        self._escribir("</sheetData></worksheet>")
+        self.hoja.close()
+        self.zip.close()
+
+    def abortar(self):
+        self.hoja.close()
+        self.zip.close()
+
+
+class _EscritorCsv:
+    def __init__(self, ruta):
+        # utf-8-sig para que Excel reconozca los acentos
+        self.archivo = open(ruta, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.archivo)
+
+    def escribir_filas(self, filas):
+        self.writer.writerows(filas)
+
+    def cerrar(self):
+        self.archivo.close()
+
+    abortar = cerrar
+
+
+def exportar_consulta(conn, sql, params, ruta, encabezados, tam_bloque=TAM_BLOQUE, al_progreso=None):
+    """
+    Ejecuta la consulta y escribe el resultado en 'ruta' (.csv o .xlsx) leyendo
+    con fetchmany: en memoria solo hay un bloque de filas a la vez.
+
+    al_progreso(filas_escritas) se llama después de cada bloque; si lanza una
+    excepción (por ejemplo, al cancelar) el archivo parcial se borra.
+    Devuelve el número de filas exportadas.
+    """
+    if os.path.splitext(ruta)[1].lower() == ".xlsx":
+        escritor = _EscritorXlsx(ruta)
+    else:
+        escritor = _EscritorCsv(ruta)
+
+    total = 0
+    try:
+        escritor.escribir_filas([encabezados])
+        cursor = conn.execute(sql, params)
+        while True:
+            filas = cursor.fetchmany(tam_bloque)
+            if not filas:
+                break
+            escritor.escribir_filas(filas)
+            total += len(filas)
+            if al_progreso:
+                al_progreso(total)
+    except BaseException:
+        escritor.abortar()
+        os.remove(ruta)
+        raise
+
+    escritor.cerrar()
+    return total
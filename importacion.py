@@ -0,0 +1,163 @@
+import sqlite3
+import csv
+import json
+import os
+import time
+import datetime
+import argparse
+
+from base_datos import PRAGMAS_CONEXION
+from consultas import SQL_INSERTAR_PRODUCTO, a_centavos, a_cantidad
+from setup_database import aplicar_migraciones
+
+DB_NAME = "InventarioBD_2.db"
+
+# Columnas esperadas en el archivo (encabezados del CSV o llaves del JSON)
+COLUMNAS = ("nombre", "precio", "cantidad", "departamento", "almacen")
+MAX_ERRORES_GUARDADOS = 100
+
+
+def leer_registros(ruta, formato=None):
+    """
+    Lee el archivo de forma incremental (fila por fila, nunca completo en memoria).
+    formato: "csv" o "jsonl"; si es None se deduce de la extensión.
+    Genera tuplas (numero_de_linea, dict). Una línea JSON mal formada se
+    entrega como ValueError en lugar del dict, para que quien lee la rechace
+    con su número de línea y siga con las demás.
+    """
+    if formato is None:
+        formato = "jsonl" if os.path.splitext(ruta)[1].lower() in (".jsonl", ".json", ".ndjson") else "csv"
+
+    with open(ruta, encoding="utf-8-sig", newline="") as archivo:
+        if formato == "csv":
+            lector = csv.DictReader(archivo)
+            for numero, registro in enumerate(lector, start=2):  # La línea 1 es el encabezado
+                yield numero, {k.strip().lower(): v for k, v in registro.items() if k}
+        else:
+            for numero, linea in enumerate(archivo, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    yield numero, json.loads(linea)
+                except json.JSONDecodeError as e:
+                    yield numero, ValueError(f"JSON mal formado ({e.msg})")
+
+
+def validar_registro(registro, almacenes_por_nombre):
+    """Convierte un registro crudo en la tupla a insertar. Lanza ValueError si no es válido."""
+    nombre = str(registro.get("nombre") or "").strip()
+    departamento = str(registro.get("departamento") or "").strip()
+    nombre_almacen = str(registro.get("almacen") or "").strip()
+
+    if not nombre:
+        raise ValueError("falta el nombre")
+    if not departamento:
+        raise ValueError("falta el departamento")
+
+    almacen_id = almacenes_por_nombre.get(nombre_almacen.lower())
+    if almacen_id is None:
+        raise ValueError(f"almacén desconocido '{nombre_almacen}'")
+
+    precio = a_centavos(registro.get("precio"))
+    cantidad = a_cantidad(registro.get("cantidad"))
+
+    return nombre, precio, cantidad, departamento, almacen_id
+
+
+def importar_productos(conn, ruta, usuario, formato=None, tam_lote=5000, al_progreso=None, fecha=None):
+    """
+    Importa productos desde un CSV o JSON Lines.
+
+    - Los nombres de almacén se resuelven con UN diccionario cargado al inicio.
+    - Se inserta con executemany en lotes de 'tam_lote', cada lote en su propia
+      transacción explícita (un solo commit/fsync por lote).
+    - Se llenan las columnas de auditoría con 'fecha' (por omisión, ahora) y 'usuario'.
+    - al_progreso(procesadas) se llama después de cada lote (puede lanzar una
+      excepción para cancelar; los lotes ya confirmados se quedan).
+
+    Devuelve un dict con insertadas, rechazadas, errores, segundos y filas_por_segundo.
+    """
+    inicio = time.perf_counter()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT id, nombre FROM almacenes")
+    almacenes_por_nombre = {nombre.strip().lower(): id_ for id_, nombre in cursor.fetchall()}
+
+    fecha = fecha or datetime.datetime.now().isoformat()
+    insertadas = 0
+    rechazadas = 0
+    errores = []
+    lote = []
+
+    def escribir_lote():
+        conn.execute("BEGIN")
+        try:
+            cursor.executemany(SQL_INSERTAR_PRODUCTO, lote)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    for numero, registro in leer_registros(ruta, formato):
+        try:
+            if isinstance(registro, ValueError):
+                raise registro
+            lote.append(validar_registro(registro, almacenes_por_nombre) + (fecha, usuario))
+        except (ValueError, AttributeError) as e:
+            rechazadas += 1
+            if len(errores) < MAX_ERRORES_GUARDADOS:
+                errores.append(f"Línea {numero}: {e}")
+            continue
+
+        if len(lote) >= tam_lote:
+            escribir_lote()
+            insertadas += len(lote)
+            lote = []
+            if al_progreso:
+                al_progreso(insertadas + rechazadas)
+
+    if lote:
+        escribir_lote()
+        insertadas += len(lote)
+        if al_progreso:
+            al_progreso(insertadas + rechazadas)
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "insertadas": insertadas,
+        "rechazadas": rechazadas,
+        "errores": errores,
+        "segundos": segundos,
+        "filas_por_segundo": (insertadas + rechazadas) / segundos if segundos else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa productos desde un CSV o JSON Lines.")
+    parser.add_argument("archivo")
+    parser.add_argument("--usuario", required=True, help="Usuario que se registra en la auditoría")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--formato", choices=("csv", "jsonl"))
+    parser.add_argument("--lote", type=int, default=5000, help="Filas por transacción")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    try:
+        aplicar_migraciones(conn)   # Columnas de auditoría y triggers del historial que espera la importación
+        resultado = importar_productos(
+            conn, args.archivo, args.usuario, args.formato, args.lote,
+            al_progreso=lambda n: print(f"  {n} filas procesadas...", end="\r"))
+    finally:
+        conn.close()
+
+    print(f"\nInsertadas: {resultado['insertadas']}")
+    print(f"Rechazadas: {resultado['rechazadas']}")
+    for error in resultado["errores"]:
+        print(f"  {error}")
+    print(f"Tiempo total: {resultado['segundos']:.2f} s ({resultado['filas_por_segundo']:.0f} filas/s)")
+
+
+if __name__ == "__main__":
+    main()
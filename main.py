@@ -1,4 +1,5 @@
 import tkinter as tk
+from tkinter import filedialog, messagebox
 import ttkbootstrap as ttk
 from ttkbootstrap import Style 
 from PIL import Image, ImageTk
@@ -7,6 +8,33 @@ import sqlite3
 import hashlib
 import datetime
 import sys 
+import time
+import bisect
+import collections
+from base_datos import PoolConexiones, CacheAlmacenes, REINTENTOS_OCUPADA, reintentar_si_ocupada
+from ejecutor import EjecutorConsultas
+from trazas import RegistroConsultas, LIMITES_HISTOGRAMA_MS
+from setup_database import aplicar_migraciones
+from importacion import importar_productos
+from exportacion import exportar_consulta
+from operaciones_masivas import aplicar_operacion_masiva, NOMBRES_OPERACIONES
+from traspasos import traspasar, leer_lineas
+from escritura_diferida import (ColaEscrituras, aplicar_lote, limpiar_claves_viejas, ruta_diario_local,
+                                INTERVALO_MS, MAX_LOTE)
+from deteccion_cambios import DetectorCambios, INTERVALO_MS as INTERVALO_DETECCION_MS
+from alertas_existencia import (RevisorExistencias, productos_bajo_reorden, umbrales_departamento,
+                                fijar_umbral_departamento, INTERVALO_MS as INTERVALO_ALERTAS_MS,
+                                LIMITE_LISTA as LIMITE_LISTA_ALERTAS)
+from busqueda_incremental import (CacheBusquedas, clave_busqueda, consultar_busqueda, ordenar_filas,
+                                  pagina_en_memoria)
+from consultas import (filtros_productos, pagina_productos, resumen_productos, nombres_de_almacen, fila_producto, orden_productos, orden_almacenes, ORDEN_PRODUCTOS,
+                       filtros_almacenes, indice_fts_disponible, SELECT_ALMACENES, SELECT_PRODUCTOS,
+                       SQL_RESUMEN_ALMACENES,
+                       SQL_LOGIN, SQL_REGISTRAR_INICIO_SESION, SQL_PRODUCTO_POR_ID, SQL_INSERTAR_PRODUCTO,
+                       SQL_ACTUALIZAR_PRODUCTO, SQL_ELIMINAR_PRODUCTO, SQL_ALMACEN_POR_ID,
+                       SQL_INSERTAR_ALMACEN, SQL_ACTUALIZAR_ALMACEN, SQL_ELIMINAR_ALMACEN, eliminar_con_autor,
+                       actualizar_con_version, ConflictoDeVersion, puede_editar, a_centavos, a_cantidad,
+                       texto_precio)
 
 # --- FUNCIÓN DE AYUDA PARA PYINSTALLER ---
 def resource_path(relative_path):
@@ -19,6 +47,10 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
+RETARDO_BUSQUEDA_MS = 250   # Pausa al escribir antes de lanzar la búsqueda
+MAX_AVISOS_POR_FILA = 10    # Más altas que esto en un vaciado: la lista se refresca completa
+MAX_ERRORES_IMPORTACION = 10   # Filas rechazadas que se muestran al terminar una importación
+
 # --- Constante de Base de Datos ---
 DB_NAME = resource_path("InventarioBD_2.db")
 
@@ -26,6 +58,332 @@ def hash_password(password):
     """Cifra la contraseña usando SHA256."""
     return hashlib.sha256(password.encode()).hexdigest()
 
+# --- Tabla virtual: solo mantiene en el Treeview una ventana acotada de filas ---
+
+class TablaVirtual:
+    """
+    Envuelve un Treeview para que solo materialice una ventana de filas.
+    Las páginas se piden a 'fuente(modo, clave, limite, al_recibir, al_fallar)'
+    conforme el usuario se desplaza; la fuente puede responder más tarde (desde
+    el ejecutor de consultas). La barra de desplazamiento refleja la posición
+    dentro del total estimado, no solo dentro de la ventana cargada.
+
+    La primera columna de cada fila debe ser su id (se usa como iid y como llave).
+    """
+
+    def __init__(self, tree, scrollbar, fuente, tam_pagina=100, max_filas=400, al_error=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fuente = fuente
+        self.al_error = al_error
+        self.tam_pagina = tam_pagina
+        self.max_filas = max_filas
+
+        self.desplazamiento = 0     # Posición (estimada) de la primera fila cargada
+        self.total_estimado = 0
+        self.id_min = None
+        self.id_max = None
+        self.hay_mas_atras = False
+        self.hay_mas_adelante = False
+        self.cargando = False
+        # True si la lista se ordena por otra columna: ya no se puede ubicar
+        # una fila ni un salto interpolando ids, se usa su posición
+        self.ordenada = False
+
+        self.tree.configure(yscrollcommand=self._al_desplazar)
+        self.scrollbar.configure(command=self._al_mover_scrollbar)
+
+    # --- Carga de datos ---
+
+    def reiniciar(self, al_terminar=None):
+        """Vacía la tabla y carga la primera página de la consulta actual."""
+
+        def recibir(filas, resumen):
+            self.id_min = resumen["id_min"]
+            self.id_max = resumen["id_max"]
+            self.total_estimado = resumen["total"]
+            self._reemplazar(filas, 0)
+            self.hay_mas_atras = False
+            self.hay_mas_adelante = len(filas) == self.tam_pagina
+            self.cargando = False
+            if al_terminar:
+                al_terminar(self.total_estimado, not self.hay_mas_adelante)
+
+        self._pedir("inicio", None, recibir)
+
+    def _pedir(self, modo, clave, recibir):
+        """Pide una página a la fuente; si falla, libera la tabla para reintentar."""
+
+        def fallar(error):
+            self.cargando = False
+            if self.al_error:
+                self.al_error(error)
+
+        self.cargando = True
+        try:
+            self.fuente(modo, clave, self.tam_pagina, recibir, fallar)
+        except Exception:
+            self.cargando = False
+            raise
+
+    def _reemplazar(self, filas, desplazamiento):
+        # Un solo 'delete' con todos los items en vez de uno por uno
+        self.tree.delete(*self.tree.get_children())
+        for row in filas:
+            self.tree.insert(parent="", index="end", iid=str(row[0]), values=row)
+        self.desplazamiento = desplazamiento
+        self.tree.yview_moveto(0)
+
+    def _cargar_adelante(self):
+        hijos = self.tree.get_children()
+        if not hijos:
+            return
+
+        def recibir(filas, resumen=None):
+            self.cargando = False
+            arriba = self._indice_superior()
+            for row in filas:
+                self.tree.insert(parent="", index="end", iid=str(row[0]), values=row)
+            self.hay_mas_adelante = len(filas) == self.tam_pagina
+
+            # Recortar por arriba para no pasar del máximo de filas vivas
+            hijos = self.tree.get_children()
+            sobrantes = len(hijos) - self.max_filas
+            if sobrantes > 0:
+                self.tree.delete(*hijos[:sobrantes])
+                self.desplazamiento += sobrantes
+                self.hay_mas_atras = True
+                self._mover_a_indice(arriba - sobrantes)
+
+            if not self.hay_mas_adelante:
+                # Llegamos al final: ahora el total es exacto
+                self.total_estimado = self.desplazamiento + len(self.tree.get_children())
+            self._actualizar_scrollbar()
+
+        self._pedir("despues", int(hijos[-1]), recibir)
+
+    def _cargar_atras(self):
+        hijos = self.tree.get_children()
+        if not hijos:
+            return
+
+        def recibir(filas, resumen=None):
+            self.cargando = False
+            arriba = self._indice_superior()
+            for row in reversed(filas):
+                self.tree.insert(parent="", index=0, iid=str(row[0]), values=row)
+            self.hay_mas_atras = len(filas) == self.tam_pagina
+            self.desplazamiento = max(0, self.desplazamiento - len(filas))
+            if not self.hay_mas_atras:
+                self.desplazamiento = 0
+
+            hijos = self.tree.get_children()
+            sobrantes = len(hijos) - self.max_filas
+            if sobrantes > 0:
+                self.tree.delete(*hijos[-sobrantes:])
+                self.hay_mas_adelante = True
+            self._mover_a_indice(arriba + len(filas))
+            self._actualizar_scrollbar()
+
+        self._pedir("antes", int(hijos[0]), recibir)
+
+    def saltar_a(self, fraccion):
+        """
+        Salta a una posición relativa (0..1). En orden por id se interpola el
+        id objetivo; con orden por columna se pide la fila en esa posición.
+        """
+        if self.id_min is None:
+            return
+
+        if self.ordenada:
+            modo = "posicion"
+            objetivo = min(round(fraccion * self.total_estimado), max(self.total_estimado - self.tam_pagina, 0))
+            hay_mas_atras = objetivo > 0
+            posicion = objetivo
+        else:
+            modo = "desde"
+            objetivo = int(self.id_min + fraccion * (self.id_max - self.id_min))
+            hay_mas_atras = objetivo > self.id_min
+            posicion = round(fraccion * self.total_estimado)
+
+        def recibir(filas, resumen=None):
+            self.cargando = False
+            self._reemplazar(filas, posicion)
+            self.hay_mas_atras = hay_mas_atras
+            self.hay_mas_adelante = len(filas) == self.tam_pagina
+            if not self.hay_mas_atras:
+                self.desplazamiento = 0
+            self._actualizar_scrollbar()
+
+        self._pedir(modo, objetivo, recibir)
+
+    # --- Cambios puntuales (sin recargar la ventana) ---
+
+    def quitar(self, clave):
+        """Quita una fila si está cargada."""
+        iid = str(clave)
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+            self.total_estimado = max(0, self.total_estimado - 1)
+            self._actualizar_scrollbar()
+
+    def poner_fila(self, fila, es_nueva=False):
+        """
+        Actualiza una fila en su lugar, o la inserta en orden si cae dentro de
+        la ventana cargada. Si cae fuera, aparecerá al desplazarse hasta ahí.
+        """
+        iid = str(fila[0])
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=fila)
+            return
+
+        if es_nueva:
+            self.total_estimado += 1
+        if self.ordenada:
+            # Su lugar depende de la columna de orden; aparecerá al desplazarse
+            self._actualizar_scrollbar()
+            return
+        claves = [int(h) for h in self.tree.get_children()]
+        pos = bisect.bisect_left(claves, fila[0])
+        if (pos == 0 and self.hay_mas_atras) or (pos == len(claves) and self.hay_mas_adelante):
+            self._actualizar_scrollbar()
+            return
+        self.tree.insert(parent="", index=pos, iid=iid, values=fila)
+        self._actualizar_scrollbar()
+
+    def refrescar(self):
+        """Vuelve a leer la ventana actual desde su primera fila (p. ej. si cambió un almacén)."""
+        hijos = self.tree.get_children()
+        if not hijos or self.cargando:
+            return
+
+        def recibir(filas, resumen=None):
+            self.cargando = False
+            arriba = self._indice_superior()
+            self._reemplazar(filas, self.desplazamiento)
+            self.hay_mas_adelante = len(filas) == self.tam_pagina
+            self._mover_a_indice(arriba)
+            self._actualizar_scrollbar()
+
+        self._pedir("desde", int(hijos[0]), recibir)
+
+    # --- Desplazamiento ---
+
+    def _indice_superior(self):
+        n = len(self.tree.get_children())
+        return round(self.tree.yview()[0] * n)
+
+    def _mover_a_indice(self, indice):
+        n = len(self.tree.get_children())
+        if n:
+            self.tree.yview_moveto(max(0, indice) / n)
+
+    def _al_desplazar(self, first, last):
+        """yscrollcommand del Treeview: decide si hay que pedir otra página."""
+        self._actualizar_scrollbar(float(first), float(last))
+        if self.cargando:
+            return
+        if float(last) > 0.85 and self.hay_mas_adelante:
+            self._cargar_adelante()
+        elif float(first) < 0.15 and self.hay_mas_atras:
+            self._cargar_atras()
+
+    def _actualizar_scrollbar(self, first=None, last=None):
+        if first is None:
+            first, last = self.tree.yview()
+        n = len(self.tree.get_children())
+        total = max(self.total_estimado, self.desplazamiento + n, 1)
+        inicio = (self.desplazamiento + first * n) / total
+        fin = (self.desplazamiento + last * n) / total
+        self.scrollbar.set(min(inicio, 1.0), min(fin, 1.0))
+
+    def _al_mover_scrollbar(self, accion, *args):
+        """command de la Scrollbar: 'scroll' se delega, 'moveto' es global."""
+        if accion != "moveto":
+            self.tree.yview(accion, *args)
+            return
+
+        fraccion = float(args[0])
+        n = len(self.tree.get_children())
+        total = max(self.total_estimado, 1)
+        local = (fraccion * total - self.desplazamiento) / n if n else -1
+        if 0 <= local <= 1:
+            # El destino ya está dentro de la ventana cargada
+            self.tree.yview_moveto(local)
+        elif not self.cargando:
+            self.saltar_a(min(max(fraccion, 0.0), 1.0))
+
+
+# --- Exportación de la vista actual (compartida por las listas) ---
+
+def exportar_vista(pagina, sql, params):
+    """
+    Re-ejecuta la consulta actual de 'pagina' y la escribe en CSV/XLSX en
+    segundo plano. Mientras corre, el botón Exportar sirve para cancelar.
+    """
+    if pagina.tarea_exportacion is not None:
+        pagina.tarea_exportacion.cancelar()
+        pagina.tarea_exportacion = None
+        pagina.btn_exportar.config(text="📤 Exportar")
+        pagina.label_feedback.config(text="Exportación cancelada.", bootstyle="warning")
+        return
+
+    ruta = filedialog.asksaveasfilename(
+        parent=pagina, title="Exportar vista actual", defaultextension=".csv",
+        filetypes=[("CSV", "*.csv"), ("Excel", "*.xlsx")])
+    if not ruta:
+        return
+
+    encabezados = [pagina.titulos[col] for col in pagina.tree["columns"]]
+    avance = {"filas": 0}
+
+    def exportar(conn, tarea):
+        def progreso(filas):
+            avance["filas"] = filas
+            tarea.revisar_cancelacion()
+        return exportar_consulta(conn, sql, params, ruta, encabezados, al_progreso=progreso)
+
+    def terminar(total):
+        pagina.tarea_exportacion = None
+        pagina.btn_exportar.config(text="📤 Exportar")
+        pagina.label_feedback.config(text=f"Se exportaron {total} filas a {ruta}", bootstyle="success")
+
+    def fallar(e):
+        pagina.tarea_exportacion = None
+        pagina.btn_exportar.config(text="📤 Exportar")
+        pagina.label_feedback.config(text=f"Error al exportar: {e}", bootstyle="danger")
+
+    def mostrar_avance(transcurrido):
+        pagina.label_feedback.config(
+            text=f"Exportando... {avance['filas']} filas ({transcurrido:.1f} s)", bootstyle="secondary")
+
+    try:
+        pagina.tarea_exportacion = pagina.controller.ejecutor.enviar(
+            exportar, al_terminar=terminar, al_error=fallar, al_progreso=mostrar_avance)
+        pagina.btn_exportar.config(text="✖ Cancelar exportación")
+    except sqlite3.Error as e:
+        fallar(e)
+
+
+# --- Rango de fechas de los filtros (compartido por las listas) ---
+
+def campos_rango_fechas(master):
+    """
+    Dos selectores de fecha (desde / hasta) en una fila. Empiezan vacíos:
+    si se dejan así no se filtra por fecha. Devuelve las dos entradas de texto.
+    """
+    fila = ttk.Frame(master)
+    fila.pack(fill="x", pady=(0, 5))
+    entradas = []
+    for i, texto in enumerate(("Desde", "Hasta")):
+        ttk.Label(fila, text=f"{texto}:").grid(row=0, column=i * 2, sticky="w", padx=(0 if i == 0 else 10, 3))
+        selector = ttk.DateEntry(fila, dateformat="%Y-%m-%d", width=11)
+        selector.grid(row=0, column=i * 2 + 1, sticky="w")
+        selector.entry.delete(0, tk.END)
+        entradas.append(selector.entry)
+    return entradas
+
+
 # --- Página de Inicio de Sesión ---
 
 class LoginPage(ttk.Frame):
@@ -87,27 +445,24 @@ class LoginPage(ttk.Frame):
         password_cifrada = hash_password(password)
 
         try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
+            with self.controller.bd.conexion() as conn:
+                cursor = conn.cursor()
             
-            cursor.execute("SELECT CONTRASEÑA, rol, NOMBRE FROM usuarios WHERE NOMBRE = ?", (usuario,))
-            resultado = cursor.fetchone() 
-
-            if resultado and resultado[0] == password_cifrada:
-                self.label_error.config(text="")
-                user_role = resultado[1]
-                user_name_db = resultado[2]
-                now = datetime.datetime.now().isoformat()
-                cursor.execute('UPDATE usuarios SET "ULTIMO INICIO DE SESION" = ? WHERE NOMBRE = ?', (now, usuario))
-                conn.commit()
-                self.controller.login_exitoso(user_name_db, user_role)
-            else:
-                self.label_error.config(text="Usuario o contraseña incorrectos")
+                cursor.execute(SQL_LOGIN, (usuario,))
+                resultado = cursor.fetchone() 
+
+                if resultado and resultado[0] == password_cifrada:
+                    self.label_error.config(text="")
+                    user_role = resultado[1]
+                    user_name_db = resultado[2]
+                    now = datetime.datetime.now().isoformat()
+                    cursor.execute(SQL_REGISTRAR_INICIO_SESION, (now, usuario))
+                    conn.commit()
+                    self.controller.login_exitoso(user_name_db, user_role)
+                else:
+                    self.label_error.config(text="Usuario o contraseña incorrectos")
         except sqlite3.Error as e:
             self.label_error.config(text=f"Error de base de datos: {e}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
         self.controller.unbind('<Return>')
 
 
@@ -131,29 +486,159 @@ class HomePage(ttk.Frame):
                                    bootstyle="secondary")
         btn_almacenes.pack(side="left", padx=10)
 
+        if controller.current_user_role == "ADMIN":
+            btn_consultas = ttk.Button(nav_frame, text="Rendimiento de Consultas",
+                                       command=lambda: controller.show_frame("PanelConsultas"),
+                                       bootstyle="info-outline")
+            btn_consultas.pack(side="right", padx=10)
+
+        # Contador de productos bajo su punto de reorden (lo actualiza App._revisar_existencias)
+        self.btn_alertas = ttk.Button(nav_frame, textvariable=controller.texto_existencia_baja,
+                                      command=self.abrir_existencia_baja, bootstyle="danger")
+        self._traza_alertas = controller.texto_existencia_baja.trace_add("write", lambda *args: self._mostrar_alertas())
+        self.bind("<Destroy>", self._al_destruir)
+        self._mostrar_alertas()
+
         center_frame = ttk.Frame(self)
         center_frame.pack(fill="both", expand=True)
 
+        # El logo se decodifica y redimensiona después de mostrar la pantalla
+        self.label_logo = ttk.Label(center_frame, background="white")
+        self.label_logo.pack(pady=20)
+        self.after_idle(self.cargar_logo)
+
+        user_name = self.controller.current_user_name
+        user_role = self.controller.current_user_role
+        
+        label_saludo = ttk.Label(center_frame, text=f"Bienvenido, {user_name} (Rol: {user_role})", 
+                                 font=("Arial", 16), bootstyle="secondary")
+        label_saludo.pack(pady=10)
+
+    def cargar_logo(self):
+        inicio = time.perf_counter()
         try:
             image_path = resource_path(os.path.join("assets", "logo_unison.png"))
             img = Image.open(image_path)
             img_resized = img.resize((250, 250), Image.Resampling.LANCZOS)
             self.logo_image = ImageTk.PhotoImage(img_resized)
-            label_logo = ttk.Label(center_frame, image=self.logo_image, background="white")
-            label_logo.pack(pady=20)
+            self.label_logo.config(image=self.logo_image)
         except Exception as e:
             print(f"Error al cargar imagen en Home: {e}")
-            label_logo = ttk.Label(center_frame, 
-                                  text="Error: Logo no encontrado.", 
-                                  font=("Arial", 14), bootstyle="danger")
-            label_logo.pack(pady=20)
+            self.label_logo.config(text="Error: Logo no encontrado.", 
+                                   font=("Arial", 14), bootstyle="danger")
+        self.controller.registrar_tiempo("HomePage", "logo", time.perf_counter() - inicio)
+
+    def _al_destruir(self, event):
+        # La variable es de App: sin quitar la traza, quedaría apuntando a una página destruida
+        if event.widget is self:
+            self.controller.texto_existencia_baja.trace_remove("write", self._traza_alertas)
+
+    def _mostrar_alertas(self):
+        if self.controller.texto_existencia_baja.get():
+            self.btn_alertas.pack(side="right", padx=10)
+        else:
+            self.btn_alertas.pack_forget()
 
-        user_name = self.controller.current_user_name
-        user_role = self.controller.current_user_role
-        
-        label_saludo = ttk.Label(center_frame, text=f"Bienvenido, {user_name} (Rol: {user_role})", 
-                                 font=("Arial", 16), bootstyle="secondary")
-        label_saludo.pack(pady=10)
+    def abrir_existencia_baja(self):
+        """Lista de productos bajo su punto de reorden y puntos de reorden por departamento."""
+        ventana = ttk.Toplevel(self)
+        ventana.title("Existencia baja")
+        ventana.geometry("760x520")
+
+        ttk.Label(ventana, text="Productos bajo su punto de reorden", font=("Arial", 14, "bold"),
+                  bootstyle="primary").pack(pady=10)
+
+        table_frame = ttk.Frame(ventana)
+        table_frame.pack(fill="both", expand=True, padx=20)
+        tree_scroll = ttk.Scrollbar(table_frame)
+        tree_scroll.pack(side="right", fill="y")
+        tree = ttk.Treeview(table_frame, columns=("id", "nombre", "departamento", "almacen", "cantidad", "punto"),
+                            show="headings", yscrollcommand=tree_scroll.set, bootstyle="secondary")
+        tree.pack(fill="both", expand=True)
+        tree_scroll.config(command=tree.yview)
+        for columna, titulo, ancho in (("id", "ID", 50), ("nombre", "Nombre", 200), ("departamento", "Departamento", 120),
+                                       ("almacen", "Almacén", 120), ("cantidad", "Cantidad", 80),
+                                       ("punto", "Punto de reorden", 110)):
+            tree.heading(columna, text=titulo, anchor=tk.W)
+            tree.column(columna, width=ancho, anchor=tk.E if columna in ("cantidad", "punto") else tk.W)
+
+        label_estado = ttk.Label(ventana, text="Cargando...", bootstyle="secondary")
+        label_estado.pack(pady=5)
+
+        # Punto de reorden por departamento (los productos sin punto propio usan este)
+        umbral_frame = ttk.Frame(ventana)
+        umbral_frame.pack(fill="x", padx=20, pady=(0, 15))
+        ttk.Label(umbral_frame, text="Departamento:").pack(side="left")
+        combo_depto = ttk.Combobox(umbral_frame, width=20)
+        combo_depto.pack(side="left", padx=5)
+        ttk.Label(umbral_frame, text="Punto de reorden (vacío = quitar):").pack(side="left", padx=(10, 0))
+        entry_punto = ttk.Entry(umbral_frame, width=8)
+        entry_punto.pack(side="left", padx=5)
+        btn_guardar = ttk.Button(umbral_frame, text="Guardar", bootstyle="warning-outline")
+        btn_guardar.pack(side="left", padx=5)
+        if not puede_editar(self.controller.current_user_role, "productos"):
+            btn_guardar.config(state="disabled")
+
+        umbrales = {}
+
+        def avisar_error(texto):
+            if ventana.winfo_exists():   # La respuesta pudo llegar con la ventana ya cerrada
+                label_estado.config(text=texto, bootstyle="danger")
+
+        def consultar(conn, tarea):
+            return productos_bajo_reorden(conn), umbrales_departamento(conn)
+
+        def mostrar(resultado):
+            if not ventana.winfo_exists():
+                return
+            filas, lista_umbrales = resultado
+            tree.delete(*tree.get_children())
+            for fila in filas:
+                tree.insert("", "end", values=fila)
+            umbrales.clear()
+            umbrales.update(lista_umbrales)
+            combo_depto["values"] = list(umbrales)
+            texto = f"{len(filas)} productos"
+            if len(filas) == LIMITE_LISTA_ALERTAS:
+                texto = f"Los {len(filas)} más faltantes"
+            label_estado.config(text=texto + ". Doble clic para editar un producto.")
+
+        def cargar():
+            self.controller.ejecutor.enviar(
+                consultar, al_terminar=mostrar,
+                al_error=lambda e: avisar_error(f"Error de base de datos: {e}"))
+
+        def al_elegir_depto(event=None):
+            entry_punto.delete(0, tk.END)
+            if combo_depto.get() in umbrales:
+                entry_punto.insert(0, str(umbrales[combo_depto.get()]))
+
+        def guardar_umbral():
+            departamento = combo_depto.get()
+            punto = entry_punto.get().strip() or None
+            usuario = self.controller.current_user_name
+
+            def terminar(_):
+                self.controller.revisar_existencias()
+                if ventana.winfo_exists():
+                    cargar()
+
+            self.controller.ejecutor.enviar(
+                lambda conn, tarea: fijar_umbral_departamento(conn, departamento, punto, usuario),
+                al_terminar=terminar,
+                al_error=lambda e: avisar_error(f"Error: {e}"))
+
+        def editar(event):
+            seleccion = tree.focus()
+            if seleccion:
+                item_id = tree.item(seleccion, "values")[0]
+                ventana.destroy()
+                self.controller.navegar_a_edicion("FormularioEdicionProducto", item_id)
+
+        combo_depto.bind("<<ComboboxSelected>>", al_elegir_depto)
+        btn_guardar.config(command=guardar_umbral)
+        tree.bind("<Double-1>", editar)
+        cargar()
 
 
 # --- Página 2: Formulario de (Lista de) Productos ---
@@ -177,6 +662,11 @@ class FormularioProductos(ttk.Frame):
                                       bootstyle="success")
         self.btn_agregar.pack(side="right")
 
+        self.btn_importar = ttk.Button(top_frame, text="📥 Importar CSV/JSON",
+                                       command=self.importar_archivo,
+                                       bootstyle="success-outline")
+        self.btn_importar.pack(side="right", padx=5)
+
         # Frame de Filtros (Botones)
         filter_frame = ttk.Frame(self)
         filter_frame.pack(pady=(0, 10), padx=20, fill="x", anchor="e")
@@ -191,6 +681,35 @@ class FormularioProductos(ttk.Frame):
                                       bootstyle="secondary-outline")
         self.btn_limpiar.pack(side="right", padx=5)
 
+        self.btn_exportar = ttk.Button(filter_frame, text="📤 Exportar",
+                                       command=self.exportar,
+                                       bootstyle="info-outline")
+        self.btn_exportar.pack(side="right", padx=5)
+        self.tarea_exportacion = None
+
+        self.btn_masivas = ttk.Button(filter_frame, text="🧰 Acciones Masivas",
+                                      command=self.abrir_acciones_masivas,
+                                      bootstyle="warning-outline")
+        self.btn_masivas.pack(side="right", padx=5)
+
+        self.btn_traspaso = ttk.Button(filter_frame, text="🔀 Traspasar",
+                                       command=self.abrir_traspaso,
+                                       bootstyle="warning-outline")
+        self.btn_traspaso.pack(side="right", padx=5)
+
+        # Barra de búsqueda mientras se escribe (los mismos campos de texto que los Filtros Avanzados)
+        search_frame = ttk.Frame(self)
+        search_frame.pack(pady=(0, 5), padx=20, fill="x")
+        self.entradas_busqueda = []
+        for texto, ancho in (("🔎 Nombre:", 25), ("Departamento:", 15), ("Almacén:", 15)):
+            ttk.Label(search_frame, text=texto).pack(side="left", padx=(10, 3))
+            entrada = ttk.Entry(search_frame, width=ancho)
+            entrada.pack(side="left")
+            entrada.bind("<KeyRelease>", self._programar_busqueda)
+            self.entradas_busqueda.append(entrada)
+        self.busqueda_pendiente = None      # id del after() que lanzará la búsqueda
+        self.filas_en_memoria = None        # Resultado completo de la barra; la tabla pagina sobre él
+
         # Título
         label = ttk.Label(self, text="Gestión de Productos", font=("Arial", 18, "bold"), bootstyle="primary")
         label.pack(pady=5)
@@ -202,9 +721,17 @@ class FormularioProductos(ttk.Frame):
         tree_scroll = ttk.Scrollbar(table_frame)
         tree_scroll.pack(side="right", fill="y")
 
-        self.tree = ttk.Treeview(table_frame, yscrollcommand=tree_scroll.set, selectmode="extended", bootstyle="secondary")
+        self.tree = ttk.Treeview(table_frame, selectmode="extended", bootstyle="secondary")
         self.tree.pack(fill="both", expand=True)
-        tree_scroll.config(command=self.tree.yview)
+
+        # La tabla virtual conecta el Treeview y la barra de desplazamiento
+        self.tabla = TablaVirtual(self.tree, tree_scroll, self._fuente_productos,
+                                  al_error=self._mostrar_error_bd)
+
+        # Consulta actual (WHERE + parámetros + orden) que se va paginando
+        self.where_actual, self.params_actual = filtros_productos()
+        self.orden = "id"
+        self.descendente = False
 
         # Columnas
         self.tree["columns"] = ("id", "nombre", "precio", "cantidad", "departamento", "almacen", "fecha_mod", "usuario_mod")
@@ -218,56 +745,215 @@ class FormularioProductos(ttk.Frame):
         self.tree.column("fecha_mod", anchor=tk.W, width=150)
         self.tree.column("usuario_mod", anchor=tk.W, width=100)
 
-        # Encabezados
+        # Encabezados (clic en uno para ordenar por esa columna en la base de datos)
+        self.titulos = {"id": "ID", "nombre": "Nombre", "precio": "Precio", "cantidad": "Cantidad",
+                        "departamento": "Departamento", "almacen": "Almacén",
+                        "fecha_mod": "Última Modificación", "usuario_mod": "Modificado por"}
         self.tree.heading("#0", text="", anchor=tk.W)
-        self.tree.heading("id", text="ID", anchor=tk.W)
-        self.tree.heading("nombre", text="Nombre", anchor=tk.W)
-        self.tree.heading("precio", text="Precio", anchor=tk.E)
-        self.tree.heading("cantidad", text="Cantidad", anchor=tk.W)
-        self.tree.heading("departamento", text="Departamento", anchor=tk.W)
-        self.tree.heading("almacen", text="Almacén", anchor=tk.W)
-        self.tree.heading("fecha_mod", text="Última Modificación", anchor=tk.W)
-        self.tree.heading("usuario_mod", text="Modificado por", anchor=tk.W)
+        for columna, titulo in self.titulos.items():
+            self.tree.heading(columna, text=titulo, anchor=tk.E if columna == "precio" else tk.W)
+            if columna in ORDEN_PRODUCTOS:
+                self.tree.heading(columna, command=lambda c=columna: self.ordenar_por(c))
+        self._marcar_orden()
 
         # Etiqueta de feedback creada ANTES de cargar
         self.label_feedback = ttk.Label(self, text="", font=("Arial", 12))
         self.label_feedback.pack(pady=5)
-
-        self.cargar_productos()
+        self.mensaje_base = ""
+        self.inicio_consulta = None
+        self.datos_cargados = False   # Los datos se cargan la primera vez que se muestra
+
+        # Las ediciones publican eventos y aquí solo se aplica el delta
+        controller.suscribir("productos", self.aplicar_cambio)
+        controller.suscribir("almacenes", lambda tipo, item_id: self.buscar_en_linea() if self.filas_en_memoria is not None
+                             else self.tabla.refrescar())
         
         self.tree.bind("<Double-1>", self.abrir_formulario_editar)
         self.aplicar_permisos()
 
-    def cargar_productos(self):
+    def cargar_productos(self, al_cargar=None):
         """Carga todos los productos (sin filtros)"""
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+        self._limpiar_barra()
+        self.where_actual, self.params_actual = filtros_productos()
+        self.inicio_consulta = time.perf_counter()
+
+        def terminar(total, exacto):
+            self.label_feedback.config(text=self.mensaje_base, bootstyle="info")
+            if al_cargar:
+                al_cargar()
+
         try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            sql_query = """
-                SELECT 
-                    p.id, p.nombre, p.precio, p.cantidad, p.departamento, 
-                    a.nombre as nombre_almacen,
-                    p.fecha_ultima_modificacion, p.ultimo_usuario_en_modificar
-                FROM productos p
-                LEFT JOIN almacenes a ON p.almacen = a.id
-            """
-            cursor.execute(sql_query)
-            for row in cursor.fetchall():
-                self.tree.insert(parent="", index="end", values=row)
-            
-            if hasattr(self, 'label_feedback'):
-                self.label_feedback.config(text="")
-                
+            self.tabla.reiniciar(al_terminar=terminar)
         except sqlite3.Error as e:
-            if hasattr(self, 'label_feedback'):
-                self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger")
+            self._mostrar_error_bd(e)
+
+    def al_mostrar(self):
+        """App llama esto en cada tkraise; solo la primera vez carga los datos."""
+        if self.datos_cargados:
+            return
+        self.datos_cargados = True
+        inicio = time.perf_counter()
+        self.cargar_productos(al_cargar=lambda: self.controller.registrar_tiempo(
+            "FormularioProductos", "primera carga de datos", time.perf_counter() - inicio))
+
+    def _fuente_productos(self, modo, clave, limite, al_recibir, al_fallar):
+        """Entrega a la tabla virtual una página de la consulta actual (en segundo plano)."""
+        where, params = self.where_actual, self.params_actual
+        orden, descendente = self.orden, self.descendente
+
+        if self.filas_en_memoria is not None:
+            # Resultado de la barra de búsqueda: se pagina sin consultar SQLite
+            if modo == "inicio":
+                self.filas_en_memoria = ordenar_filas(self.filas_en_memoria, orden, descendente)
+            filas = self.filas_en_memoria
+            pagina = pagina_en_memoria(filas, modo, clave, limite, por_id=(orden, descendente) == ("id", False))
+            resumen = None
+            if modo == "inicio":
+                ids = [f[0] for f in filas]
+                resumen = {"id_min": min(ids, default=None), "id_max": max(ids, default=None), "total": len(filas)}
+            al_recibir(pagina, resumen)
+            return
+
+        def consultar(conn, tarea):
+            filas = pagina_productos(conn, where, params, modo, clave, limite, orden, descendente)
+            resumen = None
+            if modo == "inicio":
+                resumen = resumen_productos(conn, where, params, filas, limite, orden, descendente)
+            filas = nombres_de_almacen(filas, self.controller.almacenes, conn)
+            return filas, resumen
+
+        # Misma 'grupo' para todas las páginas: una consulta nueva cancela la anterior
+        self.controller.ejecutor.enviar(
+            consultar,
+            al_terminar=lambda resultado: al_recibir(*resultado),
+            al_error=al_fallar,
+            al_progreso=self._mostrar_progreso if modo == "inicio" else None,
+            grupo="lista_productos")
+
+    # --- Búsqueda mientras se escribe ---
+
+    def _programar_busqueda(self, event=None):
+        """Cada tecla reinicia la espera: una ráfaga de teclas produce una sola búsqueda."""
+        if self.busqueda_pendiente is not None:
+            self.after_cancel(self.busqueda_pendiente)
+        self.busqueda_pendiente = self.after(RETARDO_BUSQUEDA_MS, self.buscar_en_linea)
+
+    def _limpiar_barra(self):
+        if self.busqueda_pendiente is not None:
+            self.after_cancel(self.busqueda_pendiente)
+            self.busqueda_pendiente = None
+        for entrada in self.entradas_busqueda:
+            entrada.delete(0, tk.END)
+        self.filas_en_memoria = None
+
+    def buscar_en_linea(self):
+        self.busqueda_pendiente = None
+        nombre, depto, almacen = (entrada.get() for entrada in self.entradas_busqueda)
+        if not (nombre or depto or almacen):
+            self.cargar_productos()
+            return
+
+        usar_fts = self.controller.fts_disponible
+        clave = clave_busqueda(nombre, depto, almacen, usar_fts)
+        cache = self.controller.busquedas
+        self.where_actual, self.params_actual = filtros_productos(nombre, depto, almacen, usar_fts=usar_fts)
+        self.inicio_consulta = time.perf_counter()
+
+        filas = cache.buscar(clave)
+        if filas is not None:
+            self._mostrar_en_memoria(filas)
+            return
+
+        generacion = cache.generacion
+        almacenes = self.controller.almacenes
+        where, params = self.where_actual, self.params_actual
+
+        def consultar(conn, tarea):
+            return consultar_busqueda(conn, nombre, depto, almacen, usar_fts, almacenes)
+
+        def mostrar(resultado):
+            if (where, params) != (self.where_actual, self.params_actual):
+                return   # Ya se escribió otra cosa
+            filas, completo = resultado
+            if completo:
+                cache.guardar(clave, filas, generacion)
+                self._mostrar_en_memoria(filas)
+            else:
+                # Demasiadas coincidencias para tenerlas en memoria: paginar con SQL
+                self.filas_en_memoria = None
+                self.tabla.reiniciar(al_terminar=self._mostrar_total_busqueda)
+
+        # Mismo grupo que las páginas: la búsqueda nueva cancela la anterior
+        self.controller.ejecutor.enviar(consultar, al_terminar=mostrar, al_error=self._mostrar_error_bd,
+                                        al_progreso=self._mostrar_progreso, grupo="lista_productos")
+
+    def _mostrar_en_memoria(self, filas):
+        self.filas_en_memoria = filas
+        self.tabla.reiniciar(al_terminar=self._mostrar_total_busqueda)
+
+    def ordenar_por(self, columna):
+        """Clic en un encabezado: ordena por esa columna; otro clic invierte el sentido."""
+        if columna == self.orden:
+            self.descendente = not self.descendente
+        else:
+            self.orden, self.descendente = columna, False
+        self._marcar_orden()
+        self.tabla.ordenada = (self.orden, self.descendente) != ("id", False)
+        self.inicio_consulta = time.perf_counter()
+
+        def terminar(total, exacto):
+            if self.where_actual == filtros_productos()[0]:
+                self.label_feedback.config(text=self.mensaje_base, bootstyle="info")
+            else:
+                self._mostrar_total_busqueda(total, exacto)
+
+        try:
+            self.tabla.reiniciar(al_terminar=terminar)
+        except sqlite3.Error as e:
+            self._mostrar_error_bd(e)
+
+    def _marcar_orden(self):
+        for columna, titulo in self.titulos.items():
+            if columna == self.orden:
+                titulo += " ▼" if self.descendente else " ▲"
+            self.tree.heading(columna, text=titulo)
+
+    def _mostrar_progreso(self, transcurrido):
+        self.label_feedback.config(text=f"Consultando... {transcurrido:.1f} s", bootstyle="secondary")
+
+    def _mostrar_error_bd(self, e):
+        self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger")
+
+    def aplicar_cambio(self, tipo, item_id):
+        """Refleja en la tabla un solo producto insertado, actualizado o eliminado."""
+        if self.filas_en_memoria is not None:
+            self.buscar_en_linea()   # El caché ya se invalidó: vuelve a consultar
+            return
+        if tipo == "varios":
+            self.tabla.refrescar()
+            return
+        if tipo == "eliminado":
+            self.tabla.quitar(item_id)
+            return
+
+        where, params = self.where_actual, self.params_actual
+        cache = self.controller.almacenes
+
+        def consultar(conn, tarea):
+            return nombres_de_almacen(fila_producto(conn, where, params, item_id), cache, conn)
+
+        def aplicar(filas):
+            if (where, params) != (self.where_actual, self.params_actual):
+                return  # Mientras tanto cambió el filtro y la lista ya se recargó
+            if filas:
+                self.tabla.poner_fila(filas[0], es_nueva=(tipo == "insertado"))
             else:
-                print(f"Error en BD: {e}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+                self.tabla.quitar(item_id)  # Ya no cumple el filtro
+
+        try:
+            self.controller.ejecutor.enviar(consultar, al_terminar=aplicar, al_error=self._mostrar_error_bd)
+        except sqlite3.Error as e:
+            self._mostrar_error_bd(e)
 
     def abrir_ventana_filtros(self):
         ventana = ttk.Toplevel(self)
@@ -297,9 +983,8 @@ class FormularioProductos(ttk.Frame):
         entry_usuario = ttk.Entry(form_frame)
         entry_usuario.pack(fill="x", pady=(0, 5))
 
-        ttk.Label(form_frame, text="Fecha Modificación (contiene ej. 2025-11):").pack(anchor="w")
-        entry_fecha = ttk.Entry(form_frame)
-        entry_fecha.pack(fill="x", pady=(0, 5))
+        ttk.Label(form_frame, text="Modificado entre (AAAA-MM-DD):").pack(anchor="w")
+        entry_desde, entry_hasta = campos_rango_fechas(form_frame)
         # ----------------------
 
         ttk.Label(form_frame, text="Rango de Precio:").pack(anchor="w")
@@ -323,88 +1008,335 @@ class FormularioProductos(ttk.Frame):
                                     entry_precio_min.get(), 
                                     entry_precio_max.get(),
                                     entry_usuario.get(), # Nuevo
-                                    entry_fecha.get()    # Nuevo
+                                    entry_desde.get(),
+                                    entry_hasta.get()
                                 ))
         btn_buscar.pack(pady=20, fill="x", padx=20)
 
-    def ejecutar_busqueda_avanzada(self, ventana, nombre, depto, almacen, p_min, p_max, usuario_mod, fecha_mod):
+    def ejecutar_busqueda_avanzada(self, ventana, nombre, depto, almacen, p_min, p_max, usuario_mod,
+                                   fecha_desde, fecha_hasta):
         ventana.destroy()
-        
-        sql = """
-            SELECT 
-                p.id, p.nombre, p.precio, p.cantidad, p.departamento, 
-                a.nombre as nombre_almacen,
-                p.fecha_ultima_modificacion, p.ultimo_usuario_en_modificar
-            FROM productos p
-            LEFT JOIN almacenes a ON p.almacen = a.id
-            WHERE 1=1 
-        """
-        params = []
-
-        if nombre:
-            sql += " AND p.nombre LIKE ?"
-            params.append(f"%{nombre}%")
-        
-        if depto:
-            sql += " AND p.departamento LIKE ?"
-            params.append(f"%{depto}%")
-            
-        if almacen:
-            sql += " AND a.nombre LIKE ?"
-            params.append(f"%{almacen}%")
-        
-        if p_min:
-            sql += " AND p.precio >= ?"
-            params.append(float(p_min))
-            
-        if p_max:
-            sql += " AND p.precio <= ?"
-            params.append(float(p_max))
-            
-        # --- NUEVOS FILTROS SQL ---
-        if usuario_mod:
-            sql += " AND p.ultimo_usuario_en_modificar LIKE ?"
-            params.append(f"%{usuario_mod}%")
-            
-        if fecha_mod:
-            sql += " AND p.fecha_ultima_modificacion LIKE ?"
-            params.append(f"%{fecha_mod}%")
-        # --------------------------
+        self._limpiar_barra()
 
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-            
         try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            cursor.execute(sql, params)
-            
-            filas = cursor.fetchall()
-            if not filas:
-                self.label_feedback.config(text="No se encontraron resultados con esos filtros.", bootstyle="warning")
-            else:
-                self.label_feedback.config(text=f"Se encontraron {len(filas)} resultados.", bootstyle="success")
-                for row in filas:
-                    self.tree.insert(parent="", index="end", values=row)
-                
-        except ValueError:
-             self.label_feedback.config(text="Error: El precio debe ser numérico", bootstyle="danger")
+            self.where_actual, self.params_actual = filtros_productos(
+                nombre, depto, almacen, p_min, p_max, usuario_mod, fecha_desde, fecha_hasta,
+                usar_fts=self.controller.fts_disponible)
+            self.inicio_consulta = time.perf_counter()
+            self.tabla.reiniciar(al_terminar=self._mostrar_total_busqueda)
+        except ValueError as e:
+             self.label_feedback.config(text=f"Error: {e}", bootstyle="danger")
         except sqlite3.Error as e:
             self.label_feedback.config(text=f"Error en búsqueda: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+
+    def _mostrar_total_busqueda(self, total, exacto):
+        segundos = time.perf_counter() - self.inicio_consulta
+        if total == 0:
+            self.label_feedback.config(text="No se encontraron resultados con esos filtros.", bootstyle="warning")
+        elif exacto:
+            self.label_feedback.config(text=f"Se encontraron {total} resultados ({segundos:.2f} s).", bootstyle="success")
+        else:
+            self.label_feedback.config(text=f"Se encontraron aprox. {total} resultados ({segundos:.2f} s).", bootstyle="success")
+
+    def exportar(self):
+        """Exporta lo que muestra la lista (último filtro o 'Ver Todo')."""
+        sql = f"{SELECT_PRODUCTOS} {self.where_actual} {orden_productos(self.orden, self.descendente)}"
+        exportar_vista(self, sql, self.params_actual)
 
     def aplicar_permisos(self):
         rol = self.controller.current_user_role
-        if rol not in ['ADMIN', 'PRODUCTOS']:
+        if not puede_editar(rol, "productos"):
             self.btn_agregar.config(state="disabled")
+            self.btn_importar.config(state="disabled")
+            self.btn_masivas.config(state="disabled")
+            self.btn_traspaso.config(state="disabled")
             self.tree.unbind("<Double-1>")
-            self.label_feedback.config(text="Modo de solo lectura. Rol no autorizado para editar.", bootstyle="info")
+            self.mensaje_base = "Modo de solo lectura. Rol no autorizado para editar."
+            self.label_feedback.config(text=self.mensaje_base, bootstyle="info")
 
     def abrir_formulario_nuevo(self):
         self.controller.navegar_a_edicion("FormularioEdicionProducto", None)
 
+    def importar_archivo(self):
+        """Importa un catálogo (CSV o JSON Lines) en segundo plano, por lotes."""
+        ruta = filedialog.askopenfilename(
+            parent=self, title="Importar productos",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl *.json"), ("Todos", "*.*")])
+        if not ruta:
+            return
+
+        usuario = self.controller.current_user_name
+        fecha = self.controller.fecha_escritura_propia()
+        avance = {"procesadas": 0}
+
+        def importar(conn, tarea):
+            def progreso(procesadas):
+                avance["procesadas"] = procesadas
+                tarea.revisar_cancelacion()
+            return importar_productos(conn, ruta, usuario, al_progreso=progreso, fecha=fecha)
+
+        def mostrar_avance(transcurrido):
+            self.label_feedback.config(
+                text=f"Importando... {avance['procesadas']} filas ({transcurrido:.1f} s)", bootstyle="secondary")
+
+        def terminar(resultado):
+            texto = (f"Importación: {resultado['insertadas']} insertadas, {resultado['rechazadas']} rechazadas "
+                     f"en {resultado['segundos']:.1f} s ({resultado['filas_por_segundo']:.0f} filas/s)")
+            self.label_feedback.config(text=texto, bootstyle="warning" if resultado["rechazadas"] else "success")
+            self.controller.busquedas.invalidar()
+            if self.filas_en_memoria is not None:
+                self.buscar_en_linea()
+            else:
+                self.tabla.reiniciar()
+            if resultado["errores"]:
+                # El ejecutable no tiene consola: el detalle tiene que verse aquí
+                detalle = "\n".join(resultado["errores"][:MAX_ERRORES_IMPORTACION])
+                if resultado["rechazadas"] > MAX_ERRORES_IMPORTACION:
+                    detalle += f"\n... y {resultado['rechazadas'] - MAX_ERRORES_IMPORTACION} más"
+                messagebox.showwarning("Importación", f"{resultado['rechazadas']} filas rechazadas:\n\n{detalle}",
+                                       parent=self)
+
+        try:
+            self.controller.ejecutor.enviar(
+                importar, al_terminar=terminar, al_progreso=mostrar_avance,
+                al_error=lambda e: self.label_feedback.config(text=f"Error al importar: {e}", bootstyle="danger"))
+        except sqlite3.Error as e:
+            self.label_feedback.config(text=f"Error al importar: {e}", bootstyle="danger")
+
+    def abrir_acciones_masivas(self):
+        """Ventana para cambiar almacén, precio o cantidad, o eliminar, sobre varios productos a la vez."""
+        seleccion = [self.tree.item(iid, "values")[0] for iid in self.tree.selection()]
+
+        ventana = ttk.Toplevel(self)
+        ventana.title("Acciones Masivas")
+        ventana.geometry("380x420")
+
+        ttk.Label(ventana, text="Acciones Masivas", font=("Arial", 14, "bold"), bootstyle="primary").pack(pady=10)
+
+        form_frame = ttk.Frame(ventana)
+        form_frame.pack(padx=20, pady=10, fill="x")
+
+        # Sobre qué productos: la selección del Treeview o todo el resultado del filtro
+        ttk.Label(form_frame, text="Aplicar a:").pack(anchor="w")
+        alcance = tk.StringVar(value="seleccion" if seleccion else "filtro")
+        radio_seleccion = ttk.Radiobutton(form_frame, text=f"Productos seleccionados ({len(seleccion)})",
+                                          variable=alcance, value="seleccion")
+        radio_seleccion.pack(anchor="w")
+        if not seleccion:
+            radio_seleccion.config(state="disabled")
+        ttk.Radiobutton(form_frame, text="Todo el resultado de la búsqueda actual",
+                        variable=alcance, value="filtro").pack(anchor="w", pady=(0, 10))
+
+        ttk.Label(form_frame, text="Acción:").pack(anchor="w")
+        combo_accion = ttk.Combobox(form_frame, state="readonly", values=list(NOMBRES_OPERACIONES.values()))
+        combo_accion.pack(fill="x", pady=(0, 5))
+
+        label_valor = ttk.Label(form_frame, text="Valor:")
+        label_valor.pack(anchor="w")
+        entry_valor = ttk.Entry(form_frame)
+        entry_valor.pack(fill="x", pady=(0, 5))
+        combo_almacen = ttk.Combobox(form_frame, state="readonly")
+
+        operaciones = {nombre: clave for clave, nombre in NOMBRES_OPERACIONES.items()}
+        cache = self.controller.almacenes
+
+        def al_elegir(event=None):
+            # Para "Cambiar almacén" se elige de la lista en vez de escribir
+            operacion = operaciones.get(combo_accion.get())
+            entry_valor.pack_forget()
+            combo_almacen.pack_forget()
+            if operacion == "almacen":
+                label_valor.config(text="Almacén destino:")
+                combo_almacen.pack(fill="x", pady=(0, 5))
+            elif operacion == "precio_porcentaje":
+                label_valor.config(text="Porcentaje (ej. 10 o -5):")
+                entry_valor.pack(fill="x", pady=(0, 5))
+            elif operacion == "cantidad":
+                label_valor.config(text="Nueva cantidad:")
+                entry_valor.pack(fill="x", pady=(0, 5))
+            elif operacion == "punto_reorden":
+                label_valor.config(text="Punto de reorden (vacío = el del departamento):")
+                entry_valor.pack(fill="x", pady=(0, 5))
+            else:
+                label_valor.config(text="")
+
+        combo_accion.bind("<<ComboboxSelected>>", al_elegir)
+        combo_accion.current(0)
+        al_elegir()
+
+        def llenar_almacenes(nombres):
+            if combo_almacen.winfo_exists():
+                combo_almacen["values"] = nombres
+
+        self.controller.ejecutor.enviar(lambda conn, tarea: cache.nombres(conn), al_terminar=llenar_almacenes,
+                                        al_error=self._mostrar_error_bd)
+
+        def aplicar():
+            operacion = operaciones.get(combo_accion.get())
+            if operacion == "almacen":
+                valor = cache.id_de(combo_almacen.get())
+                if valor is None:
+                    return
+            else:
+                valor = entry_valor.get()
+            ids = seleccion if alcance.get() == "seleccion" else None
+            if operacion == "eliminar" and not messagebox.askyesno(
+                    "Confirmar", "¿Eliminar " + (f"{len(ids)} productos" if ids else "todos los productos de la búsqueda")
+                    + "? No se puede deshacer.", parent=ventana):
+                return
+            ventana.destroy()
+            self.ejecutar_accion_masiva(operacion, valor, ids)
+
+        ttk.Button(ventana, text="APLICAR", bootstyle="warning", command=aplicar).pack(pady=20, fill="x", padx=20)
+
+    def ejecutar_accion_masiva(self, operacion, valor, ids):
+        """Corre la operación en segundo plano, en una sola transacción, mostrando el avance."""
+        where, params = self.where_actual, self.params_actual
+        usuario = self.controller.current_user_name
+        fecha = self.controller.fecha_escritura_propia()
+        avance = {"procesados": 0, "total": 0}
+
+        def ejecutar(conn, tarea):
+            def progreso(procesados, total):
+                avance["procesados"], avance["total"] = procesados, total
+                tarea.revisar_cancelacion()
+            return aplicar_operacion_masiva(conn, operacion, valor, usuario, ids, where, params,
+                                            al_progreso=progreso, fecha=fecha)
+
+        def mostrar_avance(transcurrido):
+            self.label_feedback.config(
+                text=f"{NOMBRES_OPERACIONES[operacion]}... {avance['procesados']} de {avance['total']} "
+                     f"({transcurrido:.1f} s)", bootstyle="secondary")
+
+        def terminar(resultado):
+            self.label_feedback.config(
+                text=f"{NOMBRES_OPERACIONES[operacion]}: {resultado['afectados']} productos "
+                     f"en {resultado['segundos']:.1f} s", bootstyle="success")
+            self.controller.busquedas.invalidar()
+            if self.filas_en_memoria is not None:
+                self.buscar_en_linea()
+            elif operacion == "eliminar":
+                self.tabla.reiniciar()
+            else:
+                self.tabla.refrescar()
+
+        def fallar(e):
+            texto = f"Error: {e}" if isinstance(e, ValueError) else f"Error en la acción masiva: {e}"
+            self.label_feedback.config(text=texto, bootstyle="danger")
+
+        try:
+            self.controller.ejecutor.enviar(ejecutar, al_terminar=terminar, al_progreso=mostrar_avance,
+                                            al_error=fallar)
+        except sqlite3.Error as e:
+            fallar(e)
+
+    def abrir_traspaso(self):
+        """Ventana para traspasar a otro almacén parte de la existencia de los productos seleccionados o de un archivo."""
+        seleccion = [self.tree.item(iid, "values")[0] for iid in self.tree.selection()]
+
+        ventana = ttk.Toplevel(self)
+        ventana.title("Traspaso entre almacenes")
+        ventana.geometry("380x380")
+
+        ttk.Label(ventana, text="Traspaso entre almacenes", font=("Arial", 14, "bold"), bootstyle="primary").pack(pady=10)
+
+        form_frame = ttk.Frame(ventana)
+        form_frame.pack(padx=20, pady=10, fill="x")
+
+        ttk.Label(form_frame, text="Almacén destino:").pack(anchor="w")
+        combo_almacen = ttk.Combobox(form_frame, state="readonly")
+        combo_almacen.pack(fill="x", pady=(0, 10))
+
+        ttk.Label(form_frame, text=f"Productos seleccionados: {len(seleccion)}").pack(anchor="w")
+        ttk.Label(form_frame, text="Cantidad por producto (vacío = toda la existencia):").pack(anchor="w")
+        entry_cantidad = ttk.Entry(form_frame)
+        entry_cantidad.pack(fill="x", pady=(0, 5))
+
+        cache = self.controller.almacenes
+
+        def llenar_almacenes(nombres):
+            if combo_almacen.winfo_exists():
+                combo_almacen["values"] = nombres
+
+        self.controller.ejecutor.enviar(lambda conn, tarea: cache.nombres(conn), al_terminar=llenar_almacenes,
+                                        al_error=self._mostrar_error_bd)
+
+        def destino():
+            almacen = cache.id_de(combo_almacen.get())
+            if almacen is None:
+                messagebox.showwarning("Traspaso", "Elija el almacén destino.", parent=ventana)
+            return almacen
+
+        def traspasar_seleccion():
+            almacen = destino()
+            if almacen is None:
+                return
+            try:
+                cantidad = a_cantidad(entry_cantidad.get()) if entry_cantidad.get().strip() else None
+            except ValueError as e:
+                messagebox.showerror("Traspaso", str(e), parent=ventana)
+                return
+            ventana.destroy()
+            self.ejecutar_traspaso([(producto, cantidad) for producto in seleccion], almacen)
+
+        def traspasar_archivo():
+            almacen = destino()
+            if almacen is None:
+                return
+            ruta = filedialog.askopenfilename(
+                parent=ventana, title="Archivo de traspaso (columnas producto y cantidad)",
+                filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl *.json"), ("Todos", "*.*")])
+            if not ruta:
+                return
+            try:
+                lineas = leer_lineas(ruta)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Traspaso", str(e), parent=ventana)
+                return
+            ventana.destroy()
+            self.ejecutar_traspaso(lineas, almacen)
+
+        boton = ttk.Button(ventana, text="TRASPASAR SELECCIÓN", bootstyle="warning", command=traspasar_seleccion)
+        boton.pack(pady=(20, 5), fill="x", padx=20)
+        if not seleccion:
+            boton.config(state="disabled")
+        ttk.Button(ventana, text="📂 Traspasar desde archivo...", bootstyle="warning-outline",
+                   command=traspasar_archivo).pack(pady=5, fill="x", padx=20)
+
+    def ejecutar_traspaso(self, lineas, destino):
+        """Corre el traspaso en segundo plano (una sola transacción)."""
+        usuario = self.controller.current_user_name
+        fecha = self.controller.fecha_escritura_propia()
+
+        def ejecutar(conn, tarea):
+            return traspasar(conn, lineas, destino, usuario, fecha)
+
+        def mostrar_avance(transcurrido):
+            self.label_feedback.config(text=f"Traspasando {len(lineas)} productos... ({transcurrido:.1f} s)",
+                                       bootstyle="secondary")
+
+        def terminar(resultado):
+            self.label_feedback.config(
+                text=f"Traspaso {resultado['traspaso']}: {resultado['unidades']} unidades de {resultado['productos']} "
+                     f"productos en {resultado['segundos']:.1f} s", bootstyle="success")
+            self.controller.busquedas.invalidar()
+            if self.filas_en_memoria is not None:
+                self.buscar_en_linea()
+            elif resultado["creados"]:
+                self.tabla.reiniciar()
+            else:
+                self.tabla.refrescar()
+
+        def fallar(e):
+            texto = f"Error: {e}" if isinstance(e, ValueError) else f"Error en el traspaso: {e}"
+            self.label_feedback.config(text=texto, bootstyle="danger")
+
+        try:
+            self.controller.ejecutor.enviar(ejecutar, al_terminar=terminar, al_progreso=mostrar_avance,
+                                            al_error=fallar)
+        except sqlite3.Error as e:
+            fallar(e)
+
     def abrir_formulario_editar(self, event):
         selected_item = self.tree.focus()
         if not selected_item:
@@ -449,6 +1381,15 @@ class FormularioAlmacenes(ttk.Frame):
                                       bootstyle="secondary-outline")
         self.btn_limpiar.pack(side="right", padx=5)
 
+        self.btn_exportar = ttk.Button(filter_frame, text="📤 Exportar",
+                                       command=self.exportar,
+                                       bootstyle="info-outline")
+        self.btn_exportar.pack(side="right", padx=5)
+        self.tarea_exportacion = None
+        self.where_actual, self.params_actual = filtros_almacenes()
+        self.orden = "id"
+        self.descendente = False
+
         # Título
         label = ttk.Label(self, text="Gestión de Almacenes", font=("Arial", 18, "bold"), bootstyle="primary")
         label.pack(pady=5)
@@ -464,54 +1405,184 @@ class FormularioAlmacenes(ttk.Frame):
         self.tree.pack(fill="both", expand=True)
         tree_scroll.config(command=self.tree.yview)
 
-        self.tree["columns"] = ("id", "nombre", "fecha_mod", "usuario_mod")
+        self.tree["columns"] = ("id", "nombre", "fecha_mod", "usuario_mod", "productos", "unidades", "valor")
         self.tree.column("#0", width=0, stretch=tk.NO)
         self.tree.column("id", anchor=tk.W, width=50)
         self.tree.column("nombre", anchor=tk.W, width=200)
         self.tree.column("fecha_mod", anchor=tk.W, width=150)
         self.tree.column("usuario_mod", anchor=tk.W, width=100)
-
+        self.tree.column("productos", anchor=tk.E, width=80)
+        self.tree.column("unidades", anchor=tk.E, width=90)
+        self.tree.column("valor", anchor=tk.E, width=120)
+
+        # Encabezados (clic en uno para ordenar por esa columna en la base de datos)
+        self.titulos = {"id": "ID", "nombre": "Nombre", "fecha_mod": "Última Modificación",
+                        "usuario_mod": "Modificado por", "productos": "Productos",
+                        "unidades": "Unidades", "valor": "Valor Inventario"}
         self.tree.heading("#0", text="", anchor=tk.W)
-        self.tree.heading("id", text="ID", anchor=tk.W)
-        self.tree.heading("nombre", text="Nombre", anchor=tk.W)
-        self.tree.heading("fecha_mod", text="Última Modificación", anchor=tk.W)
-        self.tree.heading("usuario_mod", text="Modificado por", anchor=tk.W)
+        for columna, titulo in self.titulos.items():
+            self.tree.heading(columna, text=titulo,
+                              anchor=tk.E if columna in ("productos", "unidades", "valor") else tk.W,
+                              command=lambda c=columna: self.ordenar_por(c))
+        self._marcar_orden()
 
         # --- CORRECCIÓN: Crear la etiqueta ANTES de cargar ---
         self.label_feedback = ttk.Label(self, text="", font=("Arial", 12))
         self.label_feedback.pack(pady=5)
+        self.mensaje_base = ""
+        self.datos_cargados = False   # Los datos se cargan la primera vez que se muestra
 
-        self.cargar_almacenes()
+        controller.suscribir("almacenes", self.aplicar_cambio)
         
         self.tree.bind("<Double-1>", self.abrir_formulario_editar)
         self.aplicar_permisos()
 
-    def cargar_almacenes(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        try:
-            conn = sqlite3.connect(DB_NAME)
+    def cargar_almacenes(self, al_cargar=None):
+        self.where_actual, self.params_actual = filtros_almacenes()
+        sql = self._consulta_actual()
+
+        def consultar(conn, tarea):
             cursor = conn.cursor()
-            cursor.execute("SELECT id, nombre, fecha_ultima_modificacion, ultimo_usuario_en_modificar FROM almacenes")
-            for row in cursor.fetchall():
-                self.tree.insert(parent="", index="end", values=row)
-            
-            if hasattr(self, 'label_feedback'):
-                self.label_feedback.config(text="")
-                
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+        def mostrar(filas):
+            self._llenar_tabla(filas)
+            self.label_feedback.config(text=self.mensaje_base, bootstyle="info")
+            if al_cargar:
+                al_cargar()
+
+        try:
+            self.controller.ejecutor.enviar(
+                consultar, al_terminar=mostrar,
+                al_error=lambda e: self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger"),
+                al_progreso=self._mostrar_progreso, grupo="lista_almacenes")
         except sqlite3.Error as e:
-            if hasattr(self, 'label_feedback'):
-                self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger")
+            self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger")
+
+    def al_mostrar(self):
+        """
+        App llama esto en cada tkraise. La primera vez carga la lista; las
+        siguientes solo relee las cifras de existencias, que cambian con cada
+        edición o importación de productos (una fila por almacén).
+        """
+        if self.datos_cargados:
+            self.refrescar_resumen()
+            return
+        self.datos_cargados = True
+        inicio = time.perf_counter()
+        self.cargar_almacenes(al_cargar=lambda: self.controller.registrar_tiempo(
+            "FormularioAlmacenes", "primera carga de datos", time.perf_counter() - inicio))
+
+    def refrescar_resumen(self):
+        """Actualiza productos, unidades y valor de las filas cargadas sin recargar la lista."""
+
+        def consultar(conn, tarea):
+            return conn.execute(SQL_RESUMEN_ALMACENES).fetchall()
+
+        def aplicar(filas):
+            for almacen, num_productos, unidades, valor in filas:
+                iid = str(almacen)
+                if self.tree.exists(iid):
+                    valores = self.tree.item(iid, "values")
+                    self.tree.item(iid, values=tuple(valores[:4]) + (num_productos, unidades, valor))
+
+        try:
+            self.controller.ejecutor.enviar(
+                consultar, al_terminar=aplicar,
+                al_error=lambda e: self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger"))
+        except sqlite3.Error as e:
+            self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger")
+
+    def _llenar_tabla(self, filas):
+        self.tree.delete(*self.tree.get_children())
+        for row in filas:
+            self.tree.insert(parent="", index="end", iid=str(row[0]), values=row)
+
+    def _consulta_actual(self):
+        return f"{SELECT_ALMACENES} {self.where_actual} {orden_almacenes(self.orden, self.descendente)}"
+
+    def ordenar_por(self, columna):
+        """Clic en un encabezado: vuelve a pedir la lista con ese ORDER BY (otro clic invierte el sentido)."""
+        if columna == self.orden:
+            self.descendente = not self.descendente
+        else:
+            self.orden, self.descendente = columna, False
+        self._marcar_orden()
+        self._volver_a_consultar()
+
+    def _volver_a_consultar(self):
+        """Relee la lista con el filtro y el orden actuales."""
+        sql, params = self._consulta_actual(), self.params_actual
+
+        def consultar(conn, tarea):
+            return conn.execute(sql, params).fetchall()
+
+        def mostrar(filas):
+            self._llenar_tabla(filas)
+            if self.where_actual == filtros_almacenes()[0]:
+                self.label_feedback.config(text=self.mensaje_base, bootstyle="info")
             else:
-                print(f"Error en BD: {e}")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+                self.label_feedback.config(text=f"Se encontraron {len(filas)} almacenes.", bootstyle="success")
+
+        try:
+            self.controller.ejecutor.enviar(
+                consultar, al_terminar=mostrar,
+                al_error=lambda e: self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger"),
+                al_progreso=self._mostrar_progreso, grupo="lista_almacenes")
+        except sqlite3.Error as e:
+            self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger")
+
+    def _marcar_orden(self):
+        for columna, titulo in self.titulos.items():
+            if columna == self.orden:
+                titulo += " ▼" if self.descendente else " ▲"
+            self.tree.heading(columna, text=titulo)
+
+    def _mostrar_progreso(self, transcurrido):
+        self.label_feedback.config(text=f"Consultando... {transcurrido:.1f} s", bootstyle="secondary")
+
+    def aplicar_cambio(self, tipo, item_id):
+        """Refleja en la tabla un solo almacén insertado, actualizado o eliminado."""
+        if tipo == "varios":
+            self._volver_a_consultar()
+            return
+        iid = str(item_id)
+        if tipo == "eliminado":
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+            return
+
+        sql = f"{SELECT_ALMACENES} {self.where_actual} AND id = ?"
+        params = list(self.params_actual) + [item_id]
+
+        def consultar(conn, tarea):
+            return conn.execute(sql, params).fetchone()
+
+        def aplicar(fila):
+            if fila is None:
+                if self.tree.exists(iid):
+                    self.tree.delete(iid)
+            elif self.tree.exists(iid):
+                self.tree.item(iid, values=fila)
+            elif (self.orden, self.descendente) == ("id", False):
+                claves = [int(h) for h in self.tree.get_children()]
+                self.tree.insert(parent="", index=bisect.bisect_left(claves, fila[0]), iid=iid, values=fila)
+            else:
+                # Con orden por columna se agrega al final hasta que se vuelva a ordenar
+                self.tree.insert(parent="", index="end", iid=iid, values=fila)
+
+        try:
+            self.controller.ejecutor.enviar(
+                consultar, al_terminar=aplicar,
+                al_error=lambda e: self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger"))
+        except sqlite3.Error as e:
+            self.label_feedback.config(text=f"Error en BD: {e}", bootstyle="danger")
 
     def abrir_ventana_filtros(self):
         ventana = ttk.Toplevel(self)
         ventana.title("Filtros de Almacenes")
-        ventana.geometry("350x350") # Ajustado altura
+        ventana.geometry("350x380") # Ajustado altura
         
         ttk.Label(ventana, text="Filtrar Almacenes", font=("Arial", 14, "bold"), bootstyle="primary").pack(pady=10)
         
@@ -528,10 +1599,9 @@ class FormularioAlmacenes(ttk.Frame):
         entry_usuario = ttk.Entry(form_frame)
         entry_usuario.pack(fill="x", pady=(0, 5))
 
-        # --- NUEVO: Campo Fecha ---
-        ttk.Label(form_frame, text="Fecha Modificación (contiene):").pack(anchor="w")
-        entry_fecha = ttk.Entry(form_frame)
-        entry_fecha.pack(fill="x", pady=(0, 5))
+        # --- NUEVO: Rango de fechas ---
+        ttk.Label(form_frame, text="Modificado entre (AAAA-MM-DD):").pack(anchor="w")
+        entry_desde, entry_hasta = campos_rango_fechas(form_frame)
         # --------------------------
 
         btn_buscar = ttk.Button(ventana, text="🔍 BUSCAR", 
@@ -540,62 +1610,58 @@ class FormularioAlmacenes(ttk.Frame):
                                     ventana, 
                                     entry_nombre.get(),
                                     entry_usuario.get(),
-                                    entry_fecha.get() # Nuevo
+                                    entry_desde.get(),
+                                    entry_hasta.get()
                                 ))
         btn_buscar.pack(pady=20, fill="x", padx=20)
 
-    def ejecutar_busqueda_avanzada(self, ventana, nombre, usuario_mod, fecha_mod):
+    def ejecutar_busqueda_avanzada(self, ventana, nombre, usuario_mod, fecha_desde, fecha_hasta):
         ventana.destroy()
         
-        sql = """
-            SELECT id, nombre, fecha_ultima_modificacion, ultimo_usuario_en_modificar 
-            FROM almacenes 
-            WHERE 1=1 
-        """
-        params = []
-
-        if nombre:
-            sql += " AND nombre LIKE ?"
-            params.append(f"%{nombre}%")
-        
-        if usuario_mod:
-            sql += " AND ultimo_usuario_en_modificar LIKE ?"
-            params.append(f"%{usuario_mod}%")
-
-        # --- NUEVO FILTRO SQL ---
-        if fecha_mod:
-            sql += " AND fecha_ultima_modificacion LIKE ?"
-            params.append(f"%{fecha_mod}%")
-        # ------------------------
-
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-            
         try:
-            conn = sqlite3.connect(DB_NAME)
+            where, params = filtros_almacenes(nombre, usuario_mod, fecha_desde, fecha_hasta,
+                                              usar_fts=self.controller.fts_disponible)
+        except ValueError as e:
+            self.label_feedback.config(text=f"Error: {e}", bootstyle="danger")
+            return
+        self.where_actual, self.params_actual = where, params
+        sql = self._consulta_actual()
+
+        inicio = time.perf_counter()
+
+        def consultar(conn, tarea):
             cursor = conn.cursor()
             cursor.execute(sql, params)
-            
-            filas = cursor.fetchall()
+            return cursor.fetchall()
+
+        def mostrar(filas):
+            segundos = time.perf_counter() - inicio
+            self._llenar_tabla(filas)
             if not filas:
                 self.label_feedback.config(text="No se encontraron almacenes.", bootstyle="warning")
             else:
-                self.label_feedback.config(text=f"Se encontraron {len(filas)} almacenes.", bootstyle="success")
-                for row in filas:
-                    self.tree.insert(parent="", index="end", values=row)
-                
+                self.label_feedback.config(text=f"Se encontraron {len(filas)} almacenes ({segundos:.2f} s).", bootstyle="success")
+
+        try:
+            self.controller.ejecutor.enviar(
+                consultar, al_terminar=mostrar,
+                al_error=lambda e: self.label_feedback.config(text=f"Error en búsqueda: {e}", bootstyle="danger"),
+                al_progreso=self._mostrar_progreso, grupo="lista_almacenes")
         except sqlite3.Error as e:
             self.label_feedback.config(text=f"Error en búsqueda: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+
+    def exportar(self):
+        """Exporta lo que muestra la lista (último filtro o 'Ver Todo')."""
+        sql = self._consulta_actual()
+        exportar_vista(self, sql, self.params_actual)
 
     def aplicar_permisos(self):
         rol = self.controller.current_user_role
-        if rol not in ['ADMIN', 'ALMACENES']:
+        if not puede_editar(rol, "almacenes"):
             self.btn_agregar.config(state="disabled")
             self.tree.unbind("<Double-1>")
-            self.label_feedback.config(text="Modo de solo lectura. Rol no autorizado para editar.", bootstyle="info")
+            self.mensaje_base = "Modo de solo lectura. Rol no autorizado para editar."
+            self.label_feedback.config(text=self.mensaje_base, bootstyle="info")
 
     def abrir_formulario_nuevo(self):
         self.controller.navegar_a_edicion("FormularioEdicionAlmacen", None)
@@ -617,6 +1683,7 @@ class FormularioEdicionProducto(ttk.Frame):
         self.controller = controller
         
         self.item_id = None
+        self.version = None   # Versión de la fila al abrirla (concurrencia optimista)
         
         top_frame = ttk.Frame(self)
         top_frame.pack(pady=20, padx=20, fill="x")
@@ -652,7 +1719,13 @@ class FormularioEdicionProducto(ttk.Frame):
         ttk.Label(form_frame, text="Almacén:").grid(row=2, column=0, padx=5, pady=5, sticky="e")
         self.combo_almacen = ttk.Combobox(form_frame, width=38, state="readonly")
         self.combo_almacen.grid(row=2, column=1, padx=5, pady=5)
-        self.almacenes_map = {} 
+
+        # Captura rápida: el alta va a la cola de escritura diferida y el
+        # formulario queda libre de inmediato para el siguiente producto
+        self.var_diferida = tk.BooleanVar(value=False)
+        self.check_diferida = ttk.Checkbutton(form_frame, text="Captura rápida", variable=self.var_diferida,
+                                              bootstyle="round-toggle")
+        self.check_diferida.grid(row=2, column=3, padx=5, pady=5, sticky="w")
 
         btn_frame = ttk.Frame(self)
         btn_frame.pack(pady=20, padx=40, fill="x")
@@ -672,6 +1745,10 @@ class FormularioEdicionProducto(ttk.Frame):
         self.label_feedback = ttk.Label(self, text="", font=("Arial", 12))
         self.label_feedback.pack(pady=5)
 
+        # Pendientes y guardados de la captura rápida (lo actualiza App)
+        ttk.Label(self, textvariable=controller.estado_escrituras, font=("Arial", 10),
+                  bootstyle="secondary").pack(pady=5)
+
     def cargar_datos(self, item_id=None):
         self.item_id = item_id
         
@@ -681,150 +1758,194 @@ class FormularioEdicionProducto(ttk.Frame):
         self.entry_depto.delete(0, 'end')
         self.label_feedback.config(text="")
         
-        self.cargar_opciones_almacen()
-        
         if item_id is None:
             # MODO AGREGAR
             self.label_titulo.config(text="Agregar Producto Nuevo")
             self.combo_almacen.set("") 
+            self.check_diferida.grid()
             self.btn_guardar.pack(side="right", padx=5)
             self.btn_actualizar.pack_forget()
             self.btn_eliminar.pack_forget()
         else:
             # MODO EDITAR
             self.label_titulo.config(text="Editar Producto")
+            self.check_diferida.grid_remove()
             self.btn_guardar.pack_forget()
             self.btn_actualizar.pack(side="right", padx=5)
             self.btn_eliminar.pack(side="left", padx=5)
-            
-            try:
-                conn = sqlite3.connect(DB_NAME)
+
+        cache = self.controller.almacenes
+
+        def consultar(conn, tarea):
+            # Los almacenes salen del caché: abrir el formulario cuesta solo
+            # la búsqueda por llave primaria del producto.
+            almacenes = cache.nombres(conn)
+            data = None
+            nombre_almacen = None
+            if item_id is not None:
                 cursor = conn.cursor()
-                cursor.execute("SELECT nombre, precio, cantidad, departamento, almacen FROM productos WHERE id = ?", (item_id,))
+                cursor.execute(SQL_PRODUCTO_POR_ID, (item_id,))
                 data = cursor.fetchone()
-                
                 if data:
-                    self.entry_nombre.insert(0, data[0])
-                    self.entry_precio.insert(0, data[1] if data[1] else "")
-                    self.entry_cantidad.insert(0, data[2] if data[2] else "")
-                    self.entry_depto.insert(0, data[3] if data[3] else "")
-                    
-                    id_to_name_map = {v: k for k, v in self.almacenes_map.items()}
-                    nombre_almacen = id_to_name_map.get(data[4])
-                    self.combo_almacen.set(nombre_almacen if nombre_almacen else "")
-            except sqlite3.Error as e:
-                self.label_feedback.config(text=f"Error al cargar datos: {e}", bootstyle="danger")
-            finally:
-                if 'conn' in locals():
-                    conn.close()
+                    nombre_almacen = cache.nombre_de(data[4], conn)
+            return almacenes, data, nombre_almacen
 
-    def cargar_opciones_almacen(self):
-        self.almacenes_map = {}
         try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, nombre FROM almacenes ORDER BY nombre")
-            opciones = []
-            for row in cursor.fetchall():
-                opciones.append(row[1])
-                self.almacenes_map[row[1]] = row[0]
-            self.combo_almacen['values'] = opciones
+            self.controller.ejecutor.enviar(
+                consultar, al_terminar=lambda r: self._mostrar_datos(*r),
+                al_error=lambda e: self.label_feedback.config(text=f"Error al cargar datos: {e}", bootstyle="danger"),
+                grupo="edicion_producto")
         except sqlite3.Error as e:
-            self.label_feedback.config(text=f"Error al cargar almacenes: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+            self.label_feedback.config(text=f"Error al cargar datos: {e}", bootstyle="danger")
+
+    def _mostrar_datos(self, almacenes, data, nombre_almacen):
+        self.cargar_opciones_almacen(almacenes)
+        if data:
+            self.version = data[5]   # Se compara al actualizar (concurrencia optimista)
+            self.entry_nombre.insert(0, data[0])
+            self.entry_precio.insert(0, texto_precio(data[1]))   # data[1] viene en centavos
+            self.entry_cantidad.insert(0, str(data[2]))
+            self.entry_depto.insert(0, data[3] if data[3] else "")
+            self.combo_almacen.set(nombre_almacen if nombre_almacen else "")
+
+    def cargar_opciones_almacen(self, almacenes):
+        self.combo_almacen['values'] = almacenes
+
+    def _leer_precio_cantidad(self):
+        """Precio (en centavos) y cantidad validados, o None si no son válidos (ya avisó)."""
+        try:
+            return a_centavos(self.entry_precio.get()), a_cantidad(self.entry_cantidad.get())
+        except ValueError as e:
+            self.label_feedback.config(text=str(e), bootstyle="warning")
+            return None
 
     def guardar_nuevo(self):
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            
-            nombre = self.entry_nombre.get()
-            precio = self.entry_precio.get() or None # Guardar NULL si está vacío
-            cantidad = self.entry_cantidad.get() or None
-            departamento = self.entry_depto.get() or None
-            nombre_almacen = self.combo_almacen.get()
-            
-            fecha = datetime.datetime.now().isoformat()
-            usuario = self.controller.current_user_name
+        nombre = self.entry_nombre.get()
+        departamento = self.entry_depto.get() or None
+        nombre_almacen = self.combo_almacen.get()
+        
+        fecha = self.controller.fecha_escritura_propia()
+        usuario = self.controller.current_user_name
+
+        if not nombre or not nombre_almacen:
+            self.label_feedback.config(text="Nombre y Almacén son obligatorios", bootstyle="warning")
+            return
+
+        valores = self._leer_precio_cantidad()
+        if valores is None:
+            return
+        precio, cantidad = valores
 
-            if not nombre or not nombre_almacen:
-                self.label_feedback.config(text="Nombre y Almacén son obligatorios", bootstyle="warning")
+        almacen_id = self.controller.almacenes.id_de(nombre_almacen)
+        valores = (nombre, precio, cantidad, departamento, almacen_id, fecha, usuario)
+
+        if self.var_diferida.get():
+            try:
+                self.controller.encolar_producto(valores)
+            except OSError as e:
+                self.label_feedback.config(text=f"No se pudo escribir el diario local: {e}", bootstyle="danger")
                 return
+            self.label_feedback.config(text=f"«{nombre}» en cola para guardar", bootstyle="success")
+            # El almacén se conserva: al recibir mercancía se capturan varios seguidos
+            self._limpiar_campos(conservar_almacen=True)
+            self.entry_nombre.focus_set()
+            return
 
-            almacen_id = self.almacenes_map.get(nombre_almacen)
-            
-            cursor.execute("""
-                INSERT INTO productos (nombre, precio, cantidad, departamento, almacen, fecha_ultima_modificacion, ultimo_usuario_en_modificar)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (nombre, precio, cantidad, departamento, almacen_id, fecha, usuario))
-            
+        def insertar(conn, tarea):
+            cursor = conn.cursor()
+            cursor.execute(SQL_INSERTAR_PRODUCTO, valores)
             conn.commit()
+            return cursor.lastrowid
+
+        def terminar(nuevo_id):
+            self.controller.publicar_cambio("productos", "insertado", nuevo_id)
             self.label_feedback.config(text="¡Producto guardado con éxito!", bootstyle="success")
-            
-            self.entry_nombre.delete(0, 'end')
-            self.entry_precio.delete(0, 'end')
-            self.entry_cantidad.delete(0, 'end')
-            self.entry_depto.delete(0, 'end')
+            self._limpiar_campos()
+
+        self._enviar_escritura(insertar, terminar, "Error al guardar")
+
+    def _limpiar_campos(self, conservar_almacen=False):
+        self.entry_nombre.delete(0, 'end')
+        self.entry_precio.delete(0, 'end')
+        self.entry_cantidad.delete(0, 'end')
+        self.entry_depto.delete(0, 'end')
+        if not conservar_almacen:
             self.combo_almacen.set("")
+
+    def _enviar_escritura(self, funcion, al_terminar, texto_error):
+        """
+        Las escrituras nunca se agrupan: no deben cancelarse entre sí.
+        Si otro proceso tiene la base ocupada se reintentan solas.
+        """
+        def fallar(e):
+            if isinstance(e, ConflictoDeVersion):
+                # Mostrar lo que guardó el otro usuario en lugar de sobrescribirlo
+                self.cargar_datos(self.item_id)
+                self.label_feedback.config(text=f"{e}. Se cargaron los datos actuales; revise y vuelva a guardar.",
+                                           bootstyle="warning")
+                return
+            self.label_feedback.config(text=f"{texto_error}: {e}", bootstyle="danger")
+
+        self.label_feedback.config(text="Guardando...", bootstyle="secondary")
+        try:
+            self.controller.ejecutor.enviar(funcion, al_terminar=al_terminar, al_error=fallar,
+                                            reintentos=REINTENTOS_OCUPADA)
         except sqlite3.Error as e:
-            self.label_feedback.config(text=f"Error al guardar: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+            fallar(e)
 
     def actualizar_existente(self):
         if not self.item_id:
             return
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            
-            nombre = self.entry_nombre.get()
-            precio = self.entry_precio.get() or None
-            cantidad = self.entry_cantidad.get() or None
-            departamento = self.entry_depto.get() or None
-            nombre_almacen = self.combo_almacen.get()
-            
-            fecha = datetime.datetime.now().isoformat()
-            usuario = self.controller.current_user_name
+        nombre = self.entry_nombre.get()
+        departamento = self.entry_depto.get() or None
+        nombre_almacen = self.combo_almacen.get()
+        
+        fecha = self.controller.fecha_escritura_propia()
+        usuario = self.controller.current_user_name
+        item_id = self.item_id
 
-            if not nombre or not nombre_almacen:
-                self.label_feedback.config(text="Nombre y Almacén son obligatorios", bootstyle="warning")
-                return
+        if not nombre or not nombre_almacen:
+            self.label_feedback.config(text="Nombre y Almacén son obligatorios", bootstyle="warning")
+            return
 
-            almacen_id = self.almacenes_map.get(nombre_almacen)
-            
-            cursor.execute("""
-                UPDATE productos SET 
-                    nombre = ?, precio = ?, cantidad = ?, departamento = ?, almacen = ?, 
-                    fecha_ultima_modificacion = ?, ultimo_usuario_en_modificar = ?
-                WHERE id = ?
-            """, (nombre, precio, cantidad, departamento, almacen_id, fecha, usuario, self.item_id))
-            
+        valores = self._leer_precio_cantidad()
+        if valores is None:
+            return
+        precio, cantidad = valores
+
+        almacen_id = self.controller.almacenes.id_de(nombre_almacen)
+
+        version = self.version
+
+        def actualizar(conn, tarea):
+            actualizar_con_version(conn, SQL_ACTUALIZAR_PRODUCTO, (nombre, precio, cantidad, departamento, almacen_id,
+                                                                   fecha, usuario, item_id, version))
             conn.commit()
+
+        def terminar(_):
+            self.version = version + 1
+            self.controller.publicar_cambio("productos", "actualizado", item_id)
             self.label_feedback.config(text="¡Producto actualizado con éxito!", bootstyle="success")
-        except sqlite3.Error as e:
-            self.label_feedback.config(text=f"Error al actualizar: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+
+        self._enviar_escritura(actualizar, terminar, "Error al actualizar")
 
     def eliminar_item(self):
         if not self.item_id:
             return
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM productos WHERE id = ?", (self.item_id,))
+        item_id = self.item_id
+        fecha = self.controller.fecha_escritura_propia()
+        usuario = self.controller.current_user_name
+
+        def eliminar(conn, tarea):
+            # Borrado + fila de historial con el autor, en una sola transacción
+            eliminar_con_autor(conn, SQL_ELIMINAR_PRODUCTO, (item_id,), usuario, fecha)
             conn.commit()
+
+        def terminar(_):
+            self.controller.publicar_cambio("productos", "eliminado", item_id)
             self.volver_a_lista()
-        except sqlite3.Error as e:
-            self.label_feedback.config(text=f"Error al eliminar: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+
+        self._enviar_escritura(eliminar, terminar, "Error al eliminar")
 
     def volver_a_lista(self):
         self.controller.regresar_a_lista("FormularioProductos")
@@ -838,6 +1959,7 @@ class FormularioEdicionAlmacen(ttk.Frame):
         self.controller = controller
         
         self.item_id = None
+        self.version = None
         
         top_frame = ttk.Frame(self)
         top_frame.pack(pady=20, padx=20, fill="x")
@@ -893,102 +2015,237 @@ class FormularioEdicionAlmacen(ttk.Frame):
             self.btn_guardar.pack_forget()
             self.btn_actualizar.pack(side="right", padx=5)
             self.btn_eliminar.pack(side="left", padx=5)
-            
-            try:
-                conn = sqlite3.connect(DB_NAME)
+
+            def consultar(conn, tarea):
                 cursor = conn.cursor()
-                cursor.execute("SELECT nombre FROM almacenes WHERE id = ?", (item_id,))
-                data = cursor.fetchone()
+                cursor.execute(SQL_ALMACEN_POR_ID, (item_id,))
+                return cursor.fetchone()
+
+            def mostrar(data):
                 if data:
                     self.entry_nombre.insert(0, data[0])
+                    self.version = data[1]
+
+            try:
+                self.controller.ejecutor.enviar(
+                    consultar, al_terminar=mostrar,
+                    al_error=lambda e: self.label_feedback.config(text=f"Error al cargar datos: {e}", bootstyle="danger"),
+                    grupo="edicion_almacen")
             except sqlite3.Error as e:
                 self.label_feedback.config(text=f"Error al cargar datos: {e}", bootstyle="danger")
-            finally:
-                if 'conn' in locals():
-                    conn.close()
 
     def guardar_nuevo(self):
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            
-            nombre = self.entry_nombre.get()
-            fecha = datetime.datetime.now().isoformat()
-            usuario = self.controller.current_user_name
+        nombre = self.entry_nombre.get()
+        fecha = self.controller.fecha_escritura_propia()
+        usuario = self.controller.current_user_name
 
-            if not nombre:
-                self.label_feedback.config(text="El Nombre es obligatorio", bootstyle="warning")
-                return
-            
-            cursor.execute("""
-                INSERT INTO almacenes (nombre, fecha_ultima_modificacion, ultimo_usuario_en_modificar)
-                VALUES (?, ?, ?)
-            """, (nombre, fecha, usuario))
-            
+        if not nombre:
+            self.label_feedback.config(text="El Nombre es obligatorio", bootstyle="warning")
+            return
+
+        cache = self.controller.almacenes
+
+        def insertar(conn, tarea):
+            cursor = conn.cursor()
+            cursor.execute(SQL_INSERTAR_ALMACEN, (nombre, fecha, usuario))
             conn.commit()
+            cache.invalidar()
+            return cursor.lastrowid
+
+        def terminar(nuevo_id):
+            self.controller.publicar_cambio("almacenes", "insertado", nuevo_id)
             self.label_feedback.config(text="¡Almacén guardado con éxito!", bootstyle="success")
             self.entry_nombre.delete(0, 'end')
 
-        except sqlite3.IntegrityError:
-             self.label_feedback.config(text=f"Error: El almacén '{nombre}' ya existe", bootstyle="danger")
+        def fallar(e):
+            if isinstance(e, sqlite3.IntegrityError):
+                self.label_feedback.config(text=f"Error: El almacén '{nombre}' ya existe", bootstyle="danger")
+            else:
+                self.label_feedback.config(text=f"Error al guardar: {e}", bootstyle="danger")
+
+        self._enviar_escritura(insertar, terminar, fallar)
+
+    def _enviar_escritura(self, funcion, al_terminar, al_error):
+        """Las escrituras nunca se agrupan: no deben cancelarse entre sí."""
+        self.label_feedback.config(text="Guardando...", bootstyle="secondary")
+        try:
+            self.controller.ejecutor.enviar(funcion, al_terminar=al_terminar, al_error=al_error,
+                                            reintentos=REINTENTOS_OCUPADA)
         except sqlite3.Error as e:
-            self.label_feedback.config(text=f"Error al guardar: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+            al_error(e)
 
     def actualizar_existente(self):
         if not self.item_id:
             return
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            
-            nombre = self.entry_nombre.get()
-            fecha = datetime.datetime.now().isoformat()
-            usuario = self.controller.current_user_name
+        nombre = self.entry_nombre.get()
+        fecha = self.controller.fecha_escritura_propia()
+        usuario = self.controller.current_user_name
+        item_id = self.item_id
 
-            if not nombre:
-                self.label_feedback.config(text="El Nombre es obligatorio", bootstyle="warning")
-                return
-            
-            cursor.execute("""
-                UPDATE almacenes SET 
-                    nombre = ?, fecha_ultima_modificacion = ?, ultimo_usuario_en_modificar = ?
-                WHERE id = ?
-            """, (nombre, fecha, usuario, self.item_id))
-            
+        if not nombre:
+            self.label_feedback.config(text="El Nombre es obligatorio", bootstyle="warning")
+            return
+
+        cache = self.controller.almacenes
+        version = self.version
+
+        def actualizar(conn, tarea):
+            actualizar_con_version(conn, SQL_ACTUALIZAR_ALMACEN, (nombre, fecha, usuario, item_id, version))
             conn.commit()
+            cache.invalidar()
+
+        def fallar(e):
+            if isinstance(e, ConflictoDeVersion):
+                self.cargar_datos(item_id)
+                self.label_feedback.config(text=f"{e}. Se cargaron los datos actuales; revise y vuelva a guardar.",
+                                           bootstyle="warning")
+            elif isinstance(e, sqlite3.IntegrityError):
+                self.label_feedback.config(text=f"Error: El nombre '{nombre}' ya existe", bootstyle="danger")
+            else:
+                self.label_feedback.config(text=f"Error al actualizar: {e}", bootstyle="danger")
+
+        def terminar(_):
+            self.version = version + 1
+            self.controller.publicar_cambio("almacenes", "actualizado", item_id)
             self.label_feedback.config(text="¡Almacén actualizado con éxito!", bootstyle="success")
-        except sqlite3.IntegrityError:
-             self.label_feedback.config(text=f"Error: El nombre '{nombre}' ya existe", bootstyle="danger")
-        except sqlite3.Error as e:
-            self.label_feedback.config(text=f"Error al actualizar: {e}", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+
+        self._enviar_escritura(actualizar, terminar, fallar)
 
     def eliminar_item(self):
         if not self.item_id:
             return
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM almacenes WHERE id = ?", (self.item_id,))
+        item_id = self.item_id
+
+        cache = self.controller.almacenes
+        fecha = self.controller.fecha_escritura_propia()
+        usuario = self.controller.current_user_name
+
+        def eliminar(conn, tarea):
+            eliminar_con_autor(conn, SQL_ELIMINAR_ALMACEN, (item_id,), usuario, fecha)
             conn.commit()
-            self.volver_a_lista()
-        except sqlite3.Error as e:
+            cache.invalidar()
+
+        def fallar(e):
             self.label_feedback.config(text=f"Error al eliminar: {e}", bootstyle="danger")
             if "FOREIGN KEY" in str(e):
                  self.label_feedback.config(text="Error: No se puede borrar, almacén en uso por productos", bootstyle="danger")
-        finally:
-            if 'conn' in locals():
-                conn.close()
+
+        def terminar(_):
+            self.controller.publicar_cambio("almacenes", "eliminado", item_id)
+            self.volver_a_lista()
+
+        self._enviar_escritura(eliminar, terminar, fallar)
 
     def volver_a_lista(self):
         self.controller.regresar_a_lista("FormularioAlmacenes")
 
 
+# --- NUEVA CLASE: Panel de Rendimiento de Consultas (solo ADMIN) ---
+
+class PanelConsultas(ttk.Frame):
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self.registro = controller.registro
+
+        top_frame = ttk.Frame(self)
+        top_frame.pack(pady=(20, 10), padx=20, fill="x")
+
+        btn_home = ttk.Button(top_frame, text="< Regresar a Inicio",
+                              command=lambda: controller.show_frame("HomePage"),
+                              bootstyle="link")
+        btn_home.pack(side="left")
+
+        btn_reiniciar = ttk.Button(top_frame, text="Reiniciar Estadísticas",
+                                   command=self.reiniciar, bootstyle="danger-outline")
+        btn_reiniciar.pack(side="right")
+
+        btn_actualizar = ttk.Button(top_frame, text="🔄 Actualizar",
+                                    command=self.actualizar, bootstyle="secondary-outline")
+        btn_actualizar.pack(side="right", padx=5)
+
+        self.var_umbral = tk.IntVar(value=int(self.registro.umbral_ms))
+        spin_umbral = ttk.Spinbox(top_frame, from_=1, to=10000, increment=10, width=7,
+                                  textvariable=self.var_umbral, command=self.cambiar_umbral)
+        spin_umbral.pack(side="right", padx=5)
+        spin_umbral.bind("<Return>", lambda e: self.cambiar_umbral())
+        ttk.Label(top_frame, text="Umbral de consulta lenta (ms):").pack(side="right")
+
+        ttk.Label(self, text="Rendimiento de Consultas", font=("Arial", 18, "bold"), bootstyle="primary").pack(pady=5)
+
+        # Histograma de latencia por tipo de consulta
+        tipos_frame = ttk.Frame(self)
+        tipos_frame.pack(fill="both", expand=True, padx=20, pady=10)
+
+        self.grupos = [f"<{l}" for l in LIMITES_HISTOGRAMA_MS] + [f"≥{LIMITES_HISTOGRAMA_MS[-1]}"]
+        columnas = ("tipo", "llamadas", "filas", "p50", "p95", "max") + tuple(self.grupos)
+        self.tree_tipos = ttk.Treeview(tipos_frame, columns=columnas, show="headings", height=8, bootstyle="secondary")
+        self.tree_tipos.pack(fill="both", expand=True)
+        for columna, texto, ancho in (("tipo", "Tipo de consulta", 180), ("llamadas", "Llamadas", 70),
+                                      ("filas", "Filas", 70), ("p50", "p50 ms", 70), ("p95", "p95 ms", 70),
+                                      ("max", "Máx ms", 70)):
+            self.tree_tipos.heading(columna, text=texto, anchor=tk.W)
+            self.tree_tipos.column(columna, anchor=tk.W, width=ancho)
+        for grupo in self.grupos:
+            self.tree_tipos.heading(grupo, text=grupo, anchor=tk.E)
+            self.tree_tipos.column(grupo, anchor=tk.E, width=45)
+
+        # Consultas lentas recientes (el log rotativo tiene el historial completo)
+        ttk.Label(self, text="Consultas lentas recientes", font=("Arial", 12, "bold")).pack(anchor="w", padx=20)
+        lentas_frame = ttk.Frame(self)
+        lentas_frame.pack(fill="both", expand=True, padx=20, pady=(0, 10))
+
+        self.tree_lentas = ttk.Treeview(lentas_frame, columns=("fecha", "ms", "pagina", "filas", "sql"),
+                                        show="headings", height=6, bootstyle="secondary")
+        self.tree_lentas.pack(fill="both", expand=True)
+        for columna, texto, ancho in (("fecha", "Fecha", 140), ("ms", "ms", 60), ("pagina", "Página", 150),
+                                      ("filas", "Filas", 60), ("sql", "SQL", 500)):
+            self.tree_lentas.heading(columna, text=texto, anchor=tk.W)
+            self.tree_lentas.column(columna, anchor=tk.W, width=ancho)
+        self.tree_lentas.bind("<<TreeviewSelect>>", self.mostrar_plan)
+
+        self.label_plan = ttk.Label(self, text="", font=("Consolas", 10), justify="left", wraplength=1000)
+        self.label_plan.pack(fill="x", padx=20, pady=5)
+        self.lentas = []
+
+    def al_mostrar(self):
+        self.actualizar()
+
+    def actualizar(self):
+        self.tree_tipos.delete(*self.tree_tipos.get_children())
+        for fila in self.registro.resumen():
+            self.tree_tipos.insert("", "end", values=(
+                fila["tipo"], fila["llamadas"], fila["filas"],
+                f"{fila['p50_ms']:.2f}", f"{fila['p95_ms']:.2f}", f"{fila['max_ms']:.2f}",
+                *fila["histograma"]))
+
+        self.lentas = self.registro.lentas()
+        self.tree_lentas.delete(*self.tree_lentas.get_children())
+        for i, entrada in reversed(list(enumerate(self.lentas))):
+            self.tree_lentas.insert("", "end", iid=str(i), values=(
+                entrada["fecha"], f"{entrada['ms']:.1f}", entrada["pagina"], entrada["filas"], entrada["sql"]))
+        self.label_plan.config(text="")
+
+    def mostrar_plan(self, event=None):
+        seleccion = self.tree_lentas.selection()
+        if not seleccion:
+            return
+        entrada = self.lentas[int(seleccion[0])]
+        lineas = [entrada["sql"], f"Parámetros: {entrada['parametros']}"]
+        lineas += [f"PLAN: {paso}" for paso in entrada["plan"]]
+        self.label_plan.config(text="\n".join(lineas))
+
+    def cambiar_umbral(self):
+        try:
+            self.registro.umbral_ms = max(1, int(self.var_umbral.get()))
+        except (tk.TclError, ValueError):
+            self.var_umbral.set(int(self.registro.umbral_ms))
+
+    def reiniciar(self):
+        self.registro.reiniciar()
+        self.actualizar()
+
+
 # --- Clase Principal de la Aplicación ---
 
 class App(ttk.Window):
@@ -1032,12 +2289,70 @@ class App(ttk.Window):
         self.current_user_name = None
         self.current_user_role = None
 
+        # --- Capa de acceso a datos compartida por todas las páginas ---
+        # Cada sentencia se mide; las lentas van a un log rotativo junto a la base
+        self.registro = RegistroConsultas(ruta_log=os.path.join(os.path.dirname(DB_NAME), "consultas_lentas.log"))
+        self.registro.pagina_actual = "App"
+        self.bd = PoolConexiones(DB_NAME, registro=self.registro)
+        self.ejecutor = EjecutorConsultas(self.bd, self, origen=lambda: self.registro.pagina_actual)
+        self.almacenes = CacheAlmacenes(self.bd)
+        self.busquedas = CacheBusquedas()   # Resultados de la barra de búsqueda de productos
+
+        # Eventos de cambio: tabla -> funciones(tipo, item_id) de las listas suscritas
+        self.suscriptores = {"productos": [], "almacenes": []}
+        # Cambios propios ya publicados: el detector los verá en el historial y los salta
+        # (usuario, fecha) de las escrituras propias recientes: el detector salta sus
+        # filas del historial (cabe al menos un vaciado completo de la captura rápida)
+        self.escrituras_propias = collections.deque(maxlen=2 * MAX_LOTE)
+
+        # Poner el esquema al día (cada migración se aplica una sola vez).
+        # Si setup_database no pudo crear el índice FTS5, los filtros usan LIKE.
+        try:
+            with self.bd.conexion() as conn:
+                aplicar_migraciones(conn)
+                self.fts_disponible = indice_fts_disponible(conn)
+                limpiar_claves_viejas(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error al migrar la base de datos: {e}")
+            self.fts_disponible = False
+        self.protocol("WM_DELETE_WINDOW", self.cerrar_aplicacion)
+
+        # Captura rápida: altas en cola con diario local (ver escritura_diferida.py).
+        # Lo que quedó en el diario de una sesión anterior se aplica en el primer vaciado.
+        self.escrituras = ColaEscrituras(ruta_diario_local(DB_NAME))
+        self.estado_escrituras = tk.StringVar(value="")
+        if self.escrituras.recuperadas:
+            print(f"Escrituras diferidas recuperadas del diario: {self.escrituras.recuperadas}")
+            self._actualizar_estado_escrituras()
+        self.after(INTERVALO_MS, self._vaciado_periodico)
+
+        # Cambios que guardan otros equipos (ver deteccion_cambios.py)
+        try:
+            self.detector = DetectorCambios(DB_NAME)
+        except sqlite3.Error as e:
+            print(f"Sin detección de cambios externos: {e}")
+            self.detector = None
+        self.revisando_cambios = False
+        self.after(INTERVALO_DETECCION_MS, self._revisar_cambios_externos)
+
+        # Productos bajo su punto de reorden (ver alertas_existencia.py); HomePage muestra el texto
+        self.revisor_existencias = RevisorExistencias()
+        self.texto_existencia_baja = tk.StringVar(value="")
+        self.revisando_existencias = False
+        self.after(INTERVALO_ALERTAS_MS, self._revisar_existencias_periodico)
+
         container = ttk.Frame(self)
         container.pack(side="top", fill="both", expand=True)
         container.grid_rowconfigure(0, weight=1)
         container.grid_columnconfigure(0, weight=1)
+        self.container = container
 
         self.frames = {}
+        # Páginas que se construyen hasta que se muestran por primera vez
+        self.paginas = {F.__name__: F for F in (HomePage, FormularioProductos, FormularioAlmacenes,
+                                                FormularioEdicionProducto, FormularioEdicionAlmacen,
+                                                PanelConsultas)}
 
         frame_login = LoginPage(parent=container, controller=self)
         self.frames["LoginPage"] = frame_login
@@ -1048,47 +2363,218 @@ class App(ttk.Window):
     # --- INICIO DE MÉTODOS DE APP (INDENTADOS) ---
     
     def show_frame(self, page_name):
-        """Muestra un frame por su nombre"""
-        frame = self.frames[page_name]
+        """Muestra un frame por su nombre (lo construye la primera vez)"""
+        frame = self.obtener_frame(page_name)
+        self.registro.pagina_actual = page_name
         frame.tkraise()
+        if hasattr(frame, "al_mostrar"):
+            frame.al_mostrar()
+
+    def obtener_frame(self, page_name):
+        """Devuelve el frame, construyéndolo si es la primera vez que se pide."""
+        if page_name not in self.frames:
+            inicio = time.perf_counter()
+            frame = self.paginas[page_name](parent=self.container, controller=self)
+            self.frames[page_name] = frame
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.registrar_tiempo(page_name, "construcción", time.perf_counter() - inicio)
+        return self.frames[page_name]
+
+    def registrar_tiempo(self, page_name, etapa, segundos):
+        """Desglose de tiempos de arranque por página."""
+        print(f"[Tiempos] {page_name} - {etapa}: {segundos * 1000:.1f} ms")
 
     def login_exitoso(self, user_name, user_role):
         self.current_user_name = user_name
         self.current_user_role = user_role
-        
-        container = self.frames["LoginPage"].master 
-
-        for F in (HomePage, FormularioProductos, FormularioAlmacenes, 
-                  FormularioEdicionProducto, FormularioEdicionAlmacen):
-            page_name = F.__name__
-            frame = F(parent=container, controller=self)
-            self.frames[page_name] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
 
+        # Solo se construye la pantalla de inicio; las demás, al navegar a ellas
+        inicio = time.perf_counter()
         self.show_frame("HomePage")
+        self.registrar_tiempo("App", "login -> primera pantalla", time.perf_counter() - inicio)
         
+
     def navegar_a_edicion(self, page_name, item_id):
         """
         Función especial para navegar a un formulario de edición,
         pasándole el ID del ítem (o None si es nuevo).
         """
-        frame = self.frames[page_name]
+        frame = self.obtener_frame(page_name)
+        self.registro.pagina_actual = page_name
         frame.cargar_datos(item_id) # Prepara el formulario
         frame.tkraise()              # Muestra el formulario
 
     def regresar_a_lista(self, page_name):
         """
-        Función para volver a una lista, asegurándose
-        de recargar los datos de la tabla.
+        Función para volver a una lista. Ya no se recarga la tabla:
+        las ediciones publicaron sus cambios y la lista ya aplicó el delta.
+        (Una recarga completa solo ocurre con "Ver Todo".)
         """
-        lista_frame = self.frames[page_name]
-        
-        if page_name == "FormularioProductos":
-            lista_frame.cargar_productos()
-        elif page_name == "FormularioAlmacenes":
-            lista_frame.cargar_almacenes()
-            
-        lista_frame.tkraise()
+        self.registro.pagina_actual = page_name
+        self.frames[page_name].tkraise()
+
+    def suscribir(self, tabla, funcion):
+        """Registra funcion(tipo, item_id) para los cambios de 'tabla'."""
+        self.suscriptores[tabla].append(funcion)
+
+    def publicar_cambio(self, tabla, tipo, item_id):
+        """tipo: "insertado", "actualizado", "eliminado" o "varios" (item_id None: refrescar la lista)."""
+        item_id = int(item_id) if item_id is not None else None   # Como los avisos del detector
+        self._notificar(tabla, tipo, item_id)
+
+    def fecha_escritura_propia(self):
+        """Fecha para una escritura de este programa; se anota para que el detector no la tome por ajena."""
+        fecha = datetime.datetime.now().isoformat()
+        self.escrituras_propias.append((self.current_user_name, fecha))
+        return fecha
+
+    def _notificar(self, tabla, tipo, item_id):
+        self.busquedas.invalidar()   # Cualquier escritura deja viejos los resultados guardados
+        for funcion in self.suscriptores[tabla]:
+            funcion(tipo, item_id)
+
+    # --- Cambios de otros equipos ---
+
+    def _revisar_cambios_externos(self):
+        """Cada INTERVALO_DETECCION_MS: una revisión en el ejecutor (nunca dos a la vez)."""
+        self.after(INTERVALO_DETECCION_MS, self._revisar_cambios_externos)
+        if self.detector is None or self.revisando_cambios:
+            return
+
+        def terminar(cambios):
+            self.revisando_cambios = False
+            if cambios:
+                self._aplicar_cambios_externos(cambios)
+
+        def fallar(e):
+            self.revisando_cambios = False
+            print(f"Error al revisar cambios externos: {e}")
+
+        self.revisando_cambios = True
+        propias = list(self.escrituras_propias)
+        try:
+            self.ejecutor.enviar(lambda conn, tarea: self.detector.revisar(propias), al_terminar=terminar,
+                                 al_error=fallar)
+        except sqlite3.Error as e:
+            fallar(e)
+
+    def _aplicar_cambios_externos(self, cambios):
+        # Lo propio ya no llega aquí: el detector lo salta por (usuario, fecha)
+        for tabla, filas in cambios.items():
+            if tabla not in self.suscriptores:
+                continue
+            if tabla == "almacenes":
+                self.almacenes.invalidar()   # Pudo cambiar el nombre de alguno
+            if filas is None or len(filas) > MAX_AVISOS_POR_FILA:
+                self._notificar(tabla, "varios", None)
+            else:
+                for item_id, tipo in filas.items():
+                    self._notificar(tabla, tipo, item_id)
+
+    # --- Existencia baja ---
+
+    def _revisar_existencias_periodico(self):
+        self.after(INTERVALO_ALERTAS_MS, self._revisar_existencias_periodico)
+        self.revisar_existencias()
+
+    def revisar_existencias(self):
+        """Una revisión en el ejecutor; solo vuelve a contar si hubo cambios desde la anterior."""
+        if self.revisando_existencias:
+            return
+
+        def terminar(total):
+            self.revisando_existencias = False
+            if total is not None:
+                self.texto_existencia_baja.set(f"⚠ {total} con existencia baja" if total else "")
+
+        def fallar(e):
+            self.revisando_existencias = False
+            print(f"Error al revisar existencias: {e}")
+
+        self.revisando_existencias = True
+        try:
+            self.ejecutor.enviar(lambda conn, tarea: self.revisor_existencias.revisar(conn),
+                                 al_terminar=terminar, al_error=fallar)
+        except sqlite3.Error as e:
+            fallar(e)
+
+    # --- Escritura diferida (captura rápida) ---
+
+    def encolar_producto(self, valores):
+        """Guarda un alta en el diario y la cola; se aplica en el siguiente vaciado. Lanza OSError."""
+        self.escrituras.encolar_producto(valores)
+        if self.escrituras.lote_lleno():
+            self.vaciar_escrituras()
+        self._actualizar_estado_escrituras()
+
+    def _vaciado_periodico(self):
+        self.vaciar_escrituras()
+        self.after(INTERVALO_MS, self._vaciado_periodico)
+
+    def vaciar_escrituras(self):
+        """Aplica un lote de altas pendientes en un hilo de trabajo (un vaciado a la vez)."""
+        if self.escrituras.vaciando() or not self.escrituras.pendientes():
+            return
+        lote = self.escrituras.tomar_lote()
+        # Cada alta lleva la fecha de cuando se capturó (valores: ..., fecha, usuario)
+        self.escrituras_propias.extend((entrada["valores"][6], entrada["valores"][5]) for entrada in lote)
+
+        def terminar(resultado):
+            aplicadas, rechazadas = resultado
+            self.escrituras.confirmar(aplicadas, rechazadas)
+            nuevos = [nuevo_id for _, nuevo_id in aplicadas if nuevo_id is not None]
+            if len(nuevos) > MAX_AVISOS_POR_FILA:
+                self.publicar_cambio("productos", "varios", None)
+            else:
+                for nuevo_id in nuevos:
+                    self.publicar_cambio("productos", "insertado", nuevo_id)
+            self._actualizar_estado_escrituras()
+
+        def fallar(e):
+            # Siguen en el diario: se reintentan en el siguiente vaciado
+            self.escrituras.devolver()
+            print(f"No se pudieron aplicar las escrituras diferidas: {e}")
+            self._actualizar_estado_escrituras(error=e)
+
+        try:
+            self.ejecutor.enviar(lambda conn, tarea: aplicar_lote(conn, lote), al_terminar=terminar,
+                                 al_error=fallar, reintentos=REINTENTOS_OCUPADA)
+        except sqlite3.Error as e:
+            fallar(e)
+
+    def _actualizar_estado_escrituras(self, error=None):
+        cola = self.escrituras
+        texto = f"Captura rápida: {cola.pendientes()} pendientes, {cola.aplicadas} guardados"
+        if cola.rechazadas:
+            texto += f", {cola.rechazadas} rechazados"
+        if error is not None:
+            texto += f" (reintentando: {error})"
+        self.estado_escrituras.set(texto)
+
+    def _vaciar_al_cerrar(self):
+        """Aplica todo lo pendiente antes de salir; si falla, queda en el diario para la próxima vez."""
+        if not self.escrituras.pendientes():
+            return
+        lote = self.escrituras.tomar_lote(todo=True)
+        try:
+            with self.bd.conexion() as conn:
+                aplicadas, rechazadas = reintentar_si_ocupada(conn, lambda: aplicar_lote(conn, lote))
+            self.escrituras.confirmar(aplicadas, rechazadas)
+            print(f"Escrituras diferidas aplicadas al cerrar: {len(aplicadas)}")
+        except sqlite3.Error as e:
+            self.escrituras.devolver()
+            print(f"Quedan {self.escrituras.pendientes()} escrituras en el diario; se aplicarán al volver a abrir: {e}")
+
+    def cerrar_aplicacion(self):
+        """Aplica las escrituras diferidas, cierra el pool de conexiones e informa cuántas se reutilizaron."""
+        self._vaciar_al_cerrar()
+        stats = self.bd.estadisticas()
+        print(f"Conexiones abiertas: {stats['abiertas']}, reutilizadas: {stats['reutilizadas']}")
+        self.ejecutor.cerrar()
+        if self.detector is not None:
+            self.detector.cerrar()
+        self.bd.cerrar()
+        self.destroy()
     
     # --- FIN DE MÉTODOS DE APP ---
         
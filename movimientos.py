@@ -0,0 +1,210 @@
+import sqlite3
+import sys
+import time
+import datetime
+import argparse
+
+from base_datos import PRAGMAS_CONEXION
+
+DB_NAME = "InventarioBD_2.db"
+
+# --- Libro de movimientos ---
+# Ver "Libro de movimientos de inventario" en setup_database.py.
+# La existencia según el libro se lee del último corte del producto más los
+# movimientos posteriores. Al contabilizar se hace un corte nuevo en cuanto un
+# producto junta CORTE_CADA movimientos, así leer una existencia nunca suma más
+# de CORTE_CADA filas aunque el libro tenga millones.
+
+TIPOS_MOVIMIENTO = ("entrada", "salida", "traspaso", "ajuste")
+CORTE_CADA = 500
+
+SQL_INSERTAR_MOVIMIENTO = """
+    INSERT INTO movimientos (producto, tipo, cantidad, referencia, usuario, fecha)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+SQL_APLICAR_A_PRODUCTO = """
+    UPDATE productos SET
+        cantidad = cantidad + ?,
+        fecha_ultima_modificacion = ?, ultimo_usuario_en_modificar = ?, version = version + 1
+    WHERE id = ?
+"""
+SQL_ULTIMO_CORTE = """
+    SELECT movimiento, existencia FROM cortes_existencias
+    WHERE producto = ?
+    ORDER BY movimiento DESC
+    LIMIT 1
+"""
+SQL_DESDE_CORTE = """
+    SELECT COUNT(*), IFNULL(SUM(cantidad), 0), MAX(id)
+    FROM movimientos
+    WHERE producto = ? AND id > ?
+"""
+
+
+def validar_movimiento(producto, tipo, cantidad):
+    """
+    (producto, tipo, cantidad) -> (producto, tipo, cantidad con signo).
+    Entradas y salidas se capturan en positivo (la salida se guarda negativa);
+    traspasos y ajustes ya traen su signo. Lanza ValueError si no es válido.
+    """
+    if tipo not in TIPOS_MOVIMIENTO:
+        raise ValueError(f"Tipo de movimiento desconocido '{tipo}'")
+    try:
+        producto = int(producto)
+        cantidad = int(cantidad)
+    except (TypeError, ValueError):
+        raise ValueError("Producto y cantidad deben ser enteros")
+    if cantidad == 0:
+        raise ValueError("La cantidad de un movimiento no puede ser cero")
+    if tipo in ("entrada", "salida"):
+        if cantidad < 0:
+            raise ValueError(f"La cantidad de una {tipo} se captura en positivo")
+        if tipo == "salida":
+            cantidad = -cantidad
+    return producto, tipo, cantidad
+
+
+def contabilizar_movimientos(conn, movimientos, usuario, referencia=None, fecha=None):
+    """
+    Registra un lote de movimientos [(producto, tipo, cantidad), ...] en UNA
+    transacción IMMEDIATE y aplica a cada producto la suma de los suyos.
+    Si un producto no existe o su existencia quedaría negativa, no se
+    registra nada y se lanza ValueError.
+
+    Devuelve un dict con movimientos, productos y segundos.
+    """
+    inicio = time.perf_counter()
+    fecha = fecha or datetime.datetime.now().isoformat()
+    validados = [validar_movimiento(*m) for m in movimientos]
+    deltas = {}
+    for producto, _, cantidad in validados:
+        deltas[producto] = deltas.get(producto, 0) + cantidad
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(SQL_INSERTAR_MOVIMIENTO, ((producto, tipo, cantidad, referencia, usuario, fecha)
+                                                   for producto, tipo, cantidad in validados))
+        # Los triggers de productos no deben registrar esto otra vez como ajuste
+        conn.execute("INSERT INTO movimiento_en_curso (id) VALUES (1)")
+        for producto, delta in deltas.items():
+            try:
+                cursor = conn.execute(SQL_APLICAR_A_PRODUCTO, (delta, fecha, usuario, producto))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"La existencia del producto {producto} quedaría negativa")
+            if cursor.rowcount == 0:
+                raise ValueError(f"El producto {producto} no existe")
+        conn.execute("DELETE FROM movimiento_en_curso")
+        for producto in deltas:
+            hacer_corte(conn, producto, minimo=CORTE_CADA, fecha=fecha)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    return {"movimientos": len(validados), "productos": len(deltas), "segundos": time.perf_counter() - inicio}
+
+
+def hacer_corte(conn, producto, minimo=1, fecha=None):
+    """
+    Guarda la existencia de 'producto' hasta su último movimiento si desde el
+    corte anterior hay al menos 'minimo' movimientos. No hace commit.
+    """
+    desde, base = conn.execute(SQL_ULTIMO_CORTE, (producto,)).fetchone() or (0, 0)
+    cuantos, suma, ultimo = conn.execute(SQL_DESDE_CORTE, (producto, desde)).fetchone()
+    if cuantos and cuantos >= minimo:
+        conn.execute("INSERT INTO cortes_existencias (producto, movimiento, existencia, fecha) VALUES (?, ?, ?, ?)",
+                     (producto, ultimo, base + suma, fecha or datetime.datetime.now().isoformat()))
+
+
+def existencia(conn, producto):
+    """Existencia según el libro: último corte + movimientos posteriores."""
+    desde, base = conn.execute(SQL_ULTIMO_CORTE, (producto,)).fetchone() or (0, 0)
+    return base + conn.execute(SQL_DESDE_CORTE, (producto, desde)).fetchone()[1]
+
+
+def cortar_todo(conn, minimo=1):
+    """Corte de todos los productos con movimientos nuevos, en una sola sentencia. Devuelve cuántos."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute("""
+            INSERT INTO cortes_existencias (producto, movimiento, existencia, fecha)
+            WITH ultimo AS (
+                SELECT c.producto, c.movimiento, c.existencia
+                FROM cortes_existencias c
+                WHERE c.movimiento = (SELECT MAX(movimiento) FROM cortes_existencias WHERE producto = c.producto)
+            )
+            SELECT m.producto, MAX(m.id), IFNULL(u.existencia, 0) + SUM(m.cantidad), ?
+            FROM movimientos m
+            LEFT JOIN ultimo u ON u.producto = m.producto
+            WHERE m.id > IFNULL(u.movimiento, 0)
+            GROUP BY m.producto
+            HAVING COUNT(*) >= ?
+        """, (datetime.datetime.now().isoformat(), minimo))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return cursor.rowcount
+
+
+def verificar(conn):
+    """
+    Recalcula desde cero la existencia de cada producto con todo el libro y
+    la compara con productos.cantidad y con cada corte guardado.
+    Devuelve un dict con las listas de diferencias.
+    """
+    cantidades = conn.execute("""
+        SELECT p.id, p.cantidad, IFNULL(SUM(m.cantidad), 0) AS libro
+        FROM productos p
+        LEFT JOIN movimientos m ON m.producto = p.id
+        GROUP BY p.id
+        HAVING p.cantidad <> libro
+    """).fetchall()
+    cortes = conn.execute("""
+        SELECT c.producto, c.movimiento, c.existencia,
+               (SELECT IFNULL(SUM(m.cantidad), 0) FROM movimientos m
+                WHERE m.producto = c.producto AND m.id <= c.movimiento) AS libro
+        FROM cortes_existencias c
+        WHERE c.existencia <> libro
+    """).fetchall()
+    productos, total_movimientos = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM productos), (SELECT COUNT(*) FROM movimientos)").fetchone()
+    return {"productos": productos, "movimientos": total_movimientos,
+            "cantidades": cantidades, "cortes": cortes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Libro de movimientos de inventario.")
+    parser.add_argument("comando", choices=("verificar", "cortar"),
+                        help="verificar: recalcula existencias y las compara; cortar: guarda un corte de cada producto")
+    parser.add_argument("--db", default=DB_NAME)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    try:
+        if args.comando == "cortar":
+            inicio = time.perf_counter()
+            cortados = cortar_todo(conn)
+            print(f"Cortes guardados: {cortados} productos ({time.perf_counter() - inicio:.2f} s)")
+            return 0
+
+        inicio = time.perf_counter()
+        r = verificar(conn)
+        print(f"{r['productos']} productos, {r['movimientos']} movimientos ({time.perf_counter() - inicio:.2f} s)")
+        for producto, cantidad, libro in r["cantidades"][:50]:
+            print(f"  Producto {producto}: cantidad {cantidad}, según el libro {libro}")
+        for producto, movimiento, guardada, libro in r["cortes"][:50]:
+            print(f"  Corte del producto {producto} en el movimiento {movimiento}: {guardada}, según el libro {libro}")
+        if r["cantidades"] or r["cortes"]:
+            print(f"ERROR: {len(r['cantidades'])} cantidades y {len(r['cortes'])} cortes no cuadran")
+            return 1
+        print("Las existencias cuadran con el libro.")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import sqlite3
+import time
+import datetime
+
+from consultas import SQL_MARCAR_AUTOR, SQL_LIMPIAR_AUTOR
+
+# --- Operaciones masivas sobre productos ---
+# Cada operación es UNA sentencia por conjunto (UPDATE/DELETE ... WHERE id IN
+# tabla temporal) que escribe las columnas de auditoría. Todo ocurre en una
+# sola transacción: o se aplica a todos los productos o a ninguno.
+
+_AUDITORIA = "fecha_ultima_modificacion = ?, ultimo_usuario_en_modificar = ?, version = version + 1"
+
+SENTENCIAS_MASIVAS = {
+    "almacen": f"UPDATE productos SET almacen = ?, {_AUDITORIA}",
+    # Redondeado al centavo: precio_centavos es INTEGER en una tabla STRICT
+    "precio_porcentaje": f"UPDATE productos SET precio_centavos = CAST(ROUND(precio_centavos * (1 + ? / 100.0)) AS INTEGER), "
+                         f"{_AUDITORIA}",
+    "cantidad": f"UPDATE productos SET cantidad = ?, {_AUDITORIA}",
+    # NULL: vuelve a usar el punto de reorden de su departamento
+    "punto_reorden": f"UPDATE productos SET punto_reorden = ?, {_AUDITORIA}",
+    "eliminar": "DELETE FROM productos",
+}
+
+NOMBRES_OPERACIONES = {
+    "almacen": "Cambiar almacén",
+    "precio_porcentaje": "Ajustar precio (%)",
+    "cantidad": "Fijar cantidad",
+    "punto_reorden": "Fijar punto de reorden",
+    "eliminar": "Eliminar",
+}
+
+
+def validar_valor(conn, operacion, valor):
+    """Convierte el valor capturado al tipo de la operación. Lanza ValueError si no es válido."""
+    if operacion not in SENTENCIAS_MASIVAS:
+        raise ValueError(f"Operación desconocida '{operacion}'")
+    if operacion == "eliminar":
+        return None
+    if operacion == "punto_reorden" and str(valor).strip() == "":
+        return None
+    try:
+        if operacion == "precio_porcentaje":
+            valor = float(valor)
+        else:
+            valor = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError("El valor debe ser numérico")
+
+    if operacion == "precio_porcentaje" and valor <= -100:
+        raise ValueError("El ajuste de precio debe ser mayor a -100 %")
+    if operacion == "cantidad" and valor < 0:
+        raise ValueError("La cantidad no puede ser negativa")
+    if operacion == "punto_reorden" and valor < 0:
+        raise ValueError("El punto de reorden no puede ser negativo")
+    if operacion == "almacen" and conn.execute("SELECT 1 FROM almacenes WHERE id = ?", (valor,)).fetchone() is None:
+        raise ValueError("El almacén no existe")
+    return valor
+
+
+def aplicar_operacion_masiva(conn, operacion, valor, usuario, ids=None, where="WHERE 1=1", params=(),
+                             tam_lote=5000, al_progreso=None, fecha=None):
+    """
+    Aplica 'operacion' a los productos con id en 'ids' o, si ids es None, a
+    todos los que cumplen el filtro 'where' (el de filtros_productos, alias p).
+
+    - Los ids se copian primero a una tabla temporal; así el filtro se evalúa
+      una sola vez y no cambia mientras se modifican las filas.
+    - Se procesa en tramos de 'tam_lote' ids dentro de la MISMA transacción,
+      solo para poder llamar al_progreso(procesados, total) entre tramos
+      (puede lanzar una excepción para cancelar: se revierte todo).
+    - Los borrados dejan usuario y fecha en autor_eliminacion para el historial.
+    - 'fecha' (por omisión, ahora) es la misma para todas las filas.
+
+    Devuelve un dict con afectados, total y segundos.
+    """
+    inicio = time.perf_counter()
+    fecha = fecha or datetime.datetime.now().isoformat()
+    valor = validar_valor(conn, operacion, valor)
+    sentencia = SENTENCIAS_MASIVAS[operacion]
+    valores = () if operacion == "eliminar" else (valor, fecha, usuario)
+
+    # IMMEDIATE: tomamos el candado de escritura antes de leer qué filas cambian
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS ids_masivos (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.ids_masivos")
+        if ids is not None:
+            conn.executemany("INSERT OR IGNORE INTO temp.ids_masivos (id) VALUES (?)", ((int(i),) for i in ids))
+        else:
+            conn.execute(f"INSERT INTO temp.ids_masivos (id) SELECT p.id FROM productos p {where}", params)
+        total, ultimo = conn.execute("SELECT COUNT(*), MIN(id) - 1 FROM temp.ids_masivos").fetchone()
+
+        if operacion == "eliminar":
+            conn.execute(SQL_MARCAR_AUTOR, (usuario, fecha))
+
+        afectados = 0
+        procesados = 0
+        while procesados < total:
+            hasta, cuantos = conn.execute(
+                "SELECT MAX(id), COUNT(*) FROM (SELECT id FROM temp.ids_masivos WHERE id > ? ORDER BY id LIMIT ?)",
+                (ultimo, tam_lote)).fetchone()
+            cursor = conn.execute(
+                f"{sentencia} WHERE id IN (SELECT id FROM temp.ids_masivos WHERE id > ? AND id <= ?)",
+                valores + (ultimo, hasta))
+            afectados += cursor.rowcount
+            procesados += cuantos
+            ultimo = hasta
+            if al_progreso:
+                al_progreso(procesados, total)
+
+        if operacion == "eliminar":
+            conn.execute(SQL_LIMPIAR_AUTOR)
+        conn.execute("DELETE FROM temp.ids_masivos")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    return {"afectados": afectados, "total": total, "segundos": time.perf_counter() - inicio}
@@ -0,0 +1,437 @@
+import sqlite3
+import re
+import json
+import time
+import secrets
+import datetime
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from base_datos import PoolConexiones, CacheAlmacenes, reintentar_si_ocupada
+from setup_database import aplicar_migraciones, hash_password
+from movimientos import contabilizar_movimientos
+from consultas import (filtros_productos, filtros_almacenes, pagina_productos, nombres_de_almacen,
+                       indice_fts_disponible, puede_editar, a_centavos, a_cantidad, actualizar_con_version, eliminar_con_autor,
+                       ConflictoDeVersion, SELECT_ALMACENES, ORDEN_PRODUCTOS, ORDEN_ALMACENES, orden_almacenes,
+                       SQL_LOGIN, SQL_REGISTRAR_INICIO_SESION, SQL_PRODUCTO_POR_ID, SQL_INSERTAR_PRODUCTO,
+                       SQL_ACTUALIZAR_PRODUCTO, SQL_ELIMINAR_PRODUCTO, SQL_ALMACEN_POR_ID, SQL_INSERTAR_ALMACEN,
+                       SQL_ACTUALIZAR_ALMACEN, SQL_ELIMINAR_ALMACEN)
+
+# Servidor HTTP/JSON para clientes sin interfaz (escáneres, tablero web).
+# Usa las mismas consultas que main.py (consultas.py) y los mismos roles.
+#
+#   POST   /login                 {"usuario", "contraseña"} -> {"token", "rol"}
+#   GET    /productos             filtros: nombre, departamento, almacen, precio_min, precio_max,
+#                                 usuario, desde, hasta; orden, desc=1; paginación: despues=<id>, limite
+#   GET    /productos/<id>
+#   POST   /productos             {"nombre", "precio", "cantidad", "departamento", "almacen"}
+#                                 (precio con hasta 2 decimales, cantidad entera; ambos >= 0)
+#   PUT    /productos/<id>        mismos campos + versión (If-Match: "<version>" o "version" en el cuerpo)
+#   DELETE /productos/<id>
+#   (igual para /almacenes con el campo "nombre"; sus filtros: nombre, usuario, desde, hasta)
+#   POST   /movimientos           {"referencia", "movimientos": [{"producto", "tipo", "cantidad"}, ...]}
+#                                 (todo el lote en una transacción: se aplica completo o nada)
+#
+# Todas las rutas salvo /login piden "Authorization: Bearer <token>".
+# Las listas llevan ETag: cambia solo cuando se agrega una fila a
+# historial_cambios, así que un sondeo con If-None-Match recibe 304 con una
+# sola lectura de MAX(id).
+
+DB_NAME = "InventarioBD_2.db"
+DURACION_SESION = 8 * 3600     # Segundos que dura un token
+LIMITE_PAGINA = 100
+LIMITE_PAGINA_MAX = 1000
+TAM_MAX_CUERPO = 1_000_000
+ESPERA_INACTIVA = 10           # Segundos que una conexión persistente puede quedarse sin pedir nada
+
+_RUTA = re.compile(r"^/(productos|almacenes)(?:/(\d+))?/?$")
+
+
+class ErrorAPI(Exception):
+    """Error que se responde al cliente con su código HTTP."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+# --- Conversión de filas a JSON ---
+
+def _producto(fila):
+    id_, nombre, precio, cantidad, departamento, almacen, fecha, usuario = fila
+    return {"id": id_, "nombre": nombre, "precio": precio, "cantidad": cantidad, "departamento": departamento,
+            "almacen": almacen, "fecha_ultima_modificacion": fecha, "ultimo_usuario_en_modificar": usuario}
+
+
+def _almacen(fila):
+    id_, nombre, fecha, usuario, num_productos, unidades, valor = fila
+    return {"id": id_, "nombre": nombre, "fecha_ultima_modificacion": fecha, "ultimo_usuario_en_modificar": usuario,
+            "productos": num_productos, "unidades": unidades, "valor": valor}
+
+
+class ServidorAPI(ThreadingHTTPServer):
+    """
+    Atiende las peticiones con un número fijo de hilos (no uno nuevo por
+    petición) y un pool con una conexión por hilo.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, direccion, db_name=DB_NAME, hilos=8):
+        super().__init__(direccion, ManejadorAPI)
+        self.pool = PoolConexiones(db_name, max_conexiones=hilos)
+        self.almacenes = CacheAlmacenes(self.pool)
+        with self.pool.conexion() as conn:
+            aplicar_migraciones(conn)
+            self.fts_disponible = indice_fts_disponible(conn)
+        self._hilos = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="api")
+        self._sesiones = {}   # token -> (usuario, rol, expira)
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        self._hilos.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        # Sin esperar: un cliente conectado no debe impedir que el servidor termine
+        super().server_close()
+        self._hilos.shutdown(wait=False, cancel_futures=True)
+        self.pool.cerrar()
+
+    # --- Sesiones ---
+
+    def abrir_sesion(self, usuario, rol):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sesiones[token] = (usuario, rol, time.time() + DURACION_SESION)
+        return token
+
+    def sesion(self, token):
+        with self._lock:
+            datos = self._sesiones.get(token)
+            if datos is None:
+                return None
+            if datos[2] < time.time():
+                del self._sesiones[token]
+                return None
+            return datos[0], datos[1]
+
+
+class ManejadorAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Conexiones persistentes para los clientes que sondean
+    # Cada conexión abierta ocupa un hilo del pool: la que no pide nada en
+    # ESPERA_INACTIVA segundos se cierra para no dejar sin hilos a los demás
+    timeout = ESPERA_INACTIVA
+    server_version = "InventarioAPI/1.0"
+
+    # --- Entrada / salida ---
+
+    def log_message(self, formato, *args):
+        print(f"[API] {self.address_string()} {formato % args}")
+
+    def _responder(self, estado, cuerpo=None, etag=None):
+        datos = b"" if cuerpo is None else json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        if etag:
+            self.send_header("ETag", etag)
+        if estado not in (204, 304):
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        if datos:
+            self.wfile.write(datos)
+
+    def _leer_json(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        if largo > TAM_MAX_CUERPO:
+            raise ErrorAPI(413, "Cuerpo demasiado grande")
+        try:
+            datos = json.loads(self.rfile.read(largo) or b"{}")
+        except (ValueError, UnicodeDecodeError):
+            raise ErrorAPI(400, "El cuerpo debe ser JSON")
+        if not isinstance(datos, dict):
+            raise ErrorAPI(400, "El cuerpo debe ser un objeto JSON")
+        return datos
+
+    def _usuario(self):
+        encabezado = self.headers.get("Authorization", "")
+        sesion = self.server.sesion(encabezado[7:]) if encabezado.startswith("Bearer ") else None
+        if sesion is None:
+            raise ErrorAPI(401, "Inicie sesión en /login y envíe 'Authorization: Bearer <token>'")
+        return sesion
+
+    def _exigir_edicion(self, rol, tabla):
+        if not puede_editar(rol, tabla):
+            raise ErrorAPI(403, f"El rol {rol} no puede modificar {tabla}")
+
+    def _atender(self, metodo):
+        try:
+            url = urlsplit(self.path)
+            if url.path == "/login" and metodo == "POST":
+                return self._login()
+            if url.path.rstrip("/") == "/movimientos" and metodo == "POST":
+                usuario, rol = self._usuario()
+                self._exigir_edicion(rol, "productos")
+                return self._contabilizar(usuario)
+            ruta = _RUTA.match(url.path)
+            if ruta is None:
+                raise ErrorAPI(404, "Ruta desconocida")
+            usuario, rol = self._usuario()
+            tabla, item_id = ruta.group(1), ruta.group(2)
+            item_id = int(item_id) if item_id else None
+            parametros = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+            if metodo == "GET":
+                return self._listar(tabla, parametros) if item_id is None else self._obtener(tabla, item_id)
+            self._exigir_edicion(rol, tabla)
+            if metodo == "POST" and item_id is None:
+                return self._crear(tabla, usuario)
+            if metodo == "PUT" and item_id is not None:
+                return self._actualizar(tabla, item_id, usuario)
+            if metodo == "DELETE" and item_id is not None:
+                return self._eliminar(tabla, item_id, usuario)
+            raise ErrorAPI(405, "Método no permitido en esta ruta")
+        except ErrorAPI as e:
+            self._responder(e.estado, {"error": str(e)})
+        except ConflictoDeVersion as e:
+            self._responder(409, {"error": str(e)})
+        except ValueError as e:
+            self._responder(400, {"error": str(e)})
+        except sqlite3.IntegrityError as e:
+            # UNIQUE / FOREIGN KEY chocan con datos existentes; NOT NULL / CHECK son datos inválidos
+            estado = 400 if ("NOT NULL" in str(e) or "CHECK" in str(e)) else 409
+            self._responder(estado, {"error": f"Restricción de la base de datos: {e}"})
+        except sqlite3.Error as e:
+            print(f"[API] Error de base de datos: {e}")
+            self._responder(503 if "locked" in str(e) else 500, {"error": f"Error de base de datos: {e}"})
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def do_DELETE(self):
+        self._atender("DELETE")
+
+    # --- Inicio de sesión (misma verificación que LoginPage) ---
+
+    def _login(self):
+        datos = self._leer_json()
+        usuario = self._texto(datos, "usuario") or ""
+        password = self._texto(datos, "contraseña") or self._texto(datos, "password") or ""
+        with self.server.pool.conexion() as conn:
+            fila = conn.execute(SQL_LOGIN, (usuario,)).fetchone()
+            if not fila or fila[0] != hash_password(password):
+                raise ErrorAPI(401, "Usuario o contraseña incorrectos")
+            conn.execute(SQL_REGISTRAR_INICIO_SESION, (datetime.datetime.now().isoformat(), usuario))
+            conn.commit()
+        _, rol, nombre = fila
+        self._responder(200, {"token": self.server.abrir_sesion(nombre, rol), "usuario": nombre, "rol": rol,
+                              "expira_en": DURACION_SESION})
+
+    # --- Lectura ---
+
+    def _marca_de_cambios(self, conn):
+        # Toda escritura deja una fila en el historial (triggers): su último id
+        # sirve de versión de toda la base. MAX(id) es una sola búsqueda en el árbol.
+        return f'W/"h{conn.execute("SELECT MAX(id) FROM historial_cambios").fetchone()[0] or 0}"'
+
+    def _listar(self, tabla, p):
+        with self.server.pool.conexion() as conn:
+            etag = self._marca_de_cambios(conn)
+            if self.headers.get("If-None-Match") == etag:
+                return self._responder(304, etag=etag)
+
+            descendente = p.get("desc") in ("1", "true")
+            if tabla == "productos":
+                orden = p.get("orden", "id")
+                if orden not in ORDEN_PRODUCTOS:
+                    raise ErrorAPI(400, f"orden debe ser uno de: {', '.join(ORDEN_PRODUCTOS)}")
+                try:
+                    limite = max(1, min(LIMITE_PAGINA_MAX, int(p.get("limite", LIMITE_PAGINA))))
+                    despues = int(p["despues"]) if p.get("despues") else None
+                except ValueError:
+                    raise ErrorAPI(400, "limite y despues deben ser enteros")
+                where, params = filtros_productos(
+                    p.get("nombre", ""), p.get("departamento", ""), p.get("almacen", ""),
+                    p.get("precio_min", ""), p.get("precio_max", ""), p.get("usuario", ""),
+                    p.get("desde", ""), p.get("hasta", ""), usar_fts=self.server.fts_disponible)
+                filas = pagina_productos(conn, where, params, "inicio" if despues is None else "despues", despues,
+                                         limite, orden, descendente)
+                filas = nombres_de_almacen(filas, self.server.almacenes, conn)
+                cuerpo = {"productos": [_producto(f) for f in filas],
+                          "siguiente": filas[-1][0] if len(filas) == limite else None}
+            else:
+                orden = p.get("orden", "id")
+                if orden not in ORDEN_ALMACENES:
+                    raise ErrorAPI(400, f"orden debe ser uno de: {', '.join(ORDEN_ALMACENES)}")
+                where, params = filtros_almacenes(p.get("nombre", ""), p.get("usuario", ""), p.get("desde", ""),
+                                                  p.get("hasta", ""), usar_fts=self.server.fts_disponible)
+                filas = conn.execute(f"{SELECT_ALMACENES} {where} {orden_almacenes(orden, descendente)}",
+                                     params).fetchall()
+                cuerpo = {"almacenes": [_almacen(f) for f in filas]}
+        self._responder(200, cuerpo, etag=etag)
+
+    def _obtener(self, tabla, item_id):
+        with self.server.pool.conexion() as conn:
+            if tabla == "productos":
+                fila = conn.execute(SQL_PRODUCTO_POR_ID, (item_id,)).fetchone()
+                if fila is None:
+                    raise ErrorAPI(404, "No existe el producto")
+                nombre, centavos, cantidad, departamento, almacen, version = fila
+                cuerpo = {"id": item_id, "nombre": nombre, "precio": centavos / 100, "cantidad": cantidad,
+                          "departamento": departamento, "almacen_id": almacen,
+                          "almacen": self.server.almacenes.nombre_de(almacen, conn), "version": version}
+            else:
+                fila = conn.execute(SQL_ALMACEN_POR_ID, (item_id,)).fetchone()
+                if fila is None:
+                    raise ErrorAPI(404, "No existe el almacén")
+                cuerpo = {"id": item_id, "nombre": fila[0], "version": fila[1]}
+        etag = f'"{cuerpo["version"]}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._responder(304, etag=etag)
+        self._responder(200, cuerpo, etag=etag)
+
+    # --- Escritura (mismo SQL y reglas que los formularios de edición) ---
+
+    @staticmethod
+    def _texto(datos, campo):
+        """Valor de un campo de texto (o None si falta); otro tipo de JSON es un 400."""
+        valor = datos.get(campo)
+        if valor is not None and not isinstance(valor, str):
+            raise ErrorAPI(400, f"'{campo}' debe ser texto")
+        return valor
+
+    def _valores_producto(self, datos, conn):
+        nombre = (self._texto(datos, "nombre") or "").strip()
+        departamento = self._texto(datos, "departamento")
+        almacen = datos.get("almacen")
+        if isinstance(almacen, bool) or not isinstance(almacen, (str, int, type(None))):
+            raise ErrorAPI(400, "'almacen' debe ser el nombre o el id de un almacén")
+        if isinstance(almacen, str):
+            almacen = self.server.almacenes.id_de(almacen, conn)
+        elif almacen is not None and self.server.almacenes.nombre_de(almacen, conn) is None:
+            almacen = None
+        if not nombre or almacen is None:
+            raise ErrorAPI(400, "Nombre y un almacén existente son obligatorios")
+        try:
+            precio = a_centavos(datos.get("precio"))
+            cantidad = a_cantidad(datos.get("cantidad"))
+        except ValueError as e:
+            raise ErrorAPI(400, str(e))
+        return nombre, precio, cantidad, departamento, almacen
+
+    def _version(self, datos):
+        version = self.headers.get("If-Match", "").strip('W/"') or datos.get("version")
+        if version in (None, ""):
+            raise ErrorAPI(428, "Falta la versión: envíe If-Match o el campo 'version'")
+        try:
+            return int(version)
+        except (TypeError, ValueError):
+            raise ErrorAPI(400, "La versión debe ser un entero")
+
+    def _crear(self, tabla, usuario):
+        datos = self._leer_json()
+        fecha = datetime.datetime.now().isoformat()
+        with self.server.pool.conexion() as conn:
+            if tabla == "productos":
+                valores = self._valores_producto(datos, conn) + (fecha, usuario)
+
+                def escribir():
+                    cursor = conn.execute(SQL_INSERTAR_PRODUCTO, valores)
+                    conn.commit()
+                    return cursor.lastrowid
+            else:
+                nombre = (self._texto(datos, "nombre") or "").strip()
+                if not nombre:
+                    raise ErrorAPI(400, "El nombre es obligatorio")
+
+                def escribir():
+                    cursor = conn.execute(SQL_INSERTAR_ALMACEN, (nombre, fecha, usuario))
+                    conn.commit()
+                    self.server.almacenes.invalidar()
+                    return cursor.lastrowid
+
+            nuevo_id = reintentar_si_ocupada(conn, escribir)
+        self._responder(201, {"id": nuevo_id, "version": 0}, etag='"0"')
+
+    def _actualizar(self, tabla, item_id, usuario):
+        datos = self._leer_json()
+        version = self._version(datos)
+        fecha = datetime.datetime.now().isoformat()
+        with self.server.pool.conexion() as conn:
+            if tabla == "productos":
+                sql = SQL_ACTUALIZAR_PRODUCTO
+                valores = self._valores_producto(datos, conn) + (fecha, usuario, item_id, version)
+            else:
+                nombre = (self._texto(datos, "nombre") or "").strip()
+                if not nombre:
+                    raise ErrorAPI(400, "El nombre es obligatorio")
+                sql = SQL_ACTUALIZAR_ALMACEN
+                valores = (nombre, fecha, usuario, item_id, version)
+
+            def escribir():
+                actualizar_con_version(conn, sql, valores)
+                conn.commit()
+                if tabla == "almacenes":
+                    self.server.almacenes.invalidar()
+
+            reintentar_si_ocupada(conn, escribir)
+        self._responder(200, {"id": item_id, "version": version + 1}, etag=f'"{version + 1}"')
+
+    def _eliminar(self, tabla, item_id, usuario):
+        fecha = datetime.datetime.now().isoformat()
+        sql = SQL_ELIMINAR_PRODUCTO if tabla == "productos" else SQL_ELIMINAR_ALMACEN
+        with self.server.pool.conexion() as conn:
+            def escribir():
+                borradas = eliminar_con_autor(conn, sql, (item_id,), usuario, fecha)
+                conn.commit()
+                if tabla == "almacenes":
+                    self.server.almacenes.invalidar()
+                return borradas
+
+            if not reintentar_si_ocupada(conn, escribir):
+                raise ErrorAPI(404, "No existe el registro")
+        self._responder(204)
+
+    def _contabilizar(self, usuario):
+        datos = self._leer_json()
+        lote = datos.get("movimientos")
+        if not isinstance(lote, list) or not lote:
+            raise ErrorAPI(400, "'movimientos' debe ser una lista no vacía")
+        try:
+            movimientos = [(m["producto"], m["tipo"], m["cantidad"]) for m in lote]
+        except (KeyError, TypeError):
+            raise ErrorAPI(400, "Cada movimiento lleva 'producto', 'tipo' y 'cantidad'")
+        with self.server.pool.conexion() as conn:
+            resultado = reintentar_si_ocupada(
+                conn, lambda: contabilizar_movimientos(conn, movimientos, usuario, datos.get("referencia")))
+        self._responder(201, {"movimientos": resultado["movimientos"], "productos": resultado["productos"]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON del inventario (solo para la red local).")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--hilos", type=int, default=8, help="Peticiones atendidas a la vez (y conexiones)")
+    args = parser.parse_args()
+
+    servidor = ServidorAPI((args.host, args.puerto), args.db, args.hilos)
+    print(f"API escuchando en http://{args.host}:{args.puerto} ({args.hilos} hilos). Ctrl+C para detener.")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDeteniendo el servidor...")
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
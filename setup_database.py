@@ -1,5 +1,6 @@
 import sqlite3
 import hashlib
+import sys
 
 DB_NAME = "InventarioBD_2.db"
 
@@ -10,40 +11,676 @@ def hash_password(password):
 def check_and_add_column(cursor, table_name, column_name, column_type):
     """
     Revisa si una columna existe en una tabla. Si no, la añade.
+    Los errores se propagan para que la migración que la llama haga rollback.
     """
+    # PRAGMA table_info devuelve la lista de columnas
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    # Creamos una lista de los nombres de columnas existentes
+    existing_columns = [row[1] for row in cursor.fetchall()]
+    
+    # Si la columna no está en la lista, la añadimos
+    if column_name not in existing_columns:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+        print(f"Columna '{column_name}' añadida con éxito a la tabla '{table_name}'.")
+
+# --- Triggers que mantienen sincronizado el índice FTS5 ---
+# (Se ejecutan uno por uno: executescript() haría COMMIT a mitad de una migración)
+TRIGGERS_BUSQUEDA = (
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+        INSERT INTO productos_fts (rowid, nombre, departamento, almacen)
+        VALUES (NEW.id, NEW.nombre, NEW.departamento,
+                (SELECT nombre FROM almacenes WHERE id = NEW.almacen));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE OF nombre, departamento, almacen ON productos BEGIN
+        DELETE FROM productos_fts WHERE rowid = OLD.id;
+        INSERT INTO productos_fts (rowid, nombre, departamento, almacen)
+        VALUES (NEW.id, NEW.nombre, NEW.departamento,
+                (SELECT nombre FROM almacenes WHERE id = NEW.almacen));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+        DELETE FROM productos_fts WHERE rowid = OLD.id;
+    END
+    """,
+    # Los de almacenes también actualizan el nombre del almacén en productos_fts
+    """
+    CREATE TRIGGER IF NOT EXISTS almacenes_fts_ai AFTER INSERT ON almacenes BEGIN
+        INSERT INTO almacenes_fts (rowid, nombre) VALUES (NEW.id, NEW.nombre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS almacenes_fts_au AFTER UPDATE OF nombre ON almacenes BEGIN
+        INSERT INTO almacenes_fts (almacenes_fts, rowid, nombre) VALUES ('delete', OLD.id, OLD.nombre);
+        INSERT INTO almacenes_fts (rowid, nombre) VALUES (NEW.id, NEW.nombre);
+        UPDATE productos_fts SET almacen = NEW.nombre
+        WHERE rowid IN (SELECT id FROM productos WHERE almacen = NEW.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS almacenes_fts_ad AFTER DELETE ON almacenes BEGIN
+        INSERT INTO almacenes_fts (almacenes_fts, rowid, nombre) VALUES ('delete', OLD.id, OLD.nombre);
+        UPDATE productos_fts SET almacen = NULL
+        WHERE rowid IN (SELECT id FROM productos WHERE almacen = OLD.id);
+    END
+    """,
+)
+
+def crear_indice_busqueda(cursor):
+    """
+    Crea las tablas FTS5 para buscar productos (nombre, departamento, almacén)
+    y almacenes (nombre), las llena con los datos actuales y crea los triggers
+    que las mantienen sincronizadas. Devuelve False si SQLite no tiene FTS5.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('productos_fts', 'almacenes_fts')")
+    existentes = {row[0] for row in cursor.fetchall()}
+
     try:
-        # PRAGMA table_info devuelve la lista de columnas
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        # Creamos una lista de los nombres de columnas existentes
-        existing_columns = [row[1] for row in cursor.fetchall()]
-        
-        # Si la columna no está en la lista, la añadimos
-        if column_name not in existing_columns:
-            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
-            print(f"Columna '{column_name}' añadida con éxito a la tabla '{table_name}'.")
-        else:
-            print(f"Columna '{column_name}' ya existe en la tabla '{table_name}'.")
-            
-    except sqlite3.Error as e:
-        print(f"Error al verificar/añadir columna {column_name} en {table_name}: {e}")
+        # rowid = productos.id; 'almacen' guarda el NOMBRE del almacén para poder buscarlo
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+                nombre, departamento, almacen,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS almacenes_fts USING fts5(
+                nombre,
+                content = 'almacenes', content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 no disponible, las búsquedas usarán LIKE: {e}")
+        return False
+
+    for trigger in TRIGGERS_BUSQUEDA:
+        cursor.execute(trigger)
+
+    # --- Llenado inicial (solo la primera vez que se crean las tablas) ---
+    if 'productos_fts' not in existentes:
+        cursor.execute("""
+            INSERT INTO productos_fts (rowid, nombre, departamento, almacen)
+            SELECT p.id, p.nombre, p.departamento, a.nombre
+            FROM productos p
+            LEFT JOIN almacenes a ON p.almacen = a.id
+        """)
+        print("Índice de búsqueda 'productos_fts' creado y llenado.")
+    if 'almacenes_fts' not in existentes:
+        cursor.execute("INSERT INTO almacenes_fts (almacenes_fts) VALUES ('rebuild')")
+        print("Índice de búsqueda 'almacenes_fts' creado y llenado.")
+    return True
+
+# --- Resumen de existencias por almacén ---
+# resumen_almacenes guarda, por almacén, cuántos productos tiene, el total de
+# unidades y el valor del inventario (precio × cantidad, en centavos). Los triggers de
+# productos lo ajustan fila por fila, así la lista de almacenes no tiene que
+# hacer GROUP BY sobre todos los productos.
+
+def triggers_resumen(precio="precio_centavos", valor="valor_centavos"):
+    """
+    Triggers de resumen_almacenes. Por omisión usan las columnas actuales;
+    la migración 5 los crea con las de antes de la migración 8 (precio en
+    REAL y valor_total).
+    """
+    return (
+        f"""
+        CREATE TRIGGER IF NOT EXISTS resumen_almacenes_ai AFTER INSERT ON productos
+        WHEN NEW.almacen IS NOT NULL BEGIN
+            INSERT INTO resumen_almacenes (almacen, num_productos, total_unidades, {valor})
+            VALUES (NEW.almacen, 1, NEW.cantidad, NEW.{precio} * NEW.cantidad)
+            ON CONFLICT (almacen) DO UPDATE SET
+                num_productos = num_productos + 1,
+                total_unidades = total_unidades + excluded.total_unidades,
+                {valor} = {valor} + excluded.{valor};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS resumen_almacenes_au AFTER UPDATE OF {precio}, cantidad, almacen ON productos BEGIN
+            UPDATE resumen_almacenes SET
+                num_productos = num_productos - 1,
+                total_unidades = total_unidades - OLD.cantidad,
+                {valor} = {valor} - OLD.{precio} * OLD.cantidad
+            WHERE almacen = OLD.almacen;
+            INSERT INTO resumen_almacenes (almacen, num_productos, total_unidades, {valor})
+            SELECT NEW.almacen, 1, NEW.cantidad, NEW.{precio} * NEW.cantidad
+            WHERE NEW.almacen IS NOT NULL
+            ON CONFLICT (almacen) DO UPDATE SET
+                num_productos = num_productos + 1,
+                total_unidades = total_unidades + excluded.total_unidades,
+                {valor} = {valor} + excluded.{valor};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS resumen_almacenes_ad AFTER DELETE ON productos BEGIN
+            UPDATE resumen_almacenes SET
+                num_productos = num_productos - 1,
+                total_unidades = total_unidades - OLD.cantidad,
+                {valor} = {valor} - OLD.{precio} * OLD.cantidad
+            WHERE almacen = OLD.almacen;
+        END
+        """,
+    )
+
+def reconstruir_resumen_almacenes(cursor, precio="precio_centavos", valor="valor_centavos"):
+    """Recalcula resumen_almacenes desde cero (si alguna vez se desincroniza)."""
+    cursor.execute("DELETE FROM resumen_almacenes")
+    cursor.execute(f"""
+        INSERT INTO resumen_almacenes (almacen, num_productos, total_unidades, {valor})
+        SELECT almacen, COUNT(*), SUM(cantidad), SUM({precio} * cantidad)
+        FROM productos
+        WHERE almacen IS NOT NULL
+        GROUP BY almacen
+    """)
+
+# --- Historial de cambios ---
+# historial_cambios es de solo inserción: cada INSERT, UPDATE y DELETE sobre
+# productos y almacenes deja una fila con los valores anteriores y nuevos (JSON).
+# Los triggers corren dentro de la misma transacción que la edición.
+# Usuario y fecha salen de las columnas de auditoría de la fila; en un DELETE
+# ya no hay fila nueva, así que quien borra los deja antes en autor_eliminacion
+# (misma transacción; ver eliminar_con_autor en consultas.py).
+
+_AHORA = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+# {precio}: expresión del precio en el JSON. Se guarda con decimales (no en
+# centavos) para que el historial de antes y después de la migración 8 compare igual.
+_JSON_PRODUCTO = ("json_object('nombre', {t}.nombre, 'precio', {precio}, 'cantidad', {t}.cantidad, "
+                  "'departamento', {t}.departamento, 'almacen', {t}.almacen)")
+_JSON_ALMACEN = "json_object('nombre', {t}.nombre)"
+
+def triggers_historial(precio="{t}.precio_centavos / 100.0"):
+    """Triggers de historial_cambios; la migración 6 los crea con la columna precio de antes."""
+    def fila(json_fila, t):
+        return json_fila.format(t=t, precio=precio.format(t=t))
+
+    return tuple(
+        trigger
+        for tabla, json_fila in (("productos", _JSON_PRODUCTO), ("almacenes", _JSON_ALMACEN))
+        for trigger in (
+            f"""
+            CREATE TRIGGER IF NOT EXISTS historial_{tabla}_ai AFTER INSERT ON {tabla} BEGIN
+                INSERT INTO historial_cambios (tabla, registro_id, operacion, usuario, fecha, valores_antes, valores_despues)
+                VALUES ('{tabla}', NEW.id, 'insertado', NEW.ultimo_usuario_en_modificar,
+                        IFNULL(NEW.fecha_ultima_modificacion, {_AHORA}), NULL, {fila(json_fila, "NEW")});
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS historial_{tabla}_au AFTER UPDATE ON {tabla} BEGIN
+                INSERT INTO historial_cambios (tabla, registro_id, operacion, usuario, fecha, valores_antes, valores_despues)
+                VALUES ('{tabla}', NEW.id, 'actualizado', NEW.ultimo_usuario_en_modificar,
+                        IFNULL(NEW.fecha_ultima_modificacion, {_AHORA}),
+                        {fila(json_fila, "OLD")}, {fila(json_fila, "NEW")});
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS historial_{tabla}_ad AFTER DELETE ON {tabla} BEGIN
+                INSERT INTO historial_cambios (tabla, registro_id, operacion, usuario, fecha, valores_antes, valores_despues)
+                VALUES ('{tabla}', OLD.id, 'eliminado',
+                        (SELECT usuario FROM autor_eliminacion WHERE id = 1),
+                        IFNULL((SELECT fecha FROM autor_eliminacion WHERE id = 1), {_AHORA}),
+                        {fila(json_fila, "OLD")}, NULL);
+            END
+            """,
+        )
+    )
+
+# --- Precio en centavos y cantidad entera ---
+# Hasta la migración 7 los formularios escribían el texto de los Entry tal
+# cual: SQLite lo convertía a número cuando podía y si no lo guardaba como
+# TEXT ("12,50", "abc"), y los precios REAL acumulaban errores de redondeo en
+# las sumas. La migración 8 reconstruye productos como tabla STRICT con
+# precio_centavos INTEGER y cantidad INTEGER (CHECK >= 0), así los filtros de
+# rango y las sumas comparan enteros sobre el índice.
+
+# STRICT existe desde SQLite 3.37; en versiones anteriores los CHECK de typeof() hacen lo mismo
+_ES_STRICT = sqlite3.sqlite_version_info >= (3, 37, 0)
+
+def _tipo_entero(columna):
+    return "" if _ES_STRICT else f" AND typeof({columna}) = 'integer'"
+
+def _valor_corregido(valor, entero):
+    """Precio o cantidad guardados antes de la migración 8 -> número >= 0 (0 si no se puede leer)."""
+    if isinstance(valor, str):
+        texto = valor.strip().lstrip("$").strip()
+        if "," in texto:
+            texto = texto.replace(",", "") if "." in texto else texto.replace(",", ".")
+        try:
+            valor = float(texto)
+        except ValueError:
+            return 0
+    if not isinstance(valor, (int, float)) or valor < 0:
+        return 0
+    return int(round(valor)) if entero else round(valor, 2)
+
+# --- Libro de movimientos de inventario ---
+# movimientos es de solo inserción: cada entrada, salida, traspaso o ajuste
+# deja una fila con la cantidad CON SIGNO. La existencia de un producto es la
+# suma de sus movimientos; productos.cantidad es esa suma ya calculada.
+# Los triggers de productos registran como 'ajuste' lo que cambia la cantidad
+# por fuera del libro (formulario de edición, acciones masivas, altas, bajas).
+# contabilizar_movimientos (movimientos.py) deja una fila en
+# movimiento_en_curso mientras actualiza productos, para que esos triggers no
+# registren dos veces lo que ya está en el libro.
+
+TRIGGERS_MOVIMIENTOS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS movimientos_sin_cambios BEFORE UPDATE ON movimientos BEGIN
+        SELECT RAISE(ABORT, 'El libro de movimientos es de solo inserción');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movimientos_sin_borrado BEFORE DELETE ON movimientos BEGIN
+        SELECT RAISE(ABORT, 'El libro de movimientos es de solo inserción');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS movimientos_productos_ai AFTER INSERT ON productos
+    WHEN NEW.cantidad <> 0 AND NOT EXISTS (SELECT 1 FROM movimiento_en_curso) BEGIN
+        INSERT INTO movimientos (producto, tipo, cantidad, referencia, usuario, fecha)
+        VALUES (NEW.id, 'ajuste', NEW.cantidad, 'alta de producto', NEW.ultimo_usuario_en_modificar,
+                IFNULL(NEW.fecha_ultima_modificacion, {_AHORA}));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS movimientos_productos_au AFTER UPDATE OF cantidad ON productos
+    WHEN NEW.cantidad <> OLD.cantidad AND NOT EXISTS (SELECT 1 FROM movimiento_en_curso) BEGIN
+        INSERT INTO movimientos (producto, tipo, cantidad, referencia, usuario, fecha)
+        VALUES (NEW.id, 'ajuste', NEW.cantidad - OLD.cantidad, 'edición directa', NEW.ultimo_usuario_en_modificar,
+                IFNULL(NEW.fecha_ultima_modificacion, {_AHORA}));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS movimientos_productos_ad AFTER DELETE ON productos
+    WHEN OLD.cantidad <> 0 BEGIN
+        INSERT INTO movimientos (producto, tipo, cantidad, referencia, usuario, fecha)
+        VALUES (OLD.id, 'ajuste', -OLD.cantidad, 'baja de producto',
+                (SELECT usuario FROM autor_eliminacion WHERE id = 1),
+                IFNULL((SELECT fecha FROM autor_eliminacion WHERE id = 1), {_AHORA}));
+    END
+    """,
+)
+
+# --- Migraciones del esquema ---
+# Cada migración se aplica UNA sola vez, en orden y dentro de su propia transacción.
+# PRAGMA user_version guarda el número de la última migración aplicada.
+
+def migracion_tablas_base(cursor):
+    """Tablas base (para bases nuevas) y columnas de rol y auditoría (para bases viejas)."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS usuarios (
+        ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        NOMBRE TEXT UNIQUE NOT NULL,
+        CONTRASEÑA TEXT NOT NULL,
+        "ULTIMO INICIO DE SESION" TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS almacenes (
+        id INTEGER PRIMARY KEY,
+        nombre TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS productos (
+        id INTEGER PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        precio REAL NOT NULL,
+        cantidad INTEGER NOT NULL,
+        departamento TEXT NOT NULL,
+        almacen INTEGER
+    )
+    ''')
+
+    # Añadir 'rol' a 'usuarios'
+    check_and_add_column(cursor, 'usuarios', 'rol', 'TEXT')
+    
+    # Añadir columnas de auditoría a 'productos'
+    check_and_add_column(cursor, 'productos', 'fecha_ultima_modificacion', 'TEXT')
+    check_and_add_column(cursor, 'productos', 'ultimo_usuario_en_modificar', 'TEXT')
+    
+    # Añadir columnas de auditoría a 'almacenes'
+    check_and_add_column(cursor, 'almacenes', 'fecha_ultima_modificacion', 'TEXT')
+    check_and_add_column(cursor, 'almacenes', 'ultimo_usuario_en_modificar', 'TEXT')
+
+def migracion_indice_busqueda(cursor):
+    crear_indice_busqueda(cursor)
+
+def migracion_indices_filtros(cursor):
+    """
+    Índices B-tree para las columnas que main.py usa en JOIN, filtros y ORDER BY.
+    (El id va implícito al final de cada índice por ser el rowid.)
+    """
+    # Llave del LEFT JOIN almacenes y de los triggers de productos_fts
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_almacen ON productos(almacen)")
+    # Filtro de rango de precio
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_precio ON productos(precio)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_departamento ON productos(departamento)")
+    # Columnas de auditoría: por fecha, y por usuario + fecha ("lo que cambió X en tal rango")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_fecha_mod ON productos(fecha_ultima_modificacion)")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_productos_usuario_mod
+                      ON productos(ultimo_usuario_en_modificar, fecha_ultima_modificacion)""")
+    # Cubre "SELECT id, nombre FROM almacenes ORDER BY nombre" del formulario de edición
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_almacenes_nombre ON almacenes(nombre, id)")
+
+def migracion_indices_orden(cursor):
+    """
+    Índices para ordenar las listas por cualquier encabezado (ver ORDEN_PRODUCTOS
+    en consultas.py). precio, departamento y el nombre de almacén ya tienen el suyo.
+    Las columnas que admiten NULL se indexan por la misma expresión IFNULL con
+    que se ordenan; si no coincide exactamente, SQLite no usa el índice.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_cantidad ON productos(cantidad)")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_productos_orden_fecha
+                      ON productos(IFNULL(fecha_ultima_modificacion, ''))""")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_productos_orden_usuario
+                      ON productos(IFNULL(ultimo_usuario_en_modificar, ''))""")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_almacenes_orden_fecha
+                      ON almacenes(IFNULL(fecha_ultima_modificacion, ''))""")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_almacenes_orden_usuario
+                      ON almacenes(IFNULL(ultimo_usuario_en_modificar, ''))""")
+
+def migracion_resumen_almacenes(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_almacenes (
+            almacen INTEGER PRIMARY KEY,
+            num_productos INTEGER NOT NULL DEFAULT 0,
+            total_unidades INTEGER NOT NULL DEFAULT 0,
+            valor_total REAL NOT NULL DEFAULT 0
+        )
+    """)
+    for trigger in triggers_resumen(precio="precio", valor="valor_total"):
+        cursor.execute(trigger)
+    reconstruir_resumen_almacenes(cursor, precio="precio", valor="valor_total")
+
+def migracion_historial_cambios(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS historial_cambios (
+            id INTEGER PRIMARY KEY,
+            tabla TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            operacion TEXT NOT NULL,
+            usuario TEXT,
+            fecha TEXT NOT NULL,
+            valores_antes TEXT,
+            valores_despues TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS autor_eliminacion (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            usuario TEXT,
+            fecha TEXT
+        )
+    """)
+    # Rangos de fecha ("lo que cambió la semana pasada") y por usuario + fecha
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historial_fecha ON historial_cambios(tabla, fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historial_usuario ON historial_cambios(tabla, usuario, fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historial_registro ON historial_cambios(tabla, registro_id)")
+    for trigger in triggers_historial(precio="{t}.precio"):
+        cursor.execute(trigger)
+
+    # Punto de partida: la última modificación conocida de cada fila, para que
+    # los filtros por fecha también encuentren lo editado antes de esta migración
+    for tabla, json_fila in (("productos", _JSON_PRODUCTO), ("almacenes", _JSON_ALMACEN)):
+        cursor.execute(f"""
+            INSERT INTO historial_cambios (tabla, registro_id, operacion, usuario, fecha, valores_antes, valores_despues)
+            SELECT '{tabla}', id, 'migrado', ultimo_usuario_en_modificar, fecha_ultima_modificacion,
+                   NULL, {json_fila.format(t=tabla, precio=f"{tabla}.precio")}
+            FROM {tabla}
+            WHERE fecha_ultima_modificacion IS NOT NULL
+        """)
+
+def migracion_version_filas(cursor):
+    # Concurrencia optimista: cada UPDATE incrementa 'version' y solo se aplica
+    # si la fila sigue en la versión que se leyó al abrir el formulario
+    check_and_add_column(cursor, 'productos', 'version', 'INTEGER NOT NULL DEFAULT 0')
+    check_and_add_column(cursor, 'almacenes', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+def migracion_precio_centavos(cursor):
+    """
+    Reconstruye productos con precio_centavos y cantidad enteros (ver "Precio
+    en centavos" arriba) y resumen_almacenes con valor_centavos. Los ids no
+    cambian, así que productos_fts e historial_cambios siguen siendo válidos.
+    """
+    # 1. Filas que no se pueden convertir: se corrigen con un UPDATE normal,
+    #    así el valor anterior queda en historial_cambios
+    cursor.execute("""
+        SELECT id, precio, cantidad FROM productos
+        WHERE typeof(precio) NOT IN ('integer', 'real') OR precio < 0
+           OR typeof(cantidad) <> 'integer' OR cantidad < 0
+    """)
+    corregidas = [(_valor_corregido(precio, False), _valor_corregido(cantidad, True), id_)
+                  for id_, precio, cantidad in cursor.fetchall()]
+    if corregidas:
+        cursor.executemany(f"""
+            UPDATE productos SET precio = ?, cantidad = ?, fecha_ultima_modificacion = {_AHORA},
+                ultimo_usuario_en_modificar = 'migracion', version = version + 1
+            WHERE id = ?
+        """, corregidas)
+        muestra = ", ".join(str(id_) for _, _, id_ in corregidas[:20])
+        print(f"Se corrigieron {len(corregidas)} productos con precio o cantidad no válidos "
+              f"(ids {muestra}{'...' if len(corregidas) > 20 else ''}); revise el historial.")
+
+    # 2. Índices actuales de productos (menos el de precio, que cambia de columna)
+    cursor.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = 'productos' AND sql IS NOT NULL
+    """)
+    indices = [sql for nombre, sql in cursor.fetchall() if nombre != "idx_productos_precio"]
+
+    # 3. Tabla nueva, copia y cambio de nombre (DROP TABLE se lleva índices y triggers)
+    strict = " STRICT" if _ES_STRICT else ""
+    cursor.execute(f"""
+        CREATE TABLE productos_nuevo (
+            id INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            precio_centavos INTEGER NOT NULL CHECK (precio_centavos >= 0{_tipo_entero('precio_centavos')}),
+            cantidad INTEGER NOT NULL CHECK (cantidad >= 0{_tipo_entero('cantidad')}),
+            departamento TEXT NOT NULL,
+            almacen INTEGER,
+            fecha_ultima_modificacion TEXT,
+            ultimo_usuario_en_modificar TEXT,
+            version INTEGER NOT NULL DEFAULT 0
+        ){strict}
+    """)
+    cursor.execute("""
+        INSERT INTO productos_nuevo
+        SELECT id, nombre, CAST(ROUND(precio * 100) AS INTEGER), cantidad, departamento, almacen,
+               fecha_ultima_modificacion, ultimo_usuario_en_modificar, version
+        FROM productos
+    """)
+    cursor.execute("DROP TABLE productos")
+    # Los triggers de almacenes_fts mencionan productos: sin el modo legacy,
+    # RENAME los revisa y falla porque la tabla acaba de borrarse
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    cursor.execute("ALTER TABLE productos_nuevo RENAME TO productos")
+    cursor.execute("PRAGMA legacy_alter_table = OFF")
+
+    for sql in indices:
+        cursor.execute(sql)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_precio ON productos(precio_centavos)")
+
+    # 4. Triggers de productos con las columnas nuevas
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'")
+    if cursor.fetchone():
+        for trigger in TRIGGERS_BUSQUEDA:
+            cursor.execute(trigger)
+    for trigger in triggers_historial():
+        cursor.execute(trigger)
+
+    # 5. Resumen con el valor en centavos (sumas exactas)
+    cursor.execute("DROP TABLE IF EXISTS resumen_almacenes")
+    cursor.execute(f"""
+        CREATE TABLE resumen_almacenes (
+            almacen INTEGER PRIMARY KEY,
+            num_productos INTEGER NOT NULL DEFAULT 0,
+            total_unidades INTEGER NOT NULL DEFAULT 0,
+            valor_centavos INTEGER NOT NULL DEFAULT 0
+        ){strict}
+    """)
+    for trigger in triggers_resumen():
+        cursor.execute(trigger)
+    reconstruir_resumen_almacenes(cursor)
+
+def migracion_escrituras_diferidas(cursor):
+    # Claves de las altas en modo de escritura diferida que ya se aplicaron
+    # (ver escritura_diferida.py): al recuperar el diario tras una caída, una
+    # entrada cuya clave ya está aquí no se vuelve a insertar.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS escrituras_diferidas (
+            clave TEXT PRIMARY KEY,
+            fecha TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+def migracion_movimientos(cursor):
+    strict = " STRICT" if _ES_STRICT else ""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS movimientos (
+            id INTEGER PRIMARY KEY,
+            producto INTEGER NOT NULL,
+            tipo TEXT NOT NULL CHECK (tipo IN ('entrada', 'salida', 'traspaso', 'ajuste')),
+            cantidad INTEGER NOT NULL CHECK (cantidad <> 0{_tipo_entero('cantidad')}),
+            referencia TEXT,
+            usuario TEXT,
+            fecha TEXT NOT NULL
+        ){strict}
+    """)
+    # Suma de un producto a partir de un id: rango sobre el índice, sin leer la tabla
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_producto ON movimientos(producto, id, cantidad)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos(fecha)")
+    # Existencia de un producto hasta el movimiento 'movimiento' (incluido)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS cortes_existencias (
+            producto INTEGER NOT NULL,
+            movimiento INTEGER NOT NULL,
+            existencia INTEGER NOT NULL,
+            fecha TEXT NOT NULL,
+            PRIMARY KEY (producto, movimiento)
+        ) WITHOUT ROWID{"," + strict if strict else ""}
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS movimiento_en_curso (id INTEGER PRIMARY KEY CHECK (id = 1))")
+    for trigger in TRIGGERS_MOVIMIENTOS:
+        cursor.execute(trigger)
+
+    # Saldo inicial: la cantidad actual de cada producto entra al libro como ajuste
+    cursor.execute(f"""
+        INSERT INTO movimientos (producto, tipo, cantidad, referencia, usuario, fecha)
+        SELECT id, 'ajuste', cantidad, 'saldo inicial', 'migracion', {_AHORA}
+        FROM productos
+        WHERE cantidad <> 0
+        ORDER BY id
+    """)
+
+def migracion_traspasos(cursor):
+    # Encabezado de cada traspaso entre almacenes; sus renglones son los
+    # movimientos tipo 'traspaso' con referencia 'traspaso <id>' (ver traspasos.py)
+    strict = " STRICT" if _ES_STRICT else ""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS traspasos (
+            id INTEGER PRIMARY KEY,
+            origen INTEGER NOT NULL,
+            destino INTEGER NOT NULL,
+            productos INTEGER NOT NULL,
+            unidades INTEGER NOT NULL,
+            usuario TEXT,
+            fecha TEXT NOT NULL
+        ){strict}
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_traspasos_fecha ON traspasos(fecha)")
+
+def migracion_puntos_reorden(cursor):
+    # Punto de reorden propio del producto (NULL: el de su departamento) y el
+    # de cada departamento. Ver alertas_existencia.py.
+    cursor.execute(f"""
+        ALTER TABLE productos ADD COLUMN punto_reorden INTEGER
+        CHECK (punto_reorden IS NULL OR (punto_reorden >= 0{_tipo_entero('punto_reorden')}))
+    """)
+    strict = " STRICT" if _ES_STRICT else ""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS umbrales_departamento (
+            departamento TEXT PRIMARY KEY,
+            punto_reorden INTEGER NOT NULL CHECK (punto_reorden >= 0{_tipo_entero('punto_reorden')}),
+            usuario TEXT,
+            fecha TEXT NOT NULL
+        ) WITHOUT ROWID{"," + strict if strict else ""}
+    """)
+    # Índices parciales: cada uno guarda solo las filas que pueden dar alerta,
+    # así contarlas no recorre el catálogo.
+    #  - Con punto propio: el índice tiene EXACTAMENTE los productos debajo de él.
+    #  - Sin punto propio: por departamento y cantidad, un rango por cada umbral.
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_productos_bajo_reorden
+                      ON productos(cantidad) WHERE cantidad < punto_reorden""")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_productos_reorden_departamento
+                      ON productos(departamento, cantidad) WHERE punto_reorden IS NULL""")
+
+MIGRACIONES = (
+    (1, "Tablas base y columnas de auditoría", migracion_tablas_base),
+    (2, "Índice de búsqueda FTS5", migracion_indice_busqueda),
+    (3, "Índices para filtros y joins", migracion_indices_filtros),
+    (4, "Índices para ordenar las listas", migracion_indices_orden),
+    (5, "Resumen de existencias por almacén", migracion_resumen_almacenes),
+    (6, "Historial de cambios", migracion_historial_cambios),
+    (7, "Versión de fila para ediciones concurrentes", migracion_version_filas),
+    (8, "Precio en centavos y cantidad entera", migracion_precio_centavos),
+    (9, "Claves de escrituras diferidas", migracion_escrituras_diferidas),
+    (10, "Libro de movimientos de inventario", migracion_movimientos),
+    (11, "Traspasos entre almacenes", migracion_traspasos),
+    (12, "Puntos de reorden", migracion_puntos_reorden),
+)
+
+def version_esquema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migraciones(conn, hasta=None):
+    """
+    Aplica las migraciones pendientes. Cada una corre en una transacción
+    IMMEDIATE: si otra instancia ya la aplicó mientras esperábamos el candado,
+    se salta. Al terminar corre ANALYZE para que el planificador use los índices.
+    'hasta' limita la versión destino (útil para cargar datos antes de los índices).
+    Devuelve la lista de migraciones aplicadas.
+    """
+    aplicadas = []
+    for numero, descripcion, migracion in MIGRACIONES:
+        if version_esquema(conn) >= numero or (hasta is not None and numero > hasta):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version_esquema(conn) >= numero:
+                conn.rollback()
+                continue
+            migracion(conn.cursor())
+            # PRAGMA no acepta parámetros '?'; 'numero' viene de MIGRACIONES, no del usuario
+            conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        print(f"Migración {numero} aplicada: {descripcion}")
+        aplicadas.append(numero)
+
+    if aplicadas:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return aplicadas
 
 def setup():
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
 
-    # --- 1. Crear tabla de usuarios (si no existe) ---
+    # --- 1. Migraciones del esquema (tablas, columnas, índices) ---
     try:
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            NOMBRE TEXT UNIQUE NOT NULL,
-            CONTRASEÑA TEXT NOT NULL,
-            "ULTIMO INICIO DE SESION" TEXT
-        )
-        ''')
-        print("Tabla 'usuarios' creada o ya existente.")
+        aplicadas = aplicar_migraciones(conn)
+        if not aplicadas:
+            print(f"El esquema ya está al día (versión {version_esquema(conn)}).")
     except sqlite3.Error as e:
-        print(f"Error al crear la tabla 'usuarios': {e}")
+        print(f"Error al migrar el esquema: {e}")
         conn.close()
         return
 
@@ -64,23 +701,7 @@ def setup():
     except sqlite3.Error as e:
         print(f"Error al insertar usuarios: {e}")
 
-    # --- 3. Añadir las NUEVAS columnas (de forma segura) ---
-    print("\n--- Actualizando esquema de la Base de Datos ---")
-    
-    # Añadir 'rol' a 'usuarios'
-    check_and_add_column(cursor, 'usuarios', 'rol', 'TEXT')
-    
-    # Añadir columnas de auditoría a 'productos'
-    check_and_add_column(cursor, 'productos', 'fecha_ultima_modificacion', 'TEXT')
-    check_and_add_column(cursor, 'productos', 'ultimo_usuario_en_modificar', 'TEXT')
-    
-    # Añadir columnas de auditoría a 'almacenes'
-    check_and_add_column(cursor, 'almacenes', 'fecha_ultima_modificacion', 'TEXT')
-    check_and_add_column(cursor, 'almacenes', 'ultimo_usuario_en_modificar', 'TEXT')
-    
-    print("-------------------------------------------------")
-
-    # --- 4. Asignar los ROLES a los usuarios ---
+    # --- 3. Asignar los ROLES a los usuarios ---
     try:
         cursor.execute("UPDATE usuarios SET rol = 'ADMIN' WHERE NOMBRE = 'Admin'")
         cursor.execute("UPDATE usuarios SET rol = 'PRODUCTOS' WHERE NOMBRE = 'productos'")
@@ -93,5 +714,26 @@ def setup():
         conn.close()
         print("Configuración de la base de datos completada.")
 
+def reconstruir_resumen():
+    """Comando de recuperación: python setup_database.py --reconstruir-resumen"""
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if version_esquema(conn) >= 8:
+            reconstruir_resumen_almacenes(conn.cursor())
+        else:
+            reconstruir_resumen_almacenes(conn.cursor(), precio="precio", valor="valor_total")
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM resumen_almacenes").fetchone()[0]
+        print(f"Resumen de almacenes reconstruido ({total} almacenes).")
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error al reconstruir el resumen de almacenes: {e}")
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
-    setup()
\ No newline at end of file
+    if "--reconstruir-resumen" in sys.argv[1:]:
+        reconstruir_resumen()
+    else:
+        setup()
\ No newline at end of file
@@ -0,0 +1,223 @@
+import sqlite3
+import sys
+import time
+import datetime
+import argparse
+
+from base_datos import PRAGMAS_CONEXION
+from importacion import leer_registros
+from movimientos import hacer_corte, CORTE_CADA
+
+DB_NAME = "InventarioBD_2.db"
+
+# --- Traspasos entre almacenes ---
+# Cambiar el almacén de un producto mueve la fila completa. Un traspaso mueve
+# solo una cantidad: la resta del producto en el almacén de origen y la suma
+# al producto con el mismo nombre y departamento en el destino (si no existe,
+# se crea con el precio del origen y existencia 0 antes de sumarle).
+#
+# Todo va en UNA transacción IMMEDIATE y con sentencias por conjunto sobre la
+# tabla temporal lineas_traspaso, así que miles de renglones cuestan lo mismo
+# que unas cuantas sentencias. La tabla temporal no tiene estadísticas: los
+# CROSS JOIN obligan a recorrerla a ella (miles de filas) y buscar cada
+# producto por id, en lugar de recorrer todo productos. Queda registrado en:
+#   - traspasos: encabezado (origen, destino, usuario, fecha, totales),
+#   - movimientos: un 'traspaso' negativo por producto de origen y uno positivo
+#     por producto de destino, con referencia 'traspaso <id>',
+#   - historial_cambios: lo escriben los triggers de productos, como siempre.
+
+_AUDITORIA = "fecha_ultima_modificacion = ?, ultimo_usuario_en_modificar = ?, version = version + 1"
+MAX_ERRORES_MOSTRADOS = 5
+
+
+def _lista(filas):
+    ids = ", ".join(str(f[0]) for f in filas[:MAX_ERRORES_MOSTRADOS])
+    return ids + ("..." if len(filas) > MAX_ERRORES_MOSTRADOS else "")
+
+
+def traspasar(conn, lineas, destino, usuario, fecha=None):
+    """
+    Traspasa al almacén 'destino' las cantidades de 'lineas' [(producto, cantidad), ...].
+    Una cantidad None traspasa toda la existencia del producto; un producto
+    repetido suma sus cantidades. Todos los productos deben estar en el mismo
+    almacén. Si algo no cuadra (producto inexistente, existencia insuficiente)
+    no se traspasa nada y se lanza ValueError. 'fecha' por omisión es ahora.
+
+    Devuelve un dict con traspaso (id), origen, productos, unidades, creados y segundos.
+    """
+    inicio = time.perf_counter()
+    fecha = fecha or datetime.datetime.now().isoformat()
+    try:
+        destino = int(destino)
+        lineas = [(int(producto), None if cantidad in (None, "") else int(cantidad)) for producto, cantidad in lineas]
+    except (TypeError, ValueError):
+        raise ValueError("Producto, cantidad y almacén destino deben ser enteros")
+    if any(cantidad is not None and cantidad <= 0 for _, cantidad in lineas):
+        raise ValueError("Las cantidades a traspasar deben ser mayores a cero")
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM almacenes WHERE id = ?", (destino,)).fetchone() is None:
+            raise ValueError("El almacén destino no existe")
+
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS lineas_traspaso (
+                producto INTEGER PRIMARY KEY,
+                cantidad INTEGER,
+                destino INTEGER
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_lineas_traspaso_destino ON lineas_traspaso(destino)")
+        conn.execute("DELETE FROM temp.lineas_traspaso")
+        conn.executemany("""
+            INSERT INTO temp.lineas_traspaso (producto, cantidad) VALUES (?, ?)
+            ON CONFLICT (producto) DO UPDATE SET cantidad = cantidad + excluded.cantidad
+        """, lineas)
+
+        # 1. Validación (todo por conjunto, antes de escribir nada)
+        faltantes = conn.execute("""
+            SELECT l.producto FROM temp.lineas_traspaso l
+            WHERE NOT EXISTS (SELECT 1 FROM productos p WHERE p.id = l.producto)
+        """).fetchall()
+        if faltantes:
+            raise ValueError(f"No existen los productos {_lista(faltantes)}")
+        origenes = conn.execute("""
+            SELECT DISTINCT p.almacen FROM temp.lineas_traspaso l CROSS JOIN productos p ON p.id = l.producto
+        """).fetchall()
+        if len(origenes) != 1:
+            raise ValueError("Los productos de un traspaso deben estar en el mismo almacén")
+        origen = origenes[0][0]
+        if origen == destino:
+            raise ValueError("El almacén destino es el mismo que el de origen")
+        conn.execute("""
+            UPDATE temp.lineas_traspaso
+            SET cantidad = (SELECT p.cantidad FROM productos p WHERE p.id = producto)
+            WHERE cantidad IS NULL
+        """)
+        conn.execute("DELETE FROM temp.lineas_traspaso WHERE cantidad = 0")
+        insuficientes = conn.execute("""
+            SELECT l.producto FROM temp.lineas_traspaso l CROSS JOIN productos p ON p.id = l.producto
+            WHERE p.cantidad < l.cantidad
+        """).fetchall()
+        if insuficientes:
+            raise ValueError(f"Existencia insuficiente en los productos {_lista(insuficientes)}")
+        num_productos, unidades = conn.execute(
+            "SELECT COUNT(*), IFNULL(SUM(cantidad), 0) FROM temp.lineas_traspaso").fetchone()
+        if not num_productos:
+            raise ValueError("No hay existencia que traspasar")
+
+        # 2. Productos que faltan en el destino (uno por nombre y departamento)
+        creados = conn.execute("""
+            INSERT INTO productos (nombre, precio_centavos, cantidad, departamento, almacen,
+                                   fecha_ultima_modificacion, ultimo_usuario_en_modificar)
+            SELECT p.nombre, MAX(p.precio_centavos), 0, p.departamento, ?, ?, ?
+            FROM temp.lineas_traspaso l CROSS JOIN productos p ON p.id = l.producto
+            WHERE NOT EXISTS (SELECT 1 FROM productos d
+                              WHERE d.nombre = p.nombre AND d.departamento = p.departamento AND d.almacen = ?)
+            GROUP BY p.nombre, p.departamento
+        """, (destino, fecha, usuario, destino)).rowcount
+        conn.execute("""
+            UPDATE temp.lineas_traspaso
+            SET destino = (SELECT MIN(d.id) FROM productos p JOIN productos d
+                           ON d.nombre = p.nombre AND d.departamento = p.departamento AND d.almacen = ?
+                           WHERE p.id = producto)
+        """, (destino,))
+
+        # 3. Encabezado y renglones en el libro de movimientos
+        traspaso = conn.execute(
+            "INSERT INTO traspasos (origen, destino, productos, unidades, usuario, fecha) VALUES (?, ?, ?, ?, ?, ?)",
+            (origen, destino, num_productos, unidades, usuario, fecha)).lastrowid
+        referencia = f"traspaso {traspaso}"
+        conn.execute("""
+            INSERT INTO movimientos (producto, tipo, cantidad, referencia, usuario, fecha)
+            SELECT producto, 'traspaso', -cantidad, ?, ?, ? FROM temp.lineas_traspaso
+            UNION ALL
+            SELECT destino, 'traspaso', SUM(cantidad), ?, ?, ? FROM temp.lineas_traspaso GROUP BY destino
+        """, (referencia, usuario, fecha) * 2)
+
+        # 4. Existencias (los triggers no vuelven a anotar esto como ajuste)
+        conn.execute("INSERT INTO movimiento_en_curso (id) VALUES (1)")
+        conn.execute(f"""
+            UPDATE productos SET
+                cantidad = cantidad - (SELECT l.cantidad FROM temp.lineas_traspaso l WHERE l.producto = productos.id),
+                {_AUDITORIA}
+            WHERE id IN (SELECT producto FROM temp.lineas_traspaso)
+        """, (fecha, usuario))
+        conn.execute(f"""
+            UPDATE productos SET
+                cantidad = cantidad + (SELECT SUM(l.cantidad) FROM temp.lineas_traspaso l WHERE l.destino = productos.id),
+                {_AUDITORIA}
+            WHERE id IN (SELECT destino FROM temp.lineas_traspaso)
+        """, (fecha, usuario))
+        conn.execute("DELETE FROM movimiento_en_curso")
+
+        tocados = conn.execute("""
+            SELECT producto FROM temp.lineas_traspaso UNION SELECT destino FROM temp.lineas_traspaso
+        """).fetchall()
+        for (producto,) in tocados:
+            hacer_corte(conn, producto, minimo=CORTE_CADA, fecha=fecha)
+        conn.execute("DELETE FROM temp.lineas_traspaso")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    return {"traspaso": traspaso, "origen": origen, "productos": num_productos, "unidades": unidades,
+            "creados": creados, "segundos": time.perf_counter() - inicio}
+
+
+def leer_lineas(ruta, formato=None):
+    """
+    Renglones de un archivo de traspaso (CSV o JSON Lines) con las columnas
+    'producto' (id) y 'cantidad' (vacía: toda la existencia).
+    """
+    lineas = []
+    for numero, registro in leer_registros(ruta, formato):
+        if isinstance(registro, ValueError):
+            raise ValueError(f"Línea {numero}: {registro}")
+        if not isinstance(registro, dict):
+            raise ValueError(f"Línea {numero}: se esperaba un objeto JSON")
+        producto = str(registro.get("producto") or "").strip()
+        cantidad = str(registro.get("cantidad") or "").strip()
+        if not producto.isdigit() or (cantidad and not cantidad.isdigit()):
+            raise ValueError(f"Línea {numero}: 'producto' y 'cantidad' deben ser enteros")
+        lineas.append((int(producto), int(cantidad) if cantidad else None))
+    return lineas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traspasa existencias a otro almacén desde un CSV o JSON Lines "
+                                                 "con las columnas producto y cantidad.")
+    parser.add_argument("archivo")
+    parser.add_argument("--destino", required=True, help="Nombre o id del almacén destino")
+    parser.add_argument("--usuario", required=True, help="Usuario que se registra en la auditoría")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--formato", choices=("csv", "jsonl"))
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    try:
+        destino = args.destino
+        if not destino.isdigit():
+            fila = conn.execute("SELECT id FROM almacenes WHERE nombre = ?", (destino,)).fetchone()
+            if fila is None:
+                print(f"ERROR: no existe el almacén '{destino}'")
+                return 1
+            destino = fila[0]
+        try:
+            r = traspasar(conn, leer_lineas(args.archivo, args.formato), destino, args.usuario)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return 1
+    finally:
+        conn.close()
+
+    print(f"Traspaso {r['traspaso']}: {r['unidades']} unidades de {r['productos']} productos "
+          f"({r['creados']} creados en el destino) en {r['segundos']:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
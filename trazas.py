@@ -0,0 +1,308 @@
+import sqlite3
+import threading
+import time
+import re
+import datetime
+import logging
+import logging.handlers
+from collections import deque
+
+# --- Configuración ---
+UMBRAL_LENTO_MS = 100          # A partir de aquí la consulta va al log de lentas
+LIMITES_HISTOGRAMA_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)   # El último grupo es ">= 1 s"
+MUESTRAS_POR_TIPO = 1000       # Tiempos recientes que se guardan para calcular percentiles
+
+_ESPACIOS = re.compile(r"\s+")
+_TABLA = re.compile(r"(?:\bFROM|\bINTO|^UPDATE(?: OR \w+)?)\s+(\w+)", re.IGNORECASE)
+
+
+def normalizar_sql(sql):
+    return _ESPACIOS.sub(" ", sql).strip()
+
+
+def tipo_consulta(sql):
+    """Agrupa sentencias parecidas: "SELECT productos", "UPDATE almacenes", "SELECT productos (FTS)"..."""
+    texto = normalizar_sql(sql)
+    verbo = texto.split(" ", 1)[0].upper() or "?"
+    tabla = _TABLA.search(texto)
+    tipo = f"{verbo} {tabla.group(1)}" if tabla else verbo
+    if " MATCH " in texto.upper():
+        tipo += " (FTS)"
+    return tipo
+
+
+def redactar(parametros):
+    """Oculta el texto de los parámetros (nombres, contraseñas...); los números se conservan."""
+    def ocultar(valor):
+        if valor is None or isinstance(valor, (int, float)):
+            return valor
+        if isinstance(valor, (bytes, bytearray, memoryview)):
+            return f"<bytes {len(valor)}>"
+        return f"<texto {len(str(valor))}>"
+
+    if isinstance(parametros, dict):
+        return {k: ocultar(v) for k, v in parametros.items()}
+    return [ocultar(v) for v in parametros or ()]
+
+
+class Medicion:
+    """Tiempo y filas de una sentencia, desde execute() hasta que se terminan de leer sus filas."""
+
+    __slots__ = ("sql", "parametros", "pagina", "segundos", "filas", "en_lote")
+
+    def __init__(self, sql, parametros, pagina, en_lote=False):
+        self.sql = sql
+        self.parametros = parametros
+        self.pagina = pagina
+        self.segundos = 0.0
+        self.filas = 0
+        self.en_lote = en_lote
+
+
+class EstadisticaTipo:
+    def __init__(self):
+        self.llamadas = 0
+        self.filas = 0
+        self.segundos = 0.0
+        self.maximo = 0.0
+        self.histograma = [0] * (len(LIMITES_HISTOGRAMA_MS) + 1)
+        self.muestras = deque(maxlen=MUESTRAS_POR_TIPO)
+
+    def agregar(self, segundos, filas):
+        ms = segundos * 1000
+        self.llamadas += 1
+        self.filas += filas
+        self.segundos += segundos
+        self.maximo = max(self.maximo, ms)
+        grupo = len(LIMITES_HISTOGRAMA_MS)
+        for i, limite in enumerate(LIMITES_HISTOGRAMA_MS):
+            if ms < limite:
+                grupo = i
+                break
+        self.histograma[grupo] += 1
+        self.muestras.append(ms)
+
+    def percentil(self, p):
+        ordenadas = sorted(self.muestras)
+        if not ordenadas:
+            return 0.0
+        return ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))]
+
+
+class RegistroConsultas:
+    """
+    Recibe la medición de cada sentencia que pasa por una ConexionInstrumentada.
+
+    - Acumula por tipo de consulta: llamadas, filas, histograma de latencia.
+    - Las que tardan más de 'umbral_ms' se escriben en un log rotativo junto
+      con su EXPLAIN QUERY PLAN (los parámetros siempre van redactados).
+    - 'pagina_actual' la actualiza App al cambiar de pantalla; las tareas del
+      ejecutor llevan la página que las envió.
+    """
+
+    def __init__(self, umbral_ms=UMBRAL_LENTO_MS, ruta_log=None, tam_max_log=1_000_000, copias_log=3,
+                 max_lentas=200):
+        self.umbral_ms = umbral_ms
+        self.pagina_actual = None
+        self._lock = threading.Lock()
+        self._tipos = {}
+        self._lentas = deque(maxlen=max_lentas)
+
+        self._log = None
+        if ruta_log:
+            self._log = logging.getLogger(f"consultas_lentas.{id(self)}")
+            self._log.setLevel(logging.INFO)
+            self._log.propagate = False
+            manejador = logging.handlers.RotatingFileHandler(ruta_log, maxBytes=tam_max_log,
+                                                             backupCount=copias_log, encoding="utf-8")
+            manejador.setFormatter(logging.Formatter("%(message)s"))
+            self._log.addHandler(manejador)
+
+    def es_lenta(self, segundos):
+        return segundos * 1000 >= self.umbral_ms
+
+    def registrar(self, medicion, plan=None):
+        tipo = tipo_consulta(medicion.sql)
+        with self._lock:
+            estadistica = self._tipos.get(tipo)
+            if estadistica is None:
+                estadistica = self._tipos[tipo] = EstadisticaTipo()
+            estadistica.agregar(medicion.segundos, medicion.filas)
+
+            if not self.es_lenta(medicion.segundos):
+                return
+            entrada = {
+                "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+                "ms": medicion.segundos * 1000,
+                "pagina": medicion.pagina or "-",
+                "filas": medicion.filas,
+                "tipo": tipo,
+                "sql": normalizar_sql(medicion.sql),
+                "parametros": redactar(medicion.parametros) if not medicion.en_lote else "<lote>",
+                "plan": plan or [],
+            }
+            self._lentas.append(entrada)
+
+        if self._log is not None:
+            lineas = [f"[{entrada['fecha']}] {entrada['ms']:.1f} ms | {entrada['pagina']} | {entrada['filas']} filas",
+                      f"  SQL: {entrada['sql']}",
+                      f"  Parámetros: {entrada['parametros']}"]
+            lineas += [f"  PLAN: {paso}" for paso in entrada["plan"]]
+            self._log.info("\n".join(lineas))
+
+    def resumen(self):
+        """Una fila por tipo de consulta, ordenadas por tiempo total."""
+        with self._lock:
+            filas = []
+            for tipo, e in self._tipos.items():
+                filas.append({
+                    "tipo": tipo,
+                    "llamadas": e.llamadas,
+                    "filas": e.filas,
+                    "total_ms": e.segundos * 1000,
+                    "p50_ms": e.percentil(50),
+                    "p95_ms": e.percentil(95),
+                    "max_ms": e.maximo,
+                    "histograma": list(e.histograma),
+                })
+        filas.sort(key=lambda f: f["total_ms"], reverse=True)
+        return filas
+
+    def lentas(self):
+        with self._lock:
+            return list(self._lentas)
+
+    def reiniciar(self):
+        with self._lock:
+            self._tipos.clear()
+            self._lentas.clear()
+
+
+def plan_de_consulta(conn, sql, parametros):
+    """Líneas del EXPLAIN QUERY PLAN (sin pasar por la instrumentación)."""
+    try:
+        cursor = sqlite3.Cursor(conn)
+        filas = sqlite3.Cursor.execute(cursor, f"EXPLAIN QUERY PLAN {sql}", parametros).fetchall()
+    except sqlite3.Error as e:
+        return [f"(sin plan: {e})"]
+    return [detalle for _, _, _, detalle in filas]
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Mide cada execute() más la lectura de sus filas, y lo reporta al terminar."""
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._medicion = None
+
+    def _iniciar(self, sql, parametros, en_lote=False):
+        self._terminar()
+        self._medicion = Medicion(sql, parametros, self.connection.pagina_actual(), en_lote)
+
+    def _medir(self, metodo, *args):
+        medicion = self._medicion
+        inicio = time.perf_counter()
+        try:
+            return metodo(self, *args)
+        finally:
+            if medicion is not None:
+                medicion.segundos += time.perf_counter() - inicio
+
+    def _terminar(self):
+        medicion, self._medicion = self._medicion, None
+        if medicion is None:
+            return
+        if medicion.filas == 0 and self.rowcount > 0:
+            medicion.filas = self.rowcount   # INSERT / UPDATE / DELETE
+        registro = self.connection.registro
+        plan = None
+        if registro.es_lenta(medicion.segundos) and not medicion.en_lote:
+            plan = plan_de_consulta(self.connection, medicion.sql, medicion.parametros)
+        registro.registrar(medicion, plan)
+
+    def execute(self, sql, parametros=()):
+        self._iniciar(sql, parametros)
+        try:
+            self._medir(sqlite3.Cursor.execute, sql, parametros)
+        except Exception:
+            self._terminar()
+            raise
+        if self.description is None:
+            self._terminar()   # No devuelve filas: ya terminó
+        return self
+
+    def executemany(self, sql, secuencia):
+        self._iniciar(sql, None, en_lote=True)
+        try:
+            self._medir(sqlite3.Cursor.executemany, sql, secuencia)
+        finally:
+            self._terminar()
+        return self
+
+    def fetchone(self):
+        fila = self._medir(sqlite3.Cursor.fetchone)
+        if fila is None:
+            self._terminar()
+        elif self._medicion is not None:
+            self._medicion.filas += 1
+        return fila
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        filas = self._medir(sqlite3.Cursor.fetchmany, size)
+        if self._medicion is not None:
+            self._medicion.filas += len(filas)
+        if len(filas) < size:
+            self._terminar()
+        return filas
+
+    def fetchall(self):
+        filas = self._medir(sqlite3.Cursor.fetchall)
+        if self._medicion is not None:
+            self._medicion.filas += len(filas)
+        self._terminar()
+        return filas
+
+    def __next__(self):
+        try:
+            fila = self._medir(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._terminar()
+            raise
+        if self._medicion is not None:
+            self._medicion.filas += 1
+        return fila
+
+    def close(self):
+        self._terminar()
+        super().close()
+
+    def __del__(self):
+        # Cursores de los que solo se leyó un fetchone()
+        try:
+            self._terminar()
+        except Exception:
+            pass
+
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """
+    Conexión cuyos cursores reportan cada sentencia a 'registro'.
+    Se crea con sqlite3.connect(..., factory=ConexionInstrumentada) y después
+    se le asigna 'registro'.
+    """
+
+    registro = None
+    pagina = None   # La pone el ejecutor mientras corre una tarea
+
+    def pagina_actual(self):
+        return self.pagina or self.registro.pagina_actual
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, secuencia):
+        return self.cursor().executemany(sql, secuencia)